@@ -0,0 +1,379 @@
+# analyze_module.py
+"""
+Per-texture compression format recommendations.
+
+A texture is analysed with whole-array NumPy operations: how it uses alpha
+(none, 1-bit cut-outs or smooth), the colour variance of each 4x4 block, and
+the error block compression would introduce. The error is measured by actually
+encoding the blocks with a range fit encoder (endpoints at the extremes of
+each block's principal colour axis, 5:6:5 quantized, nearest palette entry per
+texel) and decoding them again, so it is what encode_bc produces rather than
+what a slower exhaustive compressor could reach.
+
+From that, recommend_format picks DXT1, DXT5 or uncompressed BGRA, and
+analyze_file adds the bytes the change would save. Files are analysed across
+a process pool.
+"""
+import io
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from ctxr_utils import read_ctxr
+from layout_module import get_layout, BLOCK_SIZES
+
+
+ANALYZE_EXTENSIONS = ('.ctxr', '.png', '.tga', '.dds')
+# Blocks encoded per NumPy pass (bounds the temporary arrays to a few tens of MB)
+ENCODE_CHUNK_BLOCKS = 16384
+# Larger textures are analysed on an evenly spread sample of this many blocks (a 2048x2048 level)
+ANALYZE_BLOCKS = 262144
+# Share of partially transparent texels a texture can have and still count as 1-bit alpha
+ALPHA_1BIT_TOLERANCE = 0.002
+DXT1_ALPHA_THRESHOLD = 128
+# Blocks that aren't flat but whose mean per-channel colour variance is below this hold
+# gradients rather than detail. A gradient block is banded (its steps become visible) when
+# its compression MSE exceeds both GRADIENT_ERROR_RATIO of its variance and GRADIENT_MIN_MSE
+GRADIENT_MAX_VARIANCE = 64.0
+GRADIENT_ERROR_RATIO = 0.25
+GRADIENT_MIN_MSE = 3.0
+# Limits a block compressed format must stay within to be recommended
+DEFAULT_MIN_PSNR = 36.0
+DEFAULT_MAX_GRADIENT_DAMAGE = 0.15
+
+
+def image_blocks(rgba):
+    """(N, 16, 4) array of the 4x4 blocks of an (H, W, 4) array, row by row; edges are padded by repetition"""
+    import numpy as np
+
+    height, width = rgba.shape[:2]
+    padded_h, padded_w = -(-height // 4) * 4, -(-width // 4) * 4
+    if (padded_h, padded_w) != (height, width):
+        rgba = np.pad(rgba, ((0, padded_h - height), (0, padded_w - width), (0, 0)), mode="edge")
+    return rgba.reshape(padded_h // 4, 4, padded_w // 4, 4, 4).swapaxes(1, 2).reshape(-1, 16, 4)
+
+
+def blocks_image(blocks, width, height):
+    """Inverse of image_blocks: an (height, width, 4) array"""
+    rows, cols = -(-height // 4), -(-width // 4)
+    image = blocks.reshape(rows, cols, 4, 4, 4).swapaxes(1, 2).reshape(rows * 4, cols * 4, 4)
+    return image[:height, :width]
+
+
+def _expand_565(packed):
+    """(N,) 5:6:5 colours to (N, 3) 8-bit RGB, replicating the high bits like decoders do"""
+    import numpy as np
+
+    r, g, b = (packed >> 11) & 31, (packed >> 5) & 63, packed & 31
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1).astype(np.int32)
+
+
+def _colour_endpoints(rgb, weights):
+    """
+    Range fit endpoints of (N, 16, 3) float blocks: the extremes of the texels
+    (those with weight 1) along the principal axis of their colours, as (N,)
+    5:6:5 values.
+    """
+    import numpy as np
+
+    count = np.maximum(weights.sum(axis=1, keepdims=True), 1)
+    mean = (rgb * weights[..., None]).sum(axis=1, keepdims=True) / count[..., None]
+    centered = (rgb - mean) * weights[..., None]
+    cov = centered.transpose(0, 2, 1) @ centered
+    # Power iteration from the covariance row of the widest channel, which is never orthogonal to the axis
+    widest = np.argmax(np.diagonal(cov, axis1=1, axis2=2), axis=1)
+    axis = cov[np.arange(len(cov)), widest]
+    for _ in range(4):
+        axis = (cov @ axis[..., None])[..., 0]
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+    t = ((rgb - mean) @ axis[..., None])[..., 0]
+    t_min = np.where(weights > 0, t, np.inf).min(axis=1)
+    t_max = np.where(weights > 0, t, -np.inf).max(axis=1)
+    t_min, t_max = np.where(np.isfinite(t_min), t_min, 0), np.where(np.isfinite(t_max), t_max, 0)
+
+    def quantize(t):
+        colour = np.clip(mean[:, 0] + t[:, None] * axis, 0, 255)
+        r, g, b = (np.rint(colour * [31 / 255, 63 / 255, 31 / 255]).astype(np.uint32)).T
+        return (r << 11) | (g << 5) | b
+
+    return quantize(t_max), quantize(t_min)
+
+
+def _encode_colour(blocks, punch_through):
+    """
+    BC1 colour blocks for (N, 16, 4) uint8 RGBA blocks: ((N, 8) uint8 data,
+    (N, 16, 4) decoded RGBA). With punch_through, blocks with texels below the
+    DXT1 alpha threshold use the 3 colour + transparent mode; otherwise every
+    block uses 4 colours and alpha decodes as 255.
+    """
+    import numpy as np
+
+    n = len(blocks)
+    rgb = blocks[..., :3].astype(np.float32)
+    transparent = blocks[..., 3] < DXT1_ALPHA_THRESHOLD if punch_through else np.zeros((n, 16), dtype=bool)
+    three_colour = transparent.any(axis=1)
+    colour0, colour1 = _colour_endpoints(rgb, (~transparent).astype(np.float32))
+
+    # 4 colour mode needs colour0 > colour1, 3 colour mode colour0 <= colour1
+    swap = np.where(three_colour, colour0 > colour1, colour0 < colour1)
+    colour0, colour1 = np.where(swap, colour1, colour0), np.where(swap, colour0, colour1)
+    c0, c1 = _expand_565(colour0), _expand_565(colour1)
+    palette = np.stack([c0, c1, (2 * c0 + c1) // 3, (c0 + 2 * c1) // 3], axis=1)
+    palette[three_colour, 2] = (c0[three_colour] + c1[three_colour]) // 2
+
+    # |texel - entry|^2 without the |texel|^2 term, which is the same for every entry
+    entries = palette.astype(np.float32)
+    distance = (entries ** 2).sum(axis=-1)[:, None, :] - 2 * (rgb @ entries.transpose(0, 2, 1))
+    distance[three_colour, :, 3] = np.inf
+    indices = np.argmin(distance, axis=2)
+    # Equal endpoints decode in 3 colour mode, whose index 3 is transparent black
+    indices[colour0 == colour1] = 0
+    indices[transparent] = 3
+
+    decoded = np.empty((n, 16, 4), dtype=np.uint8)
+    decoded[..., :3] = np.take_along_axis(palette, indices[..., None], axis=1)
+    decoded[..., 3] = 255
+    decoded[transparent] = 0
+
+    data = np.empty((n, 8), dtype=np.uint8)
+    data[:, 0:2] = colour0.astype('<u2').view(np.uint8).reshape(n, 2)
+    data[:, 2:4] = colour1.astype('<u2').view(np.uint8).reshape(n, 2)
+    bits = (indices.astype(np.uint64) << (2 * np.arange(16, dtype=np.uint64))).sum(axis=1)
+    data[:, 4:8] = bits.astype('<u4').view(np.uint8).reshape(n, 4)
+    return data, decoded
+
+
+def _encode_alpha(alpha):
+    """BC3 alpha blocks for (N, 16) uint8 alpha: ((N, 8) uint8 data, (N, 16) decoded alpha)"""
+    import numpy as np
+
+    n = len(alpha)
+    alpha0 = alpha.max(axis=1).astype(np.int32)
+    alpha1 = alpha.min(axis=1).astype(np.int32)
+    steps = np.arange(1, 7)
+    palette = np.empty((n, 8), dtype=np.int32)
+    palette[:, 0], palette[:, 1] = alpha0, alpha1
+    palette[:, 2:] = ((7 - steps) * alpha0[:, None] + steps * alpha1[:, None]) // 7
+    indices = np.argmin(np.abs(alpha[:, :, None].astype(np.int32) - palette[:, None, :]), axis=2)
+    # alpha0 == alpha1 selects the 6 step mode; index 0 is still alpha0
+    indices[alpha0 == alpha1] = 0
+
+    data = np.empty((n, 8), dtype=np.uint8)
+    data[:, 0], data[:, 1] = alpha0, alpha1
+    bits = (indices.astype(np.uint64) << (3 * np.arange(16, dtype=np.uint64))).sum(axis=1)
+    data[:, 2:8] = bits.astype('<u8').view(np.uint8).reshape(n, 8)[:, :6]
+    return data, np.take_along_axis(palette, indices, axis=1).astype(np.uint8)
+
+
+def encode_blocks(blocks, fmt):
+    """Compress (N, 16, 4) RGBA blocks to fmt ("DXT1" or "DXT5"): ((N, block bytes) data, decoded blocks)"""
+    import numpy as np
+
+    if fmt not in BLOCK_SIZES:
+        raise ValueError(f"{fmt} is not a block compressed format")
+    datas, decodeds = [], []
+    for start in range(0, len(blocks), ENCODE_CHUNK_BLOCKS):
+        chunk = blocks[start:start + ENCODE_CHUNK_BLOCKS]
+        colour, decoded = _encode_colour(chunk, punch_through=(fmt == "DXT1"))
+        if fmt == "DXT5":
+            alpha, decoded[..., 3] = _encode_alpha(chunk[..., 3])
+            colour = np.concatenate([alpha, colour], axis=1)
+        datas.append(colour)
+        decodeds.append(decoded)
+    if not datas:
+        return np.empty((0, BLOCK_SIZES[fmt]), dtype=np.uint8), np.empty((0, 16, 4), dtype=np.uint8)
+    return np.concatenate(datas), np.concatenate(decodeds)
+
+
+def encode_bc(rgba, fmt):
+    """Compress an (H, W, 4) RGBA array to fmt; returns the level's bytes"""
+    data, _ = encode_blocks(image_blocks(rgba), fmt)
+    return data.tobytes()
+
+
+def encode_image_levels(image, fmt, mipmap_count, name=""):
+    """
+    Compressed bytes of every level of a PIL image: the image itself and
+    mipmap_count - 1 Lanczos downscaled levels (as for uncompressed imports).
+    A warning is logged if the main level loses too much to the compression.
+    """
+    import numpy as np
+    from convert_module import generate_mipmaps
+
+    levels = []
+    for level in generate_mipmaps(image, mipmap_count):
+        blocks = image_blocks(np.asarray(level.convert("RGBA")))
+        data, decoded = encode_blocks(blocks, fmt)
+        if not levels:
+            error = measure_error(blocks, decoded)
+            if error["psnr"] < DEFAULT_MIN_PSNR or error["gradient_damage"] > DEFAULT_MAX_GRADIENT_DAMAGE:
+                logging.warning(f"{name or 'Image'}: {fmt} compression loses detail (PSNR {error['psnr']:.1f} dB, "
+                                f"gradients banded in {error['gradient_damage']:.0%} of blocks)")
+        levels.append(data.tobytes())
+    return levels
+
+
+def alpha_usage(alpha):
+    """Classify alpha as "none" (all opaque), "1bit" (cut-outs: nearly all texels 0 or 255) or "smooth" """
+    import numpy as np
+
+    if alpha.min() == 255:
+        return "none"
+    partial = np.count_nonzero((alpha > 0) & (alpha < 255))
+    return "1bit" if partial <= ALPHA_1BIT_TOLERANCE * alpha.size else "smooth"
+
+
+def measure_error(blocks, decoded):
+    """
+    Error of (N, 16, 4) decoded blocks against the original blocks: a dict
+    with "psnr" over every channel (as metrics_module.psnr), "rgb_rmse",
+    "alpha_rmse" and "gradient_damage", the share of all blocks that are
+    gradients banded by the compression. The colour of fully transparent
+    texels is not counted.
+    """
+    import numpy as np
+    from metrics_module import psnr
+
+    decoded = decoded.copy()
+    hidden = blocks[..., 3] == 0
+    decoded[..., :3][hidden] = blocks[..., :3][hidden]
+    squared = (blocks.astype(np.float32) - decoded) ** 2
+    colour_variance = blocks[..., :3].astype(np.float32).var(axis=1).mean(axis=1)
+    gradient = (colour_variance > 0) & (colour_variance < GRADIENT_MAX_VARIANCE)
+    block_mse = squared[..., :3].mean(axis=(1, 2))
+    limit = np.maximum(GRADIENT_ERROR_RATIO * colour_variance[gradient], GRADIENT_MIN_MSE)
+    damaged = np.count_nonzero(block_mse[gradient] > limit)
+    return {
+        "psnr": psnr(blocks, decoded),
+        "rgb_rmse": float(np.sqrt(squared[..., :3].mean())),
+        "alpha_rmse": float(np.sqrt(squared[..., 3].mean())),
+        "gradient_damage": int(damaged) / max(1, len(blocks)),
+    }
+
+
+def block_error(blocks, fmt):
+    """measure_error of compressing (N, 16, 4) RGBA blocks to fmt"""
+    return measure_error(blocks, encode_blocks(blocks, fmt)[1])
+
+
+def candidate_formats(alpha):
+    """Block formats worth trying for an alpha usage, cheapest first"""
+    return {"none": ("DXT1",), "1bit": ("DXT1", "DXT5"), "smooth": ("DXT5",)}[alpha]
+
+
+def analyze_pixels(rgba, max_blocks=ANALYZE_BLOCKS):
+    """
+    Analyse an (H, W, 4) RGBA array. Returns a dict with "width", "height",
+    "alpha" (see alpha_usage), "block_variance" (mean of the per-block colour
+    variance), "flat_blocks" and "gradient_blocks" (shares of blocks), and
+    "errors", a block_error dict per candidate format. Above max_blocks blocks
+    an evenly spread sample is measured.
+    """
+    import numpy as np
+
+    height, width = rgba.shape[:2]
+    blocks = image_blocks(rgba)
+    if len(blocks) > max_blocks:
+        blocks = blocks[np.linspace(0, len(blocks) - 1, max_blocks).astype(np.intp)]
+    variance = blocks[..., :3].astype(np.float32).var(axis=1).mean(axis=1)
+    alpha = alpha_usage(rgba[..., 3])
+    return {
+        "width": width,
+        "height": height,
+        "alpha": alpha,
+        "block_variance": float(variance.mean()) if len(variance) else 0.0,
+        "flat_blocks": float((variance == 0).mean()) if len(variance) else 1.0,
+        "gradient_blocks": float(((variance > 0) & (variance < GRADIENT_MAX_VARIANCE)).mean())
+        if len(variance) else 0.0,
+        "errors": {fmt: block_error(blocks, fmt) for fmt in candidate_formats(alpha)},
+    }
+
+
+def recommend_format(analysis, min_psnr=DEFAULT_MIN_PSNR, max_gradient_damage=DEFAULT_MAX_GRADIENT_DAMAGE):
+    """
+    (format, reason) for an analyze_pixels result: the first candidate block
+    format within the limits, else BGRA. Dimensions that are not multiples of
+    4 stay BGRA (partial blocks would be filled with repeated edge texels).
+    """
+    if analysis["width"] % 4 or analysis["height"] % 4:
+        return "BGRA", f"{analysis['width']}x{analysis['height']} is not made of whole 4x4 blocks"
+    problems = []
+    for fmt, error in analysis["errors"].items():
+        if error["psnr"] < min_psnr:
+            problems.append(f"{fmt} PSNR {error['psnr']:.1f} dB")
+        elif error["gradient_damage"] > max_gradient_damage:
+            problems.append(f"{fmt} bands gradients in {error['gradient_damage']:.0%} of blocks")
+        else:
+            return fmt, f"alpha {analysis['alpha']}, {fmt} PSNR {error['psnr']:.1f} dB"
+    return "BGRA", f"alpha {analysis['alpha']}, " + ", ".join(problems)
+
+
+def _load_pixels(path):
+    """(main level RGBA array, current format, mipmap count) of a CTXR or PNG/TGA/DDS image"""
+    import numpy as np
+    from PIL import Image
+
+    if path.lower().endswith(".ctxr"):
+        from metrics_module import decode_levels
+        with open(path, 'rb') as f:
+            ctxr = read_ctxr(f, os.path.basename(path))
+        main = dict(ctxr, mipmap_count=1, mipmap_info=[])
+        return decode_levels(main)[0], "DXT5" if ctxr["is_dxt5"] else "BGRA", max(1, ctxr["mipmap_count"])
+    if path.lower().endswith(".dds"):
+        from dds_module import parse_dds_header
+        with open(path, 'rb') as f:
+            data = f.read()
+        dds = parse_dds_header(data)
+        fmt = "BGRA" if dds["format"] == "RGBA" else dds["format"]
+        return np.asarray(Image.open(io.BytesIO(data)).convert("RGBA")), fmt, max(1, dds["mipmap_count"])
+    if path.lower().endswith(".tga"):
+        from tga_module import tga_to_image
+        image = tga_to_image(path)
+    else:
+        image = Image.open(path)
+    return np.asarray(image.convert("RGBA")), "BGRA", 1
+
+
+def analyze_file(path, min_psnr=DEFAULT_MIN_PSNR, max_gradient_damage=DEFAULT_MAX_GRADIENT_DAMAGE):
+    """
+    Analyse one texture and recommend a format. Returns a dict with "path",
+    "analysis", "format" (current), "recommended", "reason", "size" and
+    "recommended_size" (bytes of every mip level in each format), or "error".
+    """
+    result = {"path": path}
+    try:
+        rgba, fmt, mipmap_count = _load_pixels(path)
+        analysis = analyze_pixels(rgba)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    recommended, reason = recommend_format(analysis, min_psnr, max_gradient_damage)
+    width, height = analysis["width"], analysis["height"]
+    result.update(analysis=analysis, format=fmt, recommended=recommended, reason=reason,
+                  size=get_layout(fmt, width, height, mipmap_count).dds_size,
+                  recommended_size=get_layout(recommended, width, height, mipmap_count).dds_size)
+    return result
+
+
+def analyze_files(paths, workers=None, min_psnr=DEFAULT_MIN_PSNR, max_gradient_damage=DEFAULT_MAX_GRADIENT_DAMAGE):
+    """Analyse textures across a process pool, yielding analyze_file results in order"""
+    paths = list(paths)
+    logging.info(f"Analysing {len(paths)} textures")
+    if workers == 1:
+        for path in paths:
+            yield analyze_file(path, min_psnr, max_gradient_damage)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 8))
+        yield from executor.map(analyze_file, paths, [min_psnr] * len(paths), [max_gradient_damage] * len(paths),
+                                chunksize=chunksize)
+
+
+def format_analysis(result):
+    """One line for an analyze_file result"""
+    if "error" in result:
+        return f"{result['path']}: error ({result['error']})"
+    saved = result["size"] - result["recommended_size"]
+    change = f"{result['format']} -> {result['recommended']}" if result["recommended"] != result["format"] \
+        else f"keep {result['format']}"
+    return (f"{result['path']}: {change} ({result['reason']}), {result['size'] / 1e6:.2f} MB -> "
+            f"{result['recommended_size'] / 1e6:.2f} MB ({saved / 1e6:+.2f} MB saved)")
@@ -0,0 +1,165 @@
+# benchmark.py
+"""Benchmarks for the CTXR converter. Run: python benchmark.py [startup] [rates]"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+module_dir = os.path.dirname(os.path.abspath(__file__))
+
+# What launching the converter used to import before anything was used
+LEGACY_STARTUP_IMPORTS = "import tkinter, tkinter.ttk, numpy, PIL.Image, PIL.ImageTk"
+
+
+def measure_import_time(command_args, repeat=5):
+    """
+    Run a Python command with -X importtime and return (import_seconds, wall_seconds),
+    each the best of repeat runs. import_seconds is the sum of every module's self time.
+    """
+    best_import = best_wall = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + command_args,
+                              cwd=module_dir, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if proc.returncode not in (0, 1):
+            raise RuntimeError(f"Benchmark command failed: {proc.stderr.strip()}")
+        total_us = 0
+        for line in proc.stderr.splitlines():
+            # "import time:      self [us] | cumulative | imported package"
+            if line.startswith("import time:") and "|" in line:
+                self_us = line.split(":", 1)[1].split("|")[0].strip()
+                if self_us.isdigit():
+                    total_us += int(self_us)
+        import_s = total_us / 1e6
+        best_import = import_s if best_import is None else min(best_import, import_s)
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+    return best_import, best_wall
+
+
+def bench_startup(repeat=5):
+    """Compare CLI 'info' startup against the converter's legacy startup imports"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = os.path.join(tmp, "sample.ctxr")
+        header = bytearray(132)
+        header[8:12] = (256).to_bytes(2, 'big') + (256).to_bytes(2, 'big')
+        with open(sample, 'wb') as f:
+            f.write(header)
+
+        results = [
+            ("CLI info", measure_import_time(["ctxr_cli.py", "info", sample], repeat)),
+            ("GUI module import", measure_import_time(["-c", "import ctxr3"], repeat)),
+            ("legacy startup imports", measure_import_time(["-c", LEGACY_STARTUP_IMPORTS], repeat)),
+        ]
+
+    print(f"{'startup':<24}{'imports':>12}{'wall':>12}")
+    for name, (import_s, wall_s) in results:
+        print(f"{name:<24}{import_s * 1000:>10.1f}ms{wall_s * 1000:>10.1f}ms")
+    cli_import, legacy_import = results[0][1][0], results[2][1][0]
+    if legacy_import:
+        print(f"CLI info imports take {cli_import / legacy_import:.1%} of the legacy startup import time")
+    return results
+
+
+def _best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_rates(repeat=5, size=1024, mipmap_count=4):
+    """Time each conversion per megapixel on a synthetic texture and save the rates the batch planner uses"""
+    import io
+    import numpy as np
+    sys.path.insert(0, module_dir)
+    from ctxr_utils import read_ctxr, build_ctxr, DXT5_FILES
+    from convert_module import ctxr_to_image, ctxr_to_dds_bytes, image_to_ctxr
+    from export_module import ENCODERS
+    from layout_module import get_layout, CTXR_FINAL_PADDING
+    from plan_module import save_rates, DEFAULT_RATES_PATH
+
+    # A smooth gradient with some noise, so RLE and PNG see realistic runs
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    pixels = np.empty((size, size, 4), dtype=np.uint8)
+    pixels[..., 0] = ramp[None, :]
+    pixels[..., 1] = ramp[:, None]
+    pixels[..., 2] = (ramp[None, :] + ramp[:, None]) / 2
+    pixels[..., 3] = 255
+    pixels[size // 2:, :, :3] += rng.integers(0, 16, (size - size // 2, size, 3), dtype=np.uint8)
+
+    header = bytearray(132)
+    header[8:12] = size.to_bytes(2, 'big') + size.to_bytes(2, 'big')
+    layout = get_layout("BGRA", size, size, mipmap_count)
+    mips = [bytes(level.size) for level in layout.levels[1:]]
+    padding = [{"padding": b""}] * (mipmap_count - 1)
+    _, bgra_data = build_ctxr(header, size, size, mipmap_count, pixels.tobytes(), mips, padding,
+                              b'\x00' * CTXR_FINAL_PADDING)
+    dxt5_layout = get_layout("DXT5", size, size, mipmap_count)
+    _, dxt5_data = build_ctxr(header, size, size, mipmap_count, rng.bytes(dxt5_layout.levels[0].size),
+                              [bytes(level.size) for level in dxt5_layout.levels[1:]], padding,
+                              b'\x00' * CTXR_FINAL_PADDING, size_fields=False)
+    dxt5_name = sorted(DXT5_FILES)[0]
+
+    ctxr = read_ctxr(io.BytesIO(bgra_data), "bench.ctxr")
+    image = ctxr_to_image(ctxr)
+    plain = {"tga_rle": False, "tga_mipmaps": False}
+    images = {"png": ENCODERS["png"](ctxr, image, plain), "tga": ENCODERS["tga"](ctxr, image, plain),
+              "dds": ENCODERS["dds"](ctxr, image, plain)}
+
+    def import_image(kind, dxt5=False):
+        source = io.BytesIO(images[kind])
+        source.name = f"bench.{kind}"
+        image_to_ctxr(source, ctxr["header"], ctxr["mipmap_info"], ctxr["final_padding"], dxt5)
+
+    timings = {
+        "decode": lambda: ctxr_to_image(read_ctxr(io.BytesIO(bgra_data), "bench.ctxr")),
+        "png": lambda: ENCODERS["png"](ctxr, image, plain),
+        "tga": lambda: ENCODERS["tga"](ctxr, image, plain),
+        "tga_rle": lambda: ENCODERS["tga"](ctxr, image, {"tga_rle": True, "tga_mipmaps": False}),
+        "dds": lambda: ENCODERS["dds"](ctxr, image, plain),
+        "dds_dxt5": lambda: ctxr_to_dds_bytes(read_ctxr(io.BytesIO(dxt5_data), dxt5_name)),
+        "import_png": lambda: import_image("png"),
+        "import_tga": lambda: import_image("tga"),
+        "import_dds": lambda: import_image("dds"),
+        "import_dxt5": lambda: import_image("png", dxt5=True),
+    }
+    megapixels = size * size / 1e6
+    rates = {name: _best_time(function, repeat) / megapixels for name, function in timings.items()}
+
+    print(f"{'conversion':<24}{'s/Mpix':>12}{'Mpix/s':>12}")
+    for name, rate in rates.items():
+        print(f"{name:<24}{rate:>12.4f}{1 / rate:>12.1f}")
+    save_rates(rates, DEFAULT_RATES_PATH)
+    print(f"Saved to {DEFAULT_RATES_PATH} for the batch planner")
+    return rates
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "rates": bench_rates,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CTXR converter benchmarks")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"Benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best is kept)")
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        print(f"== {name} ==")
+        BENCHMARKS[name](repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# cache_module.py
+"""
+Content-addressed cache of conversion outputs, shared across runs.
+
+An entry is keyed by a hash of the input bytes, CONVERTER_VERSION, the kind of
+conversion and its options, so converting a texture that anyone has converted
+before with the same settings just copies the stored output. Entries live one
+file each under the cache folder (fanned out by the first two hex digits) and
+are evicted least recently used first once the folder exceeds its size limit.
+
+A shared folder (e.g. on an NFS mount, default from the CTXR_SHARED_CACHE
+environment variable) can be added: local misses are looked up there, hits are
+copied into the local cache, and new outputs are written to both. Writes are
+atomic, so several machines can use the same shared folder; it is never
+trimmed by the clients.
+"""
+import os
+import json
+import struct
+import hashlib
+import logging
+import threading
+from ctxr_utils import atomic_write
+
+
+# Bump whenever a converter's output changes, so stale entries are never hit
+CONVERTER_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ctxr_converter")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+SHARED_CACHE_ENV = "CTXR_SHARED_CACHE"
+ENTRY_MAGIC = b'CTXC'
+ENTRY_SUFFIX = ".bin"
+# Outputs stored between eviction scans, as a fraction of the size limit
+EVICT_EVERY = 0.1
+
+
+def _flatten(value, blobs):
+    """Shape of a nested bytes/list/tuple/dict value, appending its byte strings to blobs"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        blobs.append(bytes(value))
+        return len(blobs) - 1
+    if isinstance(value, (list, tuple)):
+        return [_flatten(item, blobs) for item in value]
+    if isinstance(value, dict):
+        return {"dict": {key: _flatten(item, blobs) for key, item in value.items()}}
+    raise TypeError(f"Cannot cache a {type(value).__name__}")
+
+
+def _unflatten(shape, blobs):
+    if isinstance(shape, int):
+        return blobs[shape]
+    if isinstance(shape, list):
+        return [_unflatten(item, blobs) for item in shape]
+    return {key: _unflatten(item, blobs) for key, item in shape["dict"].items()}
+
+
+def pack_outputs(value):
+    """
+    Serialize a conversion output: bytes, or lists/tuples/dicts (with string keys)
+    of them. Tuples come back as lists.
+    """
+    blobs = []
+    shape = json.dumps(_flatten(value, blobs), separators=(',', ':')).encode('utf-8')
+    parts = [ENTRY_MAGIC, struct.pack('<II', len(shape), len(blobs)), shape]
+    parts += [struct.pack('<Q', len(blob)) for blob in blobs]
+    return b''.join(parts + blobs)
+
+
+def unpack_outputs(data):
+    """Inverse of pack_outputs; raises ValueError for a damaged entry"""
+    if data[:4] != ENTRY_MAGIC or len(data) < 12:
+        raise ValueError("not a cache entry")
+    shape_length, count = struct.unpack_from('<II', data, 4)
+    offset = 12 + shape_length
+    shape = json.loads(data[12:offset])
+    lengths = struct.unpack_from(f'<{count}Q', data, offset)
+    offset += 8 * count
+    if offset + sum(lengths) != len(data):
+        raise ValueError("truncated cache entry")
+    blobs = []
+    for length in lengths:
+        blobs.append(data[offset:offset + length])
+        offset += length
+    return _unflatten(shape, blobs)
+
+
+class ConversionCache:
+    """
+    On-disk cache of conversion outputs under path (None disables caching),
+    trimmed to max_bytes, with an optional shared folder behind it.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, shared=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stored_bytes = 0
+        self.evicted = 0
+        self._since_evict = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def key(self, data, kind, options=None):
+        """
+        Entry key for converting data (bytes, or a sequence of byte strings) with
+        the conversion kind (e.g. "export") and its options (JSON-serializable).
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        spec = {"version": CONVERTER_VERSION, "kind": kind, "options": options or {}}
+        digest.update(json.dumps(spec, sort_keys=True).encode('utf-8'))
+        for part in [data] if isinstance(data, (bytes, bytearray, memoryview)) else data:
+            digest.update(struct.pack('<Q', len(part)))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _entry_path(self, root, key):
+        return os.path.join(root, key[:2], key + ENTRY_SUFFIX)
+
+    def _read_entry(self, root, key):
+        try:
+            with open(self._entry_path(root, key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_entry(self, root, key, data):
+        path = self._entry_path(root, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data)
+        except OSError as e:
+            logging.warning(f"Could not write cache entry {path}: {e}")
+
+    def get(self, key):
+        """Stored output for key, or None"""
+        if not self.enabled:
+            return None
+        data = self._read_entry(self.path, key)
+        if data is not None:
+            try:
+                # Reads refresh the entry's mtime, which eviction orders by
+                os.utime(self._entry_path(self.path, key))
+            except OSError:
+                pass
+            shared = False
+        elif self.shared:
+            data = self._read_entry(self.shared, key)
+            if data is not None:
+                self._write_entry(self.path, key, data)
+            shared = True
+        if data is not None:
+            try:
+                value = unpack_outputs(data)
+            except ValueError as e:
+                logging.warning(f"Ignoring damaged cache entry {key}: {e}")
+                data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += shared
+        return value
+
+    def put(self, key, value):
+        """Store an output (see pack_outputs for what can be stored)"""
+        if not self.enabled:
+            return
+        data = pack_outputs(value)
+        self._write_entry(self.path, key, data)
+        if self.shared:
+            self._write_entry(self.shared, key, data)
+        with self._lock:
+            self.stored_bytes += len(data)
+            self._since_evict += len(data)
+            evict = self._since_evict >= self.max_bytes * EVICT_EVERY
+            if evict:
+                self._since_evict = 0
+        if evict:
+            self.evict()
+
+    def convert(self, data, kind, options, convert):
+        """Return the cached output of converting data, or run convert() and store its result"""
+        if not self.enabled:
+            return convert()
+        key = self.key(data, kind, options)
+        value = self.get(key)
+        if value is None:
+            value = convert()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+        """Delete the least recently used local entries until the cache fits in max_bytes"""
+        if not self.enabled or not os.path.isdir(self.path):
+            return
+        entries, total = [], 0
+        with os.scandir(self.path) as folders:
+            for folder in folders:
+                if not folder.is_dir():
+                    continue
+                with os.scandir(folder.path) as files:
+                    for entry in files:
+                        if not entry.name.endswith(ENTRY_SUFFIX):
+                            continue
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+        entries.sort()
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self.evicted += evicted
+        if evicted:
+            logging.info(f"Evicted {evicted} entries from the conversion cache {self.path}")
+
+    def close(self):
+        """Trim the cache if anything was stored since the last eviction"""
+        if self._since_evict:
+            self._since_evict = 0
+            self.evict()
+
+    def format_stats(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        shared = f" ({self.shared_hits} from the shared cache)" if self.shared else ""
+        return (f"Conversion cache: {self.hits} hits{shared}, {self.misses} misses ({rate:.0%} hit rate), "
+                f"{self.stored_bytes / 1e6:.1f} MB stored, {self.evicted} evicted")
+
+
+_conversion_cache = None
+
+
+def get_conversion_cache():
+    """The process-wide conversion cache (in DEFAULT_CACHE_DIR, shared folder from CTXR_SHARED_CACHE)"""
+    global _conversion_cache
+    if _conversion_cache is None:
+        _conversion_cache = ConversionCache(shared=os.environ.get(SHARED_CACHE_ENV) or None)
+    return _conversion_cache
+
+
+def set_conversion_cache(cache):
+    """Replace the process-wide conversion cache, e.g. ConversionCache(None) to disable it"""
+    global _conversion_cache
+    _conversion_cache = cache
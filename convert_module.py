@@ -0,0 +1,157 @@
+# convert_module.py
+import struct
+import logging
+from ctxr_utils import build_ctxr
+from dds_module import load_dds_header_template, parse_dds, dds_levels_to_ctxr
+from tga_module import tga_to_image
+from layout_module import get_layout, mip_dimensions, DDS_HEADER_SIZE
+
+
+def ctxr_to_image(ctxr):
+    """Decode the main level of an uncompressed CTXR (as returned by read_ctxr) to an RGBA image"""
+    from PIL import Image
+
+    # PIL interprets BGRA bytes as RGBA, so we need to swap R and B
+    image_bgra = Image.frombytes('RGBA', (ctxr["width"], ctxr["height"]), ctxr["pixel_data"])
+    r, g, b, a = image_bgra.split()
+    return Image.merge("RGBA", (b, g, r, a))
+
+
+def generate_mipmaps(image, mipmap_count):
+    """Return [image] followed by mipmap_count-1 Lanczos downscaled levels"""
+    from PIL import Image
+
+    mipmaps = [image]
+    for level in range(1, mipmap_count):
+        mipmaps.append(image.resize(mip_dimensions(image.width, image.height, level), Image.LANCZOS))
+    return mipmaps
+
+
+def dxt5_dds_header(width, height, mipmap_count, linear_size):
+    """128-byte DDS header for a DXT5 texture whose main level is linear_size bytes"""
+    dds_header = load_dds_header_template(dxt5=True)
+    struct.pack_into("<I", dds_header, 12, height)
+    struct.pack_into("<I", dds_header, 16, width)
+    struct.pack_into("<I", dds_header, 20, linear_size)  # Offset 20 is Pitch/LinearSize
+    struct.pack_into("<I", dds_header, 28, mipmap_count)
+
+    # Standard Flags: CAPS (1) | HEIGHT (2) | WIDTH (4) | PIXELFORMAT (0x1000) | LINEARSIZE (0x80000)
+    required_flags = 0x81007
+    # Standard Caps: TEXTURE (0x1000)
+    required_caps = 0x1000
+    if mipmap_count > 1:
+        required_flags |= 0x20000   # Add MIPMAPCOUNT flag
+        required_caps |= 0x400008   # Add COMPLEX (8) and MIPMAP (0x400000) caps
+
+    # Overwrite the flags rather than OR-ing with the template to be safe
+    struct.pack_into("<I", dds_header, 8, required_flags)
+    struct.pack_into("<I", dds_header, 104, required_caps)
+    return dds_header
+
+
+def ctxr_to_dds_bytes(ctxr, image_rgba=None):
+    """
+    Build DDS file bytes for a CTXR read with read_ctxr.
+
+    DXT5 files have their compressed levels copied straight across; uncompressed
+    files are decoded (or image_rgba is used if given) and mipmaps regenerated.
+    """
+    width, height = ctxr["width"], ctxr["height"]
+    mipmap_count = ctxr["mipmap_count"]
+    pixel_data = ctxr["pixel_data"]
+
+    # The whole file is allocated up front; every level is copied into its slot
+    layout = get_layout("DXT5" if ctxr["is_dxt5"] else "BGRA", width, height, mipmap_count)
+    out = bytearray(layout.dds_size)
+
+    if ctxr["is_dxt5"]:
+        linear_size = layout.levels[0].size
+
+        # Ensure main data matches linear_size exactly (the slot is zero filled)
+        if len(pixel_data) < linear_size:
+            logging.info(f"Padding main image with {linear_size - len(pixel_data)} bytes")
+
+        out[:DDS_HEADER_SIZE] = dxt5_dds_header(width, height, mipmap_count, linear_size)
+
+        level_datas = [pixel_data] + [mip_info["data"] for mip_info in ctxr["mipmap_info"]]
+        for level, level_data in zip(layout.levels, level_datas):
+            if level.level and len(level_data) < level.size:
+                logging.warning(f"Mipmap {level.level} undersized: {len(level_data)} < {level.size}, "
+                                f"padding {level.size - len(level_data)} bytes")
+            elif len(level_data) > level.size:
+                logging.warning(f"Level {level.level} oversized: {len(level_data)} > {level.size}, truncating")
+            level_data = level_data[:level.size]
+            out[level.dds_offset:level.dds_offset + len(level_data)] = level_data
+        logging.info(f"Wrote DXT5 compressed DDS with {mipmap_count} levels")
+        return bytes(out)
+
+    # Uncompressed - generate mipmaps using high-quality Lanczos filtering
+    if image_rgba is None:
+        image_rgba = ctxr_to_image(ctxr)
+    mipmaps = generate_mipmaps(image_rgba, mipmap_count)
+
+    dds_header = load_dds_header_template(dxt5=False)
+    struct.pack_into("<I", dds_header, 12, height)
+    struct.pack_into("<I", dds_header, 16, width)
+    struct.pack_into("<I", dds_header, 28, mipmap_count)
+    out[:DDS_HEADER_SIZE] = dds_header
+
+    for level, mip_image in zip(layout.levels, mipmaps):
+        out[level.dds_offset:level.dds_offset + level.size] = mip_image.tobytes("raw", "BGRA")
+    return bytes(out)
+
+
+def image_to_ctxr(source, ctxr_header, original_mipmap_info, original_final_padding, dxt5=False):
+    """
+    Convert a PNG/TGA/DDS image to CTXR bytes using an original CTXR as reference.
+
+    source is a path or binary file object. DDS files have their own mip chain
+    (up to the original's mipmap count) copied across; other images are converted
+    to BGRA with regenerated mipmaps, or compressed to DXT5 if the original
+    is DXT5 (dxt5).
+    Returns (header, data) where header is the updated 132-byte header.
+    """
+    mipmap_count = struct.unpack_from('>B', ctxr_header, 0x26)[0]
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return image_to_ctxr(f, ctxr_header, original_mipmap_info, original_final_padding, dxt5)
+
+    start = source.tell()
+    if source.read(4) == b'DDS ':
+        # DDS files bring their own mip chain, which is copied across level by level
+        source.seek(start)
+        dds = parse_dds(source.read())
+        return dds_levels_to_ctxr(dds, ctxr_header, original_mipmap_info, original_final_padding,
+                                  max_levels=max(1, mipmap_count))
+
+    source.seek(start)
+    if getattr(source, "name", "").lower().endswith(".tga"):
+        # Our own reader honours the TGA origin bits (bottom-left files are flipped upright)
+        image = tga_to_image(source)
+    else:
+        from PIL import Image
+        image = Image.open(source)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+
+    width, height = image.size
+    if mipmap_count <= 1 or not original_mipmap_info:
+        mipmap_count = 1  # No mipmaps beyond main level
+
+    if dxt5:
+        from analyze_module import encode_image_levels
+        levels = encode_image_levels(image, "DXT5", mipmap_count, getattr(source, "name", ""))
+        return build_ctxr(ctxr_header, width, height, mipmap_count, levels[0], levels[1:],
+                          original_mipmap_info, original_final_padding, size_fields=False)
+
+    main_pixel_data = image.tobytes("raw", "BGRA")
+
+    new_mipmap_data = []
+    if mipmap_count > 1:
+        for mip_image in generate_mipmaps(image, mipmap_count)[1:]:
+            # Even if the data is a different length, the original padding is preserved.
+            new_mipmap_data.append(mip_image.tobytes("raw", "BGRA"))
+
+    return build_ctxr(ctxr_header, width, height, mipmap_count, main_pixel_data,
+                      new_mipmap_data, original_mipmap_info, original_final_padding)
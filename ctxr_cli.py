@@ -0,0 +1,654 @@
+# ctxr_cli.py
+"""Command line interface for the CTXR converter"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+
+def cmd_info(args):
+    """Print the header fields of CTXR files without decoding any pixel data"""
+    from ctxr_utils import iter_ctxr_files, parse_header_info, guess_format, CTXR_HEADER_SIZE, CTXRError
+
+    status = 0
+    for file_path in iter_ctxr_files(args.paths):
+        try:
+            with open(file_path, 'rb') as f:
+                info = parse_header_info(f.read(CTXR_HEADER_SIZE))
+        except (OSError, CTXRError) as e:
+            print(f"{file_path}: error ({e})")
+            status = 1
+            continue
+        fmt = guess_format(info, os.path.basename(file_path))
+        payload = info["pixel_data_length"]
+        payload = f"{payload} bytes" if payload is not None else "unknown size"
+        print(f"{file_path}: {info['platform']} {info['width']}x{info['height']} {fmt}, "
+              f"{info['mipmap_count']} mipmaps, main level {payload}")
+    return status
+
+
+def cmd_inventory(args):
+    """Index CTXR headers into SQLite, then print a summary or the paths matching --where"""
+    from inventory_module import update_index, query_paths, summarize_index
+
+    if args.paths:
+        counts = update_index(args.paths, args.db, workers=args.workers)
+        print(f"Indexed into {args.db}: {counts['scanned']} scanned, "
+              f"{counts['unchanged']} unchanged, {counts['removed']} removed")
+    if args.where:
+        for path in query_paths(args.db, args.where):
+            print(path)
+        return 0
+    print(f"{'platform':<10}{'format':<10}{'files':>8}{'npot':>8}{'payload MB':>12}{'errors':>8}")
+    for row in summarize_index(args.db):
+        print(f"{row['platform'] or '-':<10}{row['format'] or '-':<10}{row['files']:>8}{row['npot'] or 0:>8}"
+              f"{(row['payload_bytes'] or 0) / 1e6:>12.1f}{row['errors']:>8}")
+    return 0
+
+
+def selected_paths(args):
+    """Paths given on the command line plus any selected from an inventory index"""
+    paths = list(args.paths)
+    if args.index:
+        from inventory_module import query_paths
+        paths += query_paths(args.index, args.where)
+    return paths
+
+
+class ProgressPrinter:
+    """on_progress callback redrawing one status line on stderr (only when it is a terminal)"""
+
+    def __init__(self, enabled=True, interval=0.2):
+        self.enabled = enabled and sys.stderr.isatty()
+        self.interval = interval
+        self.last = 0.0
+        self.width = 0
+
+    def __call__(self, tracker):
+        now = time.perf_counter()
+        if not self.enabled or now - self.last < self.interval:
+            return
+        self.last = now
+        line = tracker.format()
+        sys.stderr.write("\r" + line.ljust(self.width))
+        sys.stderr.flush()
+        self.width = len(line)
+
+    def clear(self):
+        """Erase the status line (before printing anything else, and at the end)"""
+        if self.enabled and self.width:
+            sys.stderr.write("\r" + " " * self.width + "\r")
+            sys.stderr.flush()
+            self.width = 0
+
+
+def cmd_export(args):
+    """Decode each CTXR once and write it out in every requested format"""
+    from export_module import batch_export, ENCODERS
+
+    formats = [fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in ENCODERS]
+    if unknown:
+        print(f"Unsupported format(s): {', '.join(unknown)}")
+        return 2
+
+    from journal_module import BatchJournal
+
+    progress = ProgressPrinter(not args.no_progress)
+
+    def on_done(file_path, error):
+        if error is not None:
+            progress.clear()
+            print(f"{file_path}: {error}")
+
+    paths = selected_paths(args)
+    job = {"command": "export", "paths": [os.path.abspath(path) for path in paths], "formats": formats,
+           "output": os.path.abspath(args.output) if args.output else None,
+           "tga_rle": args.tga_rle, "tga_mipmaps": args.tga_mipmaps, "sidecar": not args.no_sidecar,
+           "include": args.include, "exclude": args.exclude}
+    with BatchJournal(args.journal, job, resume=args.resume) as journal:
+        result = batch_export(paths, formats, args.output, parallel_encoders=args.parallel_encoders,
+                              on_done=on_done, tga_rle=args.tga_rle, tga_mipmaps=args.tga_mipmaps,
+                              journal=journal, sidecar=not args.no_sidecar, include=args.include,
+                              exclude=args.exclude, order=args.order, on_progress=progress,
+                              stream_above=None if args.no_stream else int(args.stream_above * 1e6),
+                              **pipeline_settings(args))
+    progress.clear()
+    skipped = f", skipped {journal.skipped} already done" if journal.skipped else ""
+    print(f"Exported {result['items'] - result['failed']} of {result['items']} files "
+          f"to {', '.join(formats)} in {result['wall_time']:.1f}s{skipped}")
+    return 1 if result["failed"] else 0
+
+
+def cmd_import(args):
+    """Convert an edited PNG/TGA/DDS back to CTXR using its sidecar or the original CTXR as template"""
+    from ctxr_utils import read_ctxr, atomic_write, CTXRError
+
+    output = args.output or os.path.splitext(args.image)[0] + ".ctxr"
+    if not args.output and os.path.exists(output) and not args.in_place:
+        # Exports sit next to their CTXR, so the default output is usually the original itself
+        print(f"{output} already exists (usually the original CTXR); pass --output, or --in-place to replace it")
+        return 1
+    if args.stream:
+        from streaming_module import stream_image_to_ctxr, open_ctxr
+        from sidecar_module import read_sidecar, sidecar_path
+        try:
+            if args.template:
+                with open_ctxr(args.template) as template:
+                    layout = stream_image_to_ctxr(args.image, template, output)
+            else:
+                layout = stream_image_to_ctxr(args.image, read_sidecar(sidecar_path(args.image)), output)
+        except CTXRError as e:
+            print(e)
+            return 1
+        print(f"{output}: streamed ({layout.ctxr_size} bytes)")
+        return 0
+
+    if not args.template:
+        from sidecar_module import import_with_sidecar
+        try:
+            ctxr_data = import_with_sidecar(args.image)
+        except CTXRError as e:
+            print(f"{e} (pass --template to import against the original CTXR)")
+            return 1
+        atomic_write(output, ctxr_data)
+        print(f"{output}: written from sidecar ({len(ctxr_data)} bytes)")
+        return 0
+
+    if args.incremental and not args.image.lower().endswith(".dds"):
+        from incremental_module import incremental_import
+        try:
+            result = incremental_import(args.image, args.template, output)
+            print(f"{output}: {result['changed_blocks']} of {result['total_blocks']} blocks changed, "
+                  f"{len(result['patches'])} ranges patched")
+            return 0
+        except CTXRError as e:
+            print(f"Incremental import not possible ({e}), doing a full import")
+
+    from sidecar_module import import_image_data
+    with open(args.template, 'rb') as f:
+        ctxr = read_ctxr(f, os.path.basename(args.template))
+    with open(args.image, 'rb') as f:
+        ctxr_data = import_image_data(f.read(), args.image, ctxr)
+    atomic_write(output, ctxr_data)
+    print(f"{output}: written ({len(ctxr_data)} bytes)")
+    return 0
+
+
+def cmd_batch_import(args):
+    """Import every edited image that has a sidecar, in parallel, without the original CTXRs"""
+    from sidecar_module import batch_import
+    from journal_module import BatchJournal
+
+    progress = ProgressPrinter(not args.no_progress)
+
+    def on_done(image_path, error):
+        if error is not None:
+            progress.clear()
+            print(f"{image_path}: {error}")
+
+    job = {"command": "batch-import", "paths": [os.path.abspath(path) for path in args.paths],
+           "output": os.path.abspath(args.output) if args.output else None, "in_place": args.in_place,
+           "include": args.include, "exclude": args.exclude}
+    with BatchJournal(args.journal, job, resume=args.resume) as journal:
+        result = batch_import(args.paths, args.output, on_done=on_done, include=args.include, exclude=args.exclude,
+                              order=args.order, on_progress=progress, in_place=args.in_place, journal=journal,
+                              **pipeline_settings(args))
+    progress.clear()
+    skipped = f", skipped {journal.skipped} already done" if journal.skipped else ""
+    print(f"Imported {result['items'] - result['failed']} of {result['items']} images "
+          f"in {result['wall_time']:.1f}s{skipped}")
+    return 1 if result["failed"] else 0
+
+
+def cmd_plan(args):
+    """Report what an export or import batch would do, from the file headers alone"""
+    from plan_module import plan_export, plan_import, format_plan, load_rates
+
+    rates = load_rates(args.rates)
+    if args.job == "export":
+        formats = [fmt.strip().lower() for fmt in args.formats.split(",") if fmt.strip()]
+        unknown = [fmt for fmt in formats if fmt not in ("png", "tga", "dds")]
+        if unknown:
+            print(f"Unsupported format(s): {', '.join(unknown)}")
+            return 2
+        plan = plan_export(selected_paths(args), formats, args.tga_rle, args.tga_mipmaps, not args.no_sidecar,
+                           args.include, args.exclude, rates)
+    else:
+        plan = plan_import(selected_paths(args), args.templates, args.include, args.exclude, rates,
+                           args.output, args.in_place)
+    print(format_plan(plan, args.converters))
+    return 1 if plan["failures"] else 0
+
+
+def cmd_diff(args):
+    """List textures added, removed, modified or changed only in their headers between two trees"""
+    from diff_module import diff_trees, format_diff, DIFF_CATEGORIES
+
+    result = diff_trees(args.old, args.new, args.db, workers=args.workers, include=args.include,
+                        exclude=args.exclude)
+    print(format_diff(result, levels=args.levels))
+    if args.json:
+        import json
+        from ctxr_utils import atomic_write
+        atomic_write(args.json, json.dumps(result, indent=1).encode('utf-8'))
+    return 1 if any(result[category] for category in DIFF_CATEGORIES) else 0
+
+
+def cmd_transcode(args):
+    """Transcode CTXRs between the PS3 and PC layouts in one pass, without a DDS in between"""
+    from transcode_module import batch_transcode
+    from journal_module import BatchJournal
+
+    progress = ProgressPrinter(not args.no_progress)
+
+    def on_done(file_path, error):
+        if error is not None:
+            progress.clear()
+            print(f"{file_path}: {error}")
+
+    swizzled = {"auto": None, "yes": True, "no": False}[args.swizzle]
+    job = {"command": "transcode", "paths": [os.path.abspath(path) for path in args.paths], "to": args.to,
+           "templates": os.path.abspath(args.templates), "output": os.path.abspath(args.output),
+           "swizzle": args.swizzle, "include": args.include, "exclude": args.exclude}
+    with BatchJournal(args.journal, job, resume=args.resume) as journal:
+        result = batch_transcode(args.paths, args.to, args.templates, args.output, swizzled=swizzled,
+                                 on_done=on_done, include=args.include, exclude=args.exclude, order=args.order,
+                                 on_progress=progress, journal=journal, **pipeline_settings(args))
+    progress.clear()
+    skipped = f", skipped {journal.skipped} already done" if journal.skipped else ""
+    print(f"Transcoded {result['items'] - result['failed']} of {result['items']} files "
+          f"to {args.to.upper()} CTXR in {result['wall_time']:.1f}s{skipped}")
+    return 1 if result["failed"] else 0
+
+
+def cmd_watch(args):
+    """Re-import images saved into a folder against their templates until interrupted"""
+    from watch_module import watch_folder
+
+    def on_done(image_path, error):
+        stamp = time.strftime("%H:%M:%S")
+        if error is not None:
+            print(f"[{stamp}] {image_path}: {error}")
+        else:
+            print(f"[{stamp}] {image_path}: re-imported")
+
+    print(f"Watching {args.source} (Ctrl+C to stop)")
+    try:
+        watch_folder(args.source, args.templates, args.target, incremental=not args.full,
+                     interval=args.interval, debounce=args.debounce, on_done=on_done)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_verify(args):
+    """Round-trip every CTXR in memory and report files that don't come back byte-identical"""
+    from verify_module import verify_files, format_verify_result, VERIFY_MODES
+
+    modes = VERIFY_MODES if args.mode == "all" else (args.mode,)
+    thresholds = quality_thresholds(args) if args.metrics else None
+    start = time.perf_counter()
+    total = failed = within = 0
+    for result in verify_files(selected_paths(args), modes, workers=args.workers, thresholds=thresholds,
+                               include=args.include, exclude=args.exclude):
+        total += 1
+        if "error" not in result and all(entry["ok"] for entry in result["modes"].values()):
+            continue
+        print(format_verify_result(result))
+        if "error" not in result and all(entry["ok"] or entry.get("quality_ok") for entry in result["modes"].values()):
+            within += 1
+        else:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    within_text = f", {within} within quality thresholds" if thresholds else ""
+    print(f"Verified {total} files in {elapsed:.1f}s: {total - failed - within} identical{within_text}, {failed} failed")
+    return 1 if failed else 0
+
+
+def cmd_qa(args):
+    """Compare re-encoded CTXRs with their originals and report those outside the quality thresholds"""
+    from ctxr_utils import iter_ctxr_files
+    from metrics_module import compare_files, format_metrics
+
+    pairs = []
+    for path in args.paths:
+        for file_path in iter_ctxr_files([path]):
+            # Files are matched by their path relative to the folder given
+            relative = os.path.relpath(file_path, path) if os.path.isdir(path) else os.path.basename(file_path)
+            result_path = os.path.join(args.against, relative)
+            if os.path.exists(result_path):
+                pairs.append((file_path, result_path))
+            else:
+                print(f"{file_path}: no re-encoded file at {result_path}")
+
+    start = time.perf_counter()
+    failed = 0
+    for result in compare_files(pairs, quality_thresholds(args), workers=args.workers):
+        if "error" in result:
+            failed += 1
+            print(f"{result['path']}: error ({result['error']})")
+        elif not result["ok"]:
+            failed += 1
+            failures = result["failures"]
+            more = f" (+{len(failures) - 3} more)" if len(failures) > 3 else ""
+            print(f"{result['path']}: {', '.join(failures[:3])}{more}")
+        elif args.all:
+            print(f"{result['path']}: {format_metrics(result['metrics'])}")
+    elapsed = time.perf_counter() - start
+    print(f"Compared {len(pairs)} files in {elapsed:.1f}s: {len(pairs) - failed} within thresholds, {failed} failed")
+    return 1 if failed else 0
+
+
+def cmd_analyze(args):
+    """Recommend BGRA, DXT1 or DXT5 for each texture from its alpha usage and estimated block compression error"""
+    from walker_module import walk_paths
+    from analyze_module import analyze_files, format_analysis, ANALYZE_EXTENSIONS
+
+    paths = [item.path for item in walk_paths(args.paths, ANALYZE_EXTENSIONS, args.include, args.exclude)]
+    start = time.perf_counter()
+    results, counts, failed = [], {}, 0
+    size = recommended_size = 0
+    for result in analyze_files(paths, workers=args.workers, min_psnr=args.min_psnr,
+                                max_gradient_damage=args.max_gradient_damage):
+        results.append(result)
+        if "error" in result:
+            failed += 1
+        else:
+            counts[result["recommended"]] = counts.get(result["recommended"], 0) + 1
+            size += result["size"]
+            recommended_size += result["recommended_size"]
+        if args.all or "error" in result or result["recommended"] != result["format"]:
+            print(format_analysis(result))
+    elapsed = time.perf_counter() - start
+    recommended = ", ".join(f"{count} {fmt}" for fmt, count in sorted(counts.items()))
+    print(f"Analysed {len(paths)} files in {elapsed:.1f}s: {recommended or 'none'}"
+          f"{f', {failed} failed' if failed else ''}; {size / 1e6:.1f} MB -> {recommended_size / 1e6:.1f} MB "
+          f"({(size - recommended_size) / 1e6:.1f} MB saved)")
+    if args.json:
+        import json
+        from ctxr_utils import atomic_write
+        atomic_write(args.json, json.dumps(results, indent=1).encode('utf-8'))
+    return 1 if failed else 0
+
+
+def add_index_arguments(parser):
+    parser.add_argument("--index", help="Also process files selected from this inventory database")
+    parser.add_argument("--where", help="SQL condition used with --index, e.g. \"mipmap_count = 13\"")
+
+
+def add_walk_arguments(parser):
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="Only process files whose name or relative path matches (repeatable, case-insensitive)")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="Skip files and folders whose name or relative path matches (repeatable)")
+
+
+def add_pipeline_arguments(parser):
+    from pipeline_module import (DEFAULT_READ_WORKERS, DEFAULT_CONVERT_WORKERS, DEFAULT_WRITE_WORKERS,
+                                 DEFAULT_READ_AHEAD, DEFAULT_WRITE_BEHIND)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READ_WORKERS, help="Reader threads")
+    parser.add_argument("--converters", type=int, default=DEFAULT_CONVERT_WORKERS, help="Converter threads")
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITE_WORKERS, help="Writer threads")
+    parser.add_argument("--read-ahead", type=int, default=DEFAULT_READ_AHEAD,
+                        help="Files prefetched ahead of the converters")
+    parser.add_argument("--write-behind", type=int, default=DEFAULT_WRITE_BEHIND,
+                        help="Converted outputs queued for the writers")
+
+
+def add_journal_arguments(parser):
+    from journal_module import DEFAULT_JOURNAL_PATH
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_PATH,
+                        help=f"Checkpoint journal of completed files (default: {DEFAULT_JOURNAL_PATH})")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip files an interrupted run with the same options already completed")
+
+
+def add_schedule_arguments(parser):
+    parser.add_argument("--order", choices=("size", "walk"), default="size",
+                        help="size: measure everything first and run the largest files first (default); "
+                             "walk: start immediately, in folder order")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="Don't show the bytes/throughput/ETA progress line on stderr")
+
+
+def add_threshold_arguments(parser):
+    from metrics_module import DEFAULT_THRESHOLDS
+    parser.add_argument("--min-psnr", type=float, default=DEFAULT_THRESHOLDS["min_psnr"],
+                        help=f"Lowest acceptable PSNR in dB (default: {DEFAULT_THRESHOLDS['min_psnr']})")
+    parser.add_argument("--min-ssim", type=float, default=DEFAULT_THRESHOLDS["min_ssim"],
+                        help=f"Lowest acceptable block SSIM (default: {DEFAULT_THRESHOLDS['min_ssim']})")
+    parser.add_argument("--max-mae", type=float, default=DEFAULT_THRESHOLDS["max_mae"],
+                        help=f"Highest acceptable per-channel mean error (default: {DEFAULT_THRESHOLDS['max_mae']})")
+    parser.add_argument("--max-alpha-drift", type=float, default=DEFAULT_THRESHOLDS["max_alpha_drift"],
+                        help="Highest acceptable change in alpha-tested coverage, as a fraction "
+                             f"(default: {DEFAULT_THRESHOLDS['max_alpha_drift']})")
+
+
+def quality_thresholds(args):
+    return {
+        "min_psnr": args.min_psnr,
+        "min_ssim": args.min_ssim,
+        "max_mae": args.max_mae,
+        "max_alpha_drift": args.max_alpha_drift,
+    }
+
+
+def pipeline_settings(args):
+    return {
+        "read_workers": args.readers,
+        "convert_workers": args.converters,
+        "write_workers": args.writers,
+        "read_ahead": args.read_ahead,
+        "write_behind": args.write_behind,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ctxr_cli", description="CTXR Converter command line tools")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable info logging")
+    from layout_module import DEFAULT_LAYOUT_CACHE_PATH
+    parser.add_argument("--layout-cache", default=DEFAULT_LAYOUT_CACHE_PATH,
+                        help="File remembering the mip padding layout per header shape "
+                             f"(default: {DEFAULT_LAYOUT_CACHE_PATH})")
+    parser.add_argument("--no-layout-cache", action="store_true",
+                        help="Don't read or save the layout cache (always scan the padding)")
+    from cache_module import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, SHARED_CACHE_ENV
+    parser.add_argument("--cache", default=DEFAULT_CACHE_DIR,
+                        help=f"Folder caching converted outputs by input content and options (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 2, metavar="MB",
+                        help="Size the cache folder is trimmed to, least recently used first "
+                             f"(default: {DEFAULT_MAX_BYTES // 1024 ** 2})")
+    parser.add_argument("--shared-cache", default=os.environ.get(SHARED_CACHE_ENV),
+                        help=f"Cache folder shared with other machines, e.g. on a network mount "
+                             f"(default: ${SHARED_CACHE_ENV})")
+    parser.add_argument("--no-cache", action="store_true", help="Don't look up or store converted outputs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info = subparsers.add_parser("info", help="Show CTXR header information")
+    info.add_argument("paths", nargs="+", help="CTXR files or folders (searched recursively)")
+    info.set_defaults(func=cmd_info)
+
+    from inventory_module import DEFAULT_INDEX_PATH
+    inventory = subparsers.add_parser("inventory", help="Index CTXR headers into a SQLite database")
+    inventory.add_argument("paths", nargs="*", help="CTXR files or folders to (re)scan")
+    inventory.add_argument("--db", default=DEFAULT_INDEX_PATH, help=f"Index database (default: {DEFAULT_INDEX_PATH})")
+    inventory.add_argument("--where", help="SQL condition; print matching paths, e.g. \"format = 'DXT5'\"")
+    inventory.add_argument("--workers", type=int, default=8, help="Parallel header readers (default: 8)")
+    inventory.set_defaults(func=cmd_inventory)
+
+    export = subparsers.add_parser("export", help="Convert CTXR files to one or more image formats")
+    export.add_argument("paths", nargs="*", help="CTXR files or folders (searched recursively)")
+    export.add_argument("--formats", default="png", help="Comma separated formats: png,tga,dds (default: png)")
+    export.add_argument("--output",
+                        help="Output folder, mirroring the source folders (default: next to each input)")
+    export.add_argument("--parallel-encoders", action="store_true",
+                        help="Run the encoders for one texture on parallel threads")
+    export.add_argument("--tga-rle", action="store_true", help="RLE compress TGA output")
+    export.add_argument("--tga-mipmaps", action="store_true",
+                        help="Also write every mip level as name_mipN.tga")
+    export.add_argument("--no-sidecar", action="store_true",
+                        help="Don't write the .ctxrmeta layout sidecar that lets images be imported without the original")
+    from streaming_module import STREAM_THRESHOLD_PIXELS
+    export.add_argument("--stream-above", type=float, default=STREAM_THRESHOLD_PIXELS / 1e6, metavar="MPIX",
+                        help="Convert textures of at least this many megapixels band by band from disk "
+                             f"(default: {STREAM_THRESHOLD_PIXELS / 1e6:.1f})")
+    export.add_argument("--no-stream", action="store_true", help="Never stream, always decode whole textures")
+    add_index_arguments(export)
+    add_walk_arguments(export)
+    add_schedule_arguments(export)
+    add_journal_arguments(export)
+    add_pipeline_arguments(export)
+    export.set_defaults(func=cmd_export)
+
+    import_ = subparsers.add_parser("import", help="Convert an image back to CTXR using its sidecar or an original")
+    import_.add_argument("image", help="Edited PNG, TGA or DDS")
+    import_.add_argument("--template",
+                         help="Original CTXR the image was exported from (default: use the image's .ctxrmeta sidecar)")
+    import_.add_argument("--output", help="Output CTXR (default: the image path with .ctxr)")
+    import_.add_argument("--in-place", action="store_true",
+                         help="Allow the default output to replace an existing CTXR (usually the original)")
+    import_.add_argument("--incremental", action="store_true",
+                         help="Patch only the tiles that changed into the output (or a copy of the template)")
+    import_.add_argument("--stream", action="store_true",
+                         help="Convert a very large PNG/TGA band by band (mip levels are box filtered)")
+    import_.set_defaults(func=cmd_import)
+
+    batch_import = subparsers.add_parser("batch-import",
+                                         help="Convert every edited image with a .ctxrmeta sidecar back to CTXR")
+    batch_import.add_argument("paths", nargs="+", help="Images or folders (searched recursively)")
+    batch_import.add_argument("--output",
+                              help="Output folder, mirroring the source folders (default: next to each image)")
+    batch_import.add_argument("--in-place", action="store_true",
+                              help="Without --output, allow replacing the CTXRs next to the images (usually the originals)")
+    add_walk_arguments(batch_import)
+    add_schedule_arguments(batch_import)
+    add_journal_arguments(batch_import)
+    add_pipeline_arguments(batch_import)
+    batch_import.set_defaults(func=cmd_batch_import)
+
+    transcode = subparsers.add_parser("transcode", help="Convert PS3 CTXR files to PC CTXR files or back")
+    transcode.add_argument("paths", nargs="+", help="CTXR files or folders (searched recursively)")
+    transcode.add_argument("--to", choices=("pc", "ps3"), required=True, help="Platform to transcode to")
+    transcode.add_argument("--templates", required=True,
+                           help="Original CTXR (or .ctxrmeta sidecar for PC) of the target platform, or a folder "
+                                "of them mirroring the source folders")
+    transcode.add_argument("--output", required=True, help="Output folder, mirroring the source folders")
+    transcode.add_argument("--swizzle", choices=("auto", "yes", "no"), default="auto",
+                           help="Whether the PS3 data is (to be) Morton swizzled (default: detect for PS3 input, "
+                                "follow the template for PS3 output)")
+    add_walk_arguments(transcode)
+    add_schedule_arguments(transcode)
+    add_journal_arguments(transcode)
+    add_pipeline_arguments(transcode)
+    transcode.set_defaults(func=cmd_transcode)
+
+    diff = subparsers.add_parser("diff", help="Compare two texture trees (e.g. game versions) by content hash")
+    diff.add_argument("old", help="Folder of the old version")
+    diff.add_argument("new", help="Folder of the new version")
+    diff.add_argument("--db", default=DEFAULT_INDEX_PATH,
+                      help=f"Index keeping the hashes for the next run (default: {DEFAULT_INDEX_PATH})")
+    diff.add_argument("--workers", type=int, default=8, help="Parallel hashing threads (default: 8)")
+    diff.add_argument("--levels", action="store_true", help="Show which mip levels of each modified texture changed")
+    diff.add_argument("--json", metavar="PATH", help="Also write the full result as JSON")
+    add_walk_arguments(diff)
+    diff.set_defaults(func=cmd_diff)
+
+    from plan_module import PLAN_JOBS, DEFAULT_RATES_PATH
+    from pipeline_module import DEFAULT_CONVERT_WORKERS
+    plan = subparsers.add_parser("plan", help="Dry run: estimate a batch's output size and time, list predicted failures")
+    plan.add_argument("job", choices=PLAN_JOBS, help="Batch to plan: export (CTXR to images) or import (images to CTXR)")
+    plan.add_argument("paths", nargs="*", help="CTXR files (export) or images (import), or folders of them")
+    plan.add_argument("--formats", default="png", help="Export formats, as for export (default: png)")
+    plan.add_argument("--tga-rle", action="store_true", help="Plan RLE compressed TGA output")
+    plan.add_argument("--tga-mipmaps", action="store_true", help="Plan a TGA per mip level")
+    plan.add_argument("--no-sidecar", action="store_true", help="Plan an export without .ctxrmeta sidecars")
+    plan.add_argument("--templates",
+                      help="Import: folder of original CTXRs for images without a sidecar (same relative paths)")
+    plan.add_argument("--output", help="Import: output folder, as for batch-import")
+    plan.add_argument("--in-place", action="store_true",
+                      help="Import: without --output, allow replacing the CTXRs next to the images, as for batch-import")
+    plan.add_argument("--rates", default=DEFAULT_RATES_PATH,
+                      help=f"Conversion rates saved by 'python benchmark.py rates' (default: {DEFAULT_RATES_PATH})")
+    plan.add_argument("--converters", type=int, default=DEFAULT_CONVERT_WORKERS,
+                      help="Converter threads the wall time estimate assumes")
+    add_index_arguments(plan)
+    add_walk_arguments(plan)
+    plan.set_defaults(func=cmd_plan)
+
+    watch = subparsers.add_parser("watch", help="Re-import edited images automatically as they are saved")
+    watch.add_argument("source", help="Folder the edited PNG/TGA/DDS files are saved to")
+    watch.add_argument("--templates", required=True, help="Folder with the original CTXR files")
+    watch.add_argument("--target", required=True, help="Folder the CTXR files are written to (e.g. the mod folder)")
+    watch.add_argument("--full", action="store_true", help="Always do full imports instead of patching")
+    watch.add_argument("--interval", type=float, default=0.25, help="Seconds between folder scans (default: 0.25)")
+    watch.add_argument("--debounce", type=float, default=0.5,
+                       help="Seconds a file must stay unchanged before it is imported (default: 0.5)")
+    watch.set_defaults(func=cmd_watch)
+
+    verify = subparsers.add_parser("verify", help="Verify CTXR -> DDS -> CTXR round trips")
+    verify.add_argument("paths", nargs="*", help="CTXR files or folders (searched recursively)")
+    add_index_arguments(verify)
+    add_walk_arguments(verify)
+    verify.add_argument("--mode", choices=["all", "gui", "batch"], default="all",
+                        help="Round-trip path to check (default: all)")
+    verify.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per CPU, 1 disables the pool)")
+    verify.add_argument("--metrics", action="store_true",
+                        help="Measure the quality of round trips that aren't byte-identical and pass "
+                             "those within the thresholds")
+    add_threshold_arguments(verify)
+    verify.set_defaults(func=cmd_verify)
+
+    qa = subparsers.add_parser("qa", help="Compare re-encoded CTXR files with their originals (PSNR, SSIM, ...)")
+    qa.add_argument("paths", nargs="+", help="Original CTXR files or folders (searched recursively)")
+    qa.add_argument("--against", required=True,
+                    help="Folder with the re-encoded files, under the same relative paths")
+    qa.add_argument("--all", action="store_true", help="Also print the metrics of files that pass")
+    qa.add_argument("--workers", type=int, default=None,
+                    help="Worker processes (default: one per CPU, 1 disables the pool)")
+    add_threshold_arguments(qa)
+    qa.set_defaults(func=cmd_qa)
+
+    from analyze_module import DEFAULT_MIN_PSNR, DEFAULT_MAX_GRADIENT_DAMAGE
+    analyze = subparsers.add_parser("analyze", help="Recommend uncompressed BGRA, DXT1 or DXT5 for each texture")
+    analyze.add_argument("paths", nargs="+", help="CTXR, PNG, TGA or DDS files or folders (searched recursively)")
+    analyze.add_argument("--all", action="store_true",
+                         help="Also print the files already in their recommended format")
+    analyze.add_argument("--workers", type=int, default=None,
+                         help="Worker processes (default: one per CPU, 1 disables the pool)")
+    analyze.add_argument("--min-psnr", type=float, default=DEFAULT_MIN_PSNR,
+                         help=f"Lowest PSNR in dB a compressed format may have (default: {DEFAULT_MIN_PSNR})")
+    analyze.add_argument("--max-gradient-damage", type=float, default=DEFAULT_MAX_GRADIENT_DAMAGE,
+                         help="Highest share of blocks whose gradients a compressed format may band "
+                              f"(default: {DEFAULT_MAX_GRADIENT_DAMAGE})")
+    analyze.add_argument("--json", metavar="PATH", help="Also write every file's analysis as JSON")
+    add_walk_arguments(analyze)
+    analyze.set_defaults(func=cmd_analyze)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    from layout_module import LayoutCache, set_layout_cache
+    set_layout_cache(LayoutCache(None if args.no_layout_cache else args.layout_cache))
+    from cache_module import ConversionCache, set_conversion_cache
+    cache = ConversionCache(None if args.no_cache else args.cache, int(args.cache_size * 1024 ** 2),
+                            args.shared_cache or None)
+    set_conversion_cache(cache)
+    try:
+        return args.func(args)
+    finally:
+        cache.close()
+        if cache.hits or cache.misses:
+            print(cache.format_stats())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,34 @@
+import os
 import struct
 import logging
+from contextlib import contextmanager
+from walker_module import walk_paths
+from layout_module import (get_layout, level_size, layout_fingerprint, get_layout_cache, BLOCK_SIZES,
+                           CTXR_HEADER_SIZE, PS3_HEADER_SIZE, CTXR_FINAL_PADDING)
+
+
+PS3_MAGIC = b'\x02\x00\x01\x01'
+SWITCH_MAGIC = b'RTXT'
+
+# Files that are stored as DXT5 compressed data instead of raw BGRA
+DXT5_FILES = frozenset([
+    "jngl_happa04_alp_ovl.bmp.ctxr",
+    "jngl_happa04_alp_ovl_mip16000.bmp.ctxr",
+    "jngl_happa04_alp_ovl_mip16000.bmp_c82c791b86086ed52d483520273e9b5b.ctxr",
+    "jngl_happa04_alp_ovl_mip8000.bmp.ctxr",
+    "jngl_happa05_alp_ovl_mip4000.bmp.ctxr",
+    "jngl_taki_eda_12_alp_ovl_mip8000.bmp.ctxr",
+    "jngl_taki_eda_17_alp_ovl_mip4000.bmp.ctxr",
+    "s001a_enkeil_rep.bmp.ctxr",
+    "s001a_happa05_alp_ovl_mip8000.bmp.ctxr",
+    "s001a_soil01_rep_mip8000.bmp.ctxr",
+    "s001a_enkei1_rep.bmp.ctxr",
+    "v000a_kinokatamari_a01_alp_ovl_rep.bmp.ctxr",
+    "v000a_kinokatamari_a01_alp_ovl_rep.bmp_86187137555744c273e17dd4a431d1a2.ctxr",
+    "v000a_kinokatamari_a02_rep.bmp.ctxr",
+    "v000a_kinokatamari_a03_alp_ovl_rep.bmp.ctxr",
+    "v000a_kinokatamari_a03_alp_ovl_rep.bmp_d9ec09aa2448dfac3e0b72eca57e0034.ctxr",
+])
 
 
 class CTXRError(Exception):
@@ -7,10 +36,20 @@ class CTXRError(Exception):
     pass
 
 
-def read_padding_and_size(file_obj, expected_mip_size, max_pad=64, is_compressed=False, compression_format=None):
+def _read_or_skip(file_obj, size, skip_data):
+    """Read size bytes, or seek past them and return None when skip_data is set"""
+    if skip_data:
+        file_obj.seek(size, 1)
+        return None
+    return file_obj.read(size)
+
+
+def read_padding_and_size(file_obj, expected_mip_size, max_pad=64, is_compressed=False, compression_format=None,
+                          skip_data=False):
     """
     Smart reader that handles padding alignment and size fields.
     For DXT5: Scans for data but aligns down to nearest block (16 bytes) to capture leading zeros.
+    With skip_data the pixel data is seeked over instead of read and returned as None.
     """
     start_pos = file_obj.tell()
     
@@ -76,7 +115,7 @@ def read_padding_and_size(file_obj, expected_mip_size, max_pad=64, is_compressed
                 mip_size = size_be
 
         # 4. Read Data
-        mip_data = file_obj.read(mip_size)
+        mip_data = _read_or_skip(file_obj, mip_size, skip_data)
         return b"", mip_size, mip_data
 
     # --- STANDARD UNCOMPRESSED HANDLING (Original Logic) ---
@@ -92,25 +131,34 @@ def read_padding_and_size(file_obj, expected_mip_size, max_pad=64, is_compressed
                 file_obj.seek(pos)
                 break
                 
-        # Read size field
-        size_bytes = file_obj.read(4)
-        if len(size_bytes) != 4: raise CTXRError("End of file reading size")
-        size_field = struct.unpack('>I', size_bytes)[0]
-        
-        # Verify size
+        # Read size field. Big-endian sizes start with zero bytes, which the scan
+        # above takes for padding, so step back into the padding to find it.
+        size_pos = file_obj.tell()
         tolerance = expected_mip_size * 0.1
-        if (expected_mip_size - tolerance) <= size_field <= (expected_mip_size + tolerance):
-            mip_size = size_field
-        else:
+        mip_size = None
+        for back in range(min(3, len(padding)) + 1):
+            file_obj.seek(size_pos - back)
+            size_bytes = file_obj.read(4)
+            if len(size_bytes) != 4: raise CTXRError("End of file reading size")
+            size_field = struct.unpack('>I', size_bytes)[0]
+
+            # Verify size
+            if (expected_mip_size - tolerance) <= size_field <= (expected_mip_size + tolerance):
+                mip_size = size_field
+                padding = padding[:len(padding) - back]
+                break
+        if mip_size is None:
             # Fallback if size field is missing/invalid
-            file_obj.seek(file_obj.tell() - 4)
+            file_obj.seek(size_pos)
             mip_size = expected_mip_size
-            
-        mip_data = file_obj.read(mip_size)
+
+
+        mip_data = _read_or_skip(file_obj, mip_size, skip_data)
         return padding, mip_size, mip_data
 
 
-def parse_mipmap_info(file_obj, mipmap_count, width, height, is_compressed=False, compression_format=None):
+def parse_mipmap_info(file_obj, mipmap_count, width, height, is_compressed=False, compression_format=None,
+                      skip_data=False):
     """
     For each mipmap level (from level 1 to mipmap_count-1), compute the expected mipmap dimensions,
     then dynamically read padding bytes (using read_padding_and_size) until the next 4-byte integer
@@ -122,39 +170,307 @@ def parse_mipmap_info(file_obj, mipmap_count, width, height, is_compressed=False
     Each entry in list_of_mipmap_info is a dict with keys:
       "padding": the bytes read as padding,
       "size": the mipmap size (as an integer),
-      "data": the mipmap pixel data.
+      "data": the mipmap pixel data,
+      "start": the file offset where this level's padding begins,
+      "offset": the file offset of the mipmap pixel data.
     The final_padding is the remaining padding after the last mipmap (expected to be 24 bytes).
+    
+    With skip_data the pixel data is seeked over rather than read ("data" is None), which
+    makes it cheap to discover the padding layout of a file.
     """
     mip_info = []
+    layout = get_layout(compression_format if is_compressed and compression_format in BLOCK_SIZES else 'BGRA',
+                        width, height, mipmap_count)
     for level in range(1, mipmap_count):
-        mip_w = max(1, width >> level)
-        mip_h = max(1, height >> level)
-        
-        if is_compressed and compression_format == 'DXT5':
-            # DXT5: 16 bytes per 4x4 block
-            # Round up dimensions to multiple of 4
-            blocks_w = max(1, (mip_w + 3) // 4)
-            blocks_h = max(1, (mip_h + 3) // 4)
-            expected_size = blocks_w * blocks_h * 16
-        else:
-            # Uncompressed RGBA: 4 bytes per pixel
-            expected_size = mip_w * mip_h * 4
-            
+        mip = layout.levels[level]
+        mip_w, mip_h, expected_size = mip.width, mip.height, mip.size
+
         logging.info(f"[Level {level}] Expected dimensions: {mip_w}x{mip_h} (expected {expected_size} bytes)")
         
         try:
+            start = file_obj.tell()
             pad, mip_size, mip_data = read_padding_and_size(
                 file_obj, 
                 expected_size, 
                 is_compressed=is_compressed, 
-                compression_format=compression_format
+                compression_format=compression_format,
+                skip_data=skip_data
             )
-            logging.info(f"[Level {level}] Read {len(pad)} padding bytes; size field: {mip_size} bytes; pixel data: {len(mip_data)} bytes")
-            mip_info.append({"padding": pad, "size": mip_size, "data": mip_data})
+            data_length = mip_size if mip_data is None else len(mip_data)
+            logging.info(f"[Level {level}] Read {len(pad)} padding bytes; size field: {mip_size} bytes; pixel data: {data_length} bytes")
+            offset = file_obj.tell() - data_length
+            mip_info.append({"padding": pad, "size": mip_size, "data": mip_data,
+                             "start": start, "offset": offset})
         except CTXRError as e:
             logging.error(f"Error parsing mipmap level {level}: {e}")
             raise
             
     final_padding = file_obj.read(24)
     logging.info(f"[Final] Read final padding of {len(final_padding)} bytes")
-    return mip_info, final_padding
\ No newline at end of file
+    return mip_info, final_padding
+
+
+def _expected_gap(level_entry):
+    """Bytes expected between a cached level's start and its data: zeros, then the size field"""
+    start, offset, size, padding_length, size_field = level_entry
+    if size_field:
+        return b'\x00' * (offset - start - 4) + struct.pack('>I', size)
+    return b'\x00' * (offset - start)
+
+
+def _apply_cached_layout(file_obj, entry, skip_data):
+    """
+    Read a mip chain at the offsets of a cached layout, checking the file size and
+    that every gap holds the expected zeros and size field. Returns
+    (mip_info, final_padding) like parse_mipmap_info, or None if the file doesn't match.
+    """
+    chain_start = file_obj.tell()
+    if entry["levels"] and entry["levels"][0][0] != chain_start:
+        return None
+    file_obj.seek(0, 2)
+    if file_obj.tell() != entry["file_size"]:
+        file_obj.seek(chain_start)
+        return None
+
+    mip_info = []
+    for level_entry in entry["levels"]:
+        start, offset, size, padding_length, _ = level_entry
+        file_obj.seek(start)
+        if file_obj.read(offset - start) != _expected_gap(level_entry):
+            file_obj.seek(chain_start)
+            return None
+        mip_data = _read_or_skip(file_obj, size, skip_data)
+        mip_info.append({"padding": b'\x00' * padding_length, "size": size, "data": mip_data,
+                         "start": start, "offset": offset})
+    final_padding = file_obj.read(entry["final_padding"])
+    return mip_info, final_padding
+
+
+def _layout_entry(file_obj, mip_info, final_padding, has_size_fields):
+    """
+    Layout cache entry for a freshly scanned mip chain, or None if the scan wasn't
+    clean (a size field missing, or the chain not ending with the final padding at EOF).
+    """
+    end = file_obj.tell()
+    if len(final_padding) != CTXR_FINAL_PADDING or file_obj.read(1):
+        file_obj.seek(end)
+        return None
+
+    levels = []
+    for mip in mip_info:
+        file_obj.seek(mip["start"])
+        gap = file_obj.read(mip["offset"] - mip["start"])
+        size_field = len(gap) >= 4 and gap[-4:] == struct.pack('>I', mip["size"])
+        if has_size_fields and not size_field:
+            file_obj.seek(end)
+            return None
+        levels.append([mip["start"], mip["offset"], mip["size"], len(mip["padding"]), size_field])
+        if gap != _expected_gap(levels[-1]):
+            file_obj.seek(end)
+            return None
+    file_obj.seek(end)
+    return {"levels": levels, "final_padding": len(final_padding), "file_size": end}
+
+
+def read_mip_chain(file_obj, header, mipmap_count, width, height, is_compressed=False, compression_format=None,
+                   skip_data=False):
+    """
+    parse_mipmap_info with the padding layout taken from the layout cache.
+
+    Files whose header fingerprint was seen before are read at the cached offsets
+    after a cheap check of the gaps between levels; otherwise (or if the check
+    fails) the chain is scanned and, if the scan was clean, its layout is cached.
+    """
+    fmt = compression_format if is_compressed and compression_format in BLOCK_SIZES else 'BGRA'
+    cache = get_layout_cache()
+    fingerprint = layout_fingerprint(header, fmt)
+    entry = cache.get(fingerprint)
+    if entry is not None:
+        result = _apply_cached_layout(file_obj, entry, skip_data)
+        if result is not None:
+            return result
+        logging.info("Cached layout does not match this file, scanning the mip chain")
+
+    mip_info, final_padding = parse_mipmap_info(
+        file_obj, mipmap_count, width, height,
+        is_compressed=is_compressed, compression_format=compression_format, skip_data=skip_data
+    )
+    if entry is None:
+        new_entry = _layout_entry(file_obj, mip_info, final_padding, has_size_fields=fmt not in BLOCK_SIZES)
+        if new_entry is not None:
+            cache.put(fingerprint, new_entry)
+    return mip_info, final_padding
+
+
+@contextmanager
+def atomic_open(path):
+    """
+    Binary file object writing to a temporary file in path's folder that
+    replaces path when the block exits cleanly, so readers never see a partial file.
+    """
+    import threading
+
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path, data):
+    """Write data to path via a temporary file in the same folder, so readers never see a partial file"""
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+def iter_ctxr_files(paths, include=None, exclude=None):
+    """Yield every .ctxr file in the given files and (recursively) directories, see walker_module"""
+    for item in walk_paths(paths, ('.ctxr',), include, exclude):
+        yield item.path
+
+
+def parse_header_info(header):
+    """
+    Decode the header fields of a PC, PS3 or Switch CTXR without touching the pixel data.
+
+    header is the first CTXR_HEADER_SIZE (or fewer) bytes of the file.
+    Returns a dict with "platform", "width", "height", "mipmap_count",
+    "data_offset" and "pixel_data_length".
+    """
+    if header[:4] == PS3_MAGIC:
+        if len(header) < PS3_HEADER_SIZE:
+            raise CTXRError("File is too small to contain a PS3 CTXR header")
+        return {
+            "platform": "ps3",
+            "width": struct.unpack_from('>H', header, 44)[0],
+            "height": struct.unpack_from('>H', header, 46)[0],
+            "mipmap_count": struct.unpack_from('>B', header, 37)[0],
+            "data_offset": struct.unpack_from('>I', header, 16)[0],
+            "pixel_data_length": struct.unpack_from('>I', header, 20)[0],
+        }
+    if header[:4] == SWITCH_MAGIC:
+        # Switch headers are little-endian; only the basic fields are known so far
+        if len(header) < 0x14:
+            raise CTXRError("File is too small to contain a Switch CTXR header")
+        return {
+            "platform": "switch",
+            "width": struct.unpack_from('<I', header, 8)[0],
+            "height": struct.unpack_from('<I', header, 12)[0],
+            "mipmap_count": struct.unpack_from('<I', header, 16)[0],
+            "data_offset": None,
+            "pixel_data_length": None,
+        }
+    if len(header) < CTXR_HEADER_SIZE:
+        raise CTXRError("File is too small to contain a CTXR header")
+    return {
+        "platform": "pc",
+        "width": struct.unpack_from('>H', header, 8)[0],
+        "height": struct.unpack_from('>H', header, 10)[0],
+        "mipmap_count": struct.unpack_from('>B', header, 0x26)[0],
+        "data_offset": CTXR_HEADER_SIZE,
+        "pixel_data_length": struct.unpack_from('>I', header, 0x80)[0],
+    }
+
+
+def guess_format(info, file_name=""):
+    """
+    Classify a texture's pixel format from its header fields (see parse_header_info).
+
+    PC files listed in DXT5_FILES are DXT5; otherwise the main level length is
+    matched against the uncompressed and block-compressed sizes. Returns "BGRA",
+    "DXT5", "DXT1", "RGBA" (PS3) or "unknown".
+    """
+    if info["platform"] == "ps3":
+        return "RGBA"
+    if info["platform"] != "pc":
+        return "unknown"
+    if file_name in DXT5_FILES:
+        return "DXT5"
+    width, height, length = info["width"], info["height"], info["pixel_data_length"]
+    for fmt in ("BGRA", "DXT5", "DXT1"):
+        if length == level_size(width, height, fmt):
+            return fmt
+    return "unknown"
+
+
+def read_ctxr(file_obj, file_name=""):
+    """
+    Read a complete PC CTXR file from an open binary file object.
+
+    The DXT5 decision is made from file_name, the same way the GUI does it.
+    Returns a dict with keys "header", "width", "height", "mipmap_count",
+    "pixel_data", "mipmap_info", "final_padding" and "is_dxt5".
+    """
+    header = file_obj.read(CTXR_HEADER_SIZE)
+    if len(header) != CTXR_HEADER_SIZE:
+        raise CTXRError("File is too small to contain a CTXR header")
+    mipmap_count = struct.unpack_from('>B', header, 0x26)[0]
+    pixel_data_length = struct.unpack_from('>I', header, 0x80)[0]
+    width = struct.unpack_from('>H', header, 8)[0]
+    height = struct.unpack_from('>H', header, 10)[0]
+    pixel_data = file_obj.read(pixel_data_length)
+    logging.info(f"Header: {width}x{height} main level, pixel data length: {pixel_data_length}")
+    logging.info(f"Mipmap count from header: {mipmap_count}")
+
+    is_dxt5 = file_name in DXT5_FILES
+    if mipmap_count > 1:
+        compression_format = 'DXT5' if is_dxt5 else 'UNCOMPRESSED'
+        logging.info(f"File format: {compression_format}")
+        mipmap_info, final_padding = read_mip_chain(
+            file_obj, header, mipmap_count, width, height,
+            is_compressed=is_dxt5,
+            compression_format=compression_format
+        )
+    else:
+        mipmap_info, final_padding = [], b""
+
+    return {
+        "header": header,
+        "width": width,
+        "height": height,
+        "mipmap_count": mipmap_count,
+        "pixel_data": pixel_data,
+        "mipmap_info": mipmap_info,
+        "final_padding": final_padding,
+        "is_dxt5": is_dxt5,
+    }
+
+
+def patch_ctxr_header(ctxr_header, width, height, mipmap_count, main_length):
+    """Copy of a 132-byte CTXR header with new dimensions, mip count and main level length"""
+    header = bytearray(ctxr_header)
+    struct.pack_into('>H', header, 8, width)
+    struct.pack_into('>H', header, 10, height)
+    struct.pack_into('>I', header, 0x80, main_length)
+    struct.pack_into('>B', header, 0x26, mipmap_count)
+    return header
+
+
+def build_ctxr(ctxr_header, width, height, mipmap_count, main_data, mip_datas,
+               mipmap_info, final_padding, size_fields=True):
+    """
+    Assemble CTXR file bytes from a header template and new pixel data.
+
+    The per-level padding from mipmap_info and the final padding are written back
+    exactly as they were read. size_fields controls whether a big-endian size
+    field precedes each mipmap (uncompressed files) or not (DXT5).
+    Returns (header, data) where header is the updated 132-byte header.
+    """
+    header = patch_ctxr_header(ctxr_header, width, height, mipmap_count, len(main_data))
+    out = bytearray(header)
+    out += main_data
+    if mipmap_count > 1:
+        for i, new_data in enumerate(mip_datas):
+            # Write the original padding exactly.
+            out += mipmap_info[i]["padding"]
+            if size_fields:
+                out += struct.pack('>I', len(new_data))
+            out += new_data
+    out += final_padding
+    return header, bytes(out)
@@ -1,9 +1,11 @@
 # dds_module.py
 import struct
-import numpy as np
-from PIL import Image
 import logging
 import os
+import io
+from functools import lru_cache
+from layout_module import get_layout, mip_dimensions, BLOCK_SIZES, DDS_HEADER_SIZE
+from walker_module import walk_files, mirror_path
 
 
 class DDSError(Exception):
@@ -26,17 +28,24 @@ def next_power_of_two(n):
     return power
 
 
+module_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+@lru_cache(maxsize=None)
+def _read_dds_header_template(dds_header_file):
+    with open(os.path.join(module_dir, dds_header_file), "rb") as header_file:
+        return header_file.read()
+
+
+def load_dds_header_template(dxt5=False):
+    """Return a mutable copy of the 128-byte DDS header template (read once, on first use)"""
+    dds_header_file = "DDS_Header_DXT5.bin" if dxt5 else "DDS_Header.bin"
+    return bytearray(_read_dds_header_template(dds_header_file))
+
+
 def calculate_mipmap_sizes(width, height, mipmap_count):
     """Calculate the sizes of all mipmap levels"""
-    sizes = []
-    curr_w, curr_h = width, height
-    
-    for i in range(mipmap_count):
-        sizes.append((curr_w, curr_h))
-        curr_w = max(1, curr_w // 2)
-        curr_h = max(1, curr_h // 2)
-    
-    return sizes
+    return [(level.width, level.height) for level in get_layout("BGRA", width, height, mipmap_count).levels]
 
 
 def create_dds_header(width, height, mipmap_count, format_type="DXT1"):
@@ -53,19 +62,22 @@ def create_dds_header(width, height, mipmap_count, format_type="DXT1"):
     flags = 0x1007  # DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT
     if mipmap_count > 1:
         flags |= 0x20000  # DDSD_MIPMAPCOUNT
+    if format_type in ["DXT1", "DXT3", "DXT5"]:
+        flags |= 0x80000  # DDSD_LINEARSIZE
+    else:
+        flags |= 0x8  # DDSD_PITCH
     struct.pack_into('<I', header, 8, flags)
     
     # Height and width
     struct.pack_into('<I', header, 12, height)
     struct.pack_into('<I', header, 16, width)
     
-    # Pitch/Linear size (for uncompressed)
+    # Linear size of the main level (compressed) or pitch (uncompressed)
     if format_type in ["DXT1", "DXT3", "DXT5"]:
         # Compressed format
-        pitch = max(1, ((width + 3) // 4)) * 8  # DXT1
-        if format_type in ["DXT3", "DXT5"]:
-            pitch = max(1, ((width + 3) // 4)) * 16
-        struct.pack_into('<I', header, 20, pitch)
+        block_size = 8 if format_type == "DXT1" else 16
+        linear_size = max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * block_size
+        struct.pack_into('<I', header, 20, linear_size)
     else:
         # Uncompressed format
         struct.pack_into('<I', header, 20, width * 4)  # 32-bit RGBA
@@ -76,27 +88,15 @@ def create_dds_header(width, height, mipmap_count, format_type="DXT1"):
     # Mipmap count
     struct.pack_into('<I', header, 28, mipmap_count)
     
-    # Reserved
-    struct.pack_into('<I', header, 32, 0)
-    struct.pack_into('<I', header, 36, 0)
-    struct.pack_into('<I', header, 40, 0)
-    struct.pack_into('<I', header, 44, 0)
-    struct.pack_into('<I', header, 48, 0)
-    struct.pack_into('<I', header, 52, 0)
-    struct.pack_into('<I', header, 56, 0)
-    struct.pack_into('<I', header, 60, 0)
-    struct.pack_into('<I', header, 64, 0)
-    struct.pack_into('<I', header, 68, 0)
-    struct.pack_into('<I', header, 72, 0)
-    struct.pack_into('<I', header, 76, 0)
+    # Reserved (offsets 32-75 are left zero)
     
     # Pixel format
     pixel_format_size = 32
-    struct.pack_into('<I', header, 80, pixel_format_size)
+    struct.pack_into('<I', header, 76, pixel_format_size)
     
     if format_type in ["DXT1", "DXT3", "DXT5"]:
         # Compressed format flags
-        struct.pack_into('<I', header, 84, 0x4)  # DDPF_FOURCC
+        struct.pack_into('<I', header, 80, 0x4)  # DDPF_FOURCC
         
         # FourCC code
         if format_type == "DXT1":
@@ -105,44 +105,43 @@ def create_dds_header(width, height, mipmap_count, format_type="DXT1"):
             fourcc = b'DXT3'
         elif format_type == "DXT5":
             fourcc = b'DXT5'
-        header[88:92] = fourcc
+        header[84:88] = fourcc
         
-        # RGB bit counts (unused for compressed)
-        struct.pack_into('<I', header, 92, 0)
-        struct.pack_into('<I', header, 96, 0)
-        struct.pack_into('<I', header, 100, 0)
-        struct.pack_into('<I', header, 104, 0)
+        # RGB bit count and masks (unused for compressed, left zero)
     else:
         # Uncompressed RGBA format
-        struct.pack_into('<I', header, 84, 0x41)  # DDPF_RGB | DDPF_ALPHAPIXELS
+        struct.pack_into('<I', header, 80, 0x41)  # DDPF_RGB | DDPF_ALPHAPIXELS
         
         # RGB bit counts
-        struct.pack_into('<I', header, 92, 32)  # 32 bits per pixel
+        struct.pack_into('<I', header, 88, 32)  # 32 bits per pixel
         
         # RGB masks
-        struct.pack_into('<I', header, 96, 0x000000FF)  # R mask
-        struct.pack_into('<I', header, 100, 0x0000FF00)  # G mask
-        struct.pack_into('<I', header, 104, 0x00FF0000)  # B mask
-        struct.pack_into('<I', header, 108, 0xFF000000)  # A mask
+        struct.pack_into('<I', header, 92, 0x000000FF)  # R mask
+        struct.pack_into('<I', header, 96, 0x0000FF00)  # G mask
+        struct.pack_into('<I', header, 100, 0x00FF0000)  # B mask
+        struct.pack_into('<I', header, 104, 0xFF000000)  # A mask
     
     # Caps
     caps = 0x1000  # DDSCAPS_TEXTURE
     if mipmap_count > 1:
-        caps |= 0x400000  # DDSCAPS_MIPMAP
-    struct.pack_into('<I', header, 112, caps)
-    
-    # Caps2 (unused for 2D textures)
-    struct.pack_into('<I', header, 116, 0)
+        caps |= 0x400008  # DDSCAPS_MIPMAP | DDSCAPS_COMPLEX
+    struct.pack_into('<I', header, 108, caps)
     
-    # Caps3 and Caps4 (unused)
-    struct.pack_into('<I', header, 120, 0)
-    struct.pack_into('<I', header, 124, 0)
+    # Caps2, Caps3, Caps4 and the last reserved field (offsets 112-127) are left zero
     
     return header
 
 
 def ctxr_to_dds(ctxr_file_path, dds_file_path, ctxr_header):
-    """Convert CTXR to DDS with enhanced NPOT support"""
+    """
+    Convert CTXR to DDS with enhanced NPOT support. Power-of-2 textures are
+    written in the format analyze_module recommends for them (DXT1, DXT5 or
+    uncompressed).
+    """
+    import numpy as np
+    from PIL import Image
+    from analyze_module import encode_bc
+
     try:
         # Extract width, height, and mipmap count from the CTXR header
         width = struct.unpack_from('>H', ctxr_header, 8)[0]
@@ -155,48 +154,47 @@ def ctxr_to_dds(ctxr_file_path, dds_file_path, ctxr_header):
         is_pot_width = is_power_of_two(width)
         is_pot_height = is_power_of_two(height)
         
-        if not (is_pot_width and is_pot_height):
-            logging.warning(f"NPOT texture detected: {width}x{height}")
-            # For NPOT textures, we'll use uncompressed format
-            format_type = "RGBA"
-        else:
-            # Use DXT1 for power-of-2 textures
-            format_type = "DXT1"
-        
         # Read the pixel data
         with open(ctxr_file_path, 'rb') as file:
             file.seek(132)  # Skip the CTXR header
             pixel_data = file.read()
         
-        # Convert pixel data to image
+        # Convert pixel data to image (PIL reads the BGRA data as RGBA, so R and B are swapped)
         image = Image.frombytes('RGBA', (width, height), pixel_data)
         
+        if not (is_pot_width and is_pot_height):
+            logging.warning(f"NPOT texture detected: {width}x{height}")
+            # For NPOT textures, we'll use uncompressed format
+            format_type = "RGBA"
+        else:
+            # Power-of-2 textures get the format recommended for their content
+            from analyze_module import analyze_pixels, recommend_format
+            format_type, reason = recommend_format(analyze_pixels(np.asarray(image)[..., [2, 1, 0, 3]]))
+            if format_type == "BGRA":
+                format_type = "RGBA"
+            logging.info(f"Using {format_type}: {reason}")
+        
         # Generate mipmaps if needed
         mipmaps = [image]
-        if mipmap_count > 1:
-            curr_w, curr_h = width, height
-            for i in range(1, mipmap_count):
-                curr_w = max(1, curr_w // 2)
-                curr_h = max(1, curr_h // 2)
-                mip_image = image.resize((curr_w, curr_h), Image.LANCZOS)
-                mipmaps.append(mip_image)
-                logging.info(f"Generated mipmap {i}: {curr_w}x{curr_h}")
+        for i in range(1, mipmap_count):
+            mip_w, mip_h = mip_dimensions(width, height, i)
+            mipmaps.append(image.resize((mip_w, mip_h), Image.LANCZOS))
+            logging.info(f"Generated mipmap {i}: {mip_w}x{mip_h}")
         
         # Create DDS header
         dds_header = create_dds_header(width, height, mipmap_count, format_type)
         
         # Write DDS file
-        with open(dds_file_path, 'wb') as f:
+        from ctxr_utils import atomic_open
+        with atomic_open(dds_file_path) as f:
             f.write(dds_header)
             
             for mip_image in mipmaps:
                 if format_type == "RGBA":
-                    # Uncompressed RGBA
+                    # Uncompressed RGBA (swapping back gives the RGBA order of the header masks)
                     mip_data = mip_image.tobytes("raw", "BGRA")
                 else:
-                    # For compressed formats, we'd need a compression library
-                    # For now, use uncompressed
-                    mip_data = mip_image.tobytes("raw", "BGRA")
+                    mip_data = encode_bc(np.asarray(mip_image)[..., [2, 1, 0, 3]], format_type)
                 
                 # Ensure 4-byte alignment
                 if len(mip_data) % 4 != 0:
@@ -217,162 +215,201 @@ def dds_to_ctxr(dds_file_path, ctxr_file_path, ctxr_header_template, original_ct
     """Convert DDS to CTXR with DXT5 compression support"""
     try:
         with open(dds_file_path, 'rb') as f:
-            # Read DDS header
-            magic = f.read(4)
-            if magic != b'DDS ':
-                raise DDSError("Invalid DDS file: missing magic number")
-            
-            header_size = struct.unpack('<I', f.read(4))[0]
-            if header_size != 124:
-                raise DDSError("Invalid DDS header size")
-            
-            flags = struct.unpack('<I', f.read(4))[0]
-            height = struct.unpack('<I', f.read(4))[0]
-            width = struct.unpack('<I', f.read(4))[0]
-            pitch = struct.unpack('<I', f.read(4))[0]
-            depth = struct.unpack('<I', f.read(4))[0]
-            mipmap_count = struct.unpack('<I', f.read(4))[0]
-            
-            # Skip reserved fields
-            f.read(44)
-            
-            # Read pixel format
-            pixel_format_size = struct.unpack('<I', f.read(4))[0]
-            pixel_format_flags = struct.unpack('<I', f.read(4))[0]
-            fourcc = f.read(4)
-            rgb_bit_count = struct.unpack('<I', f.read(4))[0]
-            r_mask = struct.unpack('<I', f.read(4))[0]
-            g_mask = struct.unpack('<I', f.read(4))[0]
-            b_mask = struct.unpack('<I', f.read(4))[0]
-            a_mask = struct.unpack('<I', f.read(4))[0]
-            
-            # Skip caps (4 DWORDs = 16 bytes)
-            f.read(16)
-            
-            # Skip reserved2 (1 DWORD = 4 bytes) - THIS WAS MISSING!
-            f.read(4)
-            
-            # Now we're at byte 128, start of pixel data
-            
-            # Check if this is a DXT5 compressed file
-            is_dxt5 = (fourcc == b'DXT5')
-            
-            logging.info(f"Converting DDS: {width}x{height}, {mipmap_count} mipmaps, DXT5: {is_dxt5}")
-            
-            if is_dxt5:
-                # DXT5 compressed - read compressed data directly
-                # Calculate main texture compressed size
-                width_blocks = max(1, (width + 3) // 4)
-                height_blocks = max(1, (height + 3) // 4)
-                main_compressed_size = width_blocks * height_blocks * 16
-                
-                # Read main level compressed data
-                pixel_data = f.read(main_compressed_size)
-                
-                # Read mipmaps if present
-                mipmap_data = []
-                if mipmap_count > 1:
-                    for level in range(1, mipmap_count):
-                        mip_w = max(1, width >> level)
-                        mip_h = max(1, height >> level)
-                        mip_blocks_w = max(1, (mip_w + 3) // 4)
-                        mip_blocks_h = max(1, (mip_h + 3) // 4)
-                        mip_compressed_size = mip_blocks_w * mip_blocks_h * 16
-                        mip_data = f.read(mip_compressed_size)
-                        mipmap_data.append(mip_data)
-                
-                # If we have the original CTXR file, read its exact padding structure
-                # This is critical for DXT5 files to maintain proper alignment
-                if original_ctxr_path and os.path.exists(original_ctxr_path):
-                    try:
-                        from ctxr_utils import parse_mipmap_info
-                        with open(original_ctxr_path, 'rb') as orig_f:
-                            orig_header = orig_f.read(132)
-                            orig_mipmap_count = struct.unpack_from('>B', orig_header, 0x26)[0]
-                            orig_pixel_length = struct.unpack_from('>I', orig_header, 0x80)[0]
-                            orig_width = struct.unpack_from('>H', orig_header, 8)[0]
-                            orig_height = struct.unpack_from('>H', orig_header, 10)[0]
-                            
-                            # Skip original pixel data
-                            orig_f.read(orig_pixel_length)
-                            
-                            # Parse original mipmap structure to get padding
-                            if orig_mipmap_count > 1:
-                                orig_mipmap_info, orig_final_padding = parse_mipmap_info(
-                                    orig_f, orig_mipmap_count, orig_width, orig_height,
-                                    is_compressed=True, compression_format='DXT5'
-                                )
-                            else:
-                                orig_mipmap_info = []
-                                orig_final_padding = b'\x00' * 24
-                                
-                        logging.info(f"Using original CTXR padding structure")
-                    except Exception as e:
-                        logging.warning(f"Could not read original padding structure: {e}, using defaults")
-                        orig_mipmap_info = None
-                        orig_final_padding = b'\x00' * 24
-                else:
-                    orig_mipmap_info = None
-                    orig_final_padding = b'\x00' * 24
-                
-                # Prepare CTXR header
-                ctxr_header = bytearray(ctxr_header_template)
-                struct.pack_into('>H', ctxr_header, 8, width)
-                struct.pack_into('>H', ctxr_header, 10, height)
-                struct.pack_into('>B', ctxr_header, 0x26, mipmap_count)
-                struct.pack_into('>I', ctxr_header, 0x80, len(pixel_data))
-                
-                # Write CTXR file with compressed data
-                with open(ctxr_file_path, 'wb') as out_f:
-                    out_f.write(ctxr_header)
-                    out_f.write(pixel_data)
-                    
-                    # Write mipmaps with original padding if available
-                    if mipmap_count > 1:
-                        for idx, mip_data in enumerate(mipmap_data):
-                            # Use original padding if available
-                            if orig_mipmap_info and idx < len(orig_mipmap_info):
-                                padding = orig_mipmap_info[idx]["padding"]
-                            else:
-                                # Default: no padding between DXT5 mipmaps
-                                padding = b''
-                            
-                            out_f.write(padding)
-                            out_f.write(mip_data)
-                        
-                        # Final padding
-                        out_f.write(orig_final_padding)
-                    else:
-                        # No mipmaps
-                        out_f.write(orig_final_padding)
-                
-                logging.info(f"Successfully converted DXT5 DDS to CTXR: {ctxr_file_path}")
-                return True
-            else:
-                # Uncompressed - read all image data
-                image_data = f.read()
-                
-                # Simple conversion: RGBA to BGRA for CTXR
-                image = Image.frombytes('RGBA', (width, height), image_data[:width * height * 4])
-                pixel_data = image.tobytes("raw", "BGRA")
-                
-                # Prepare CTXR header
-                ctxr_header = bytearray(ctxr_header_template)
-                struct.pack_into('>H', ctxr_header, 8, width)
-                struct.pack_into('>H', ctxr_header, 10, height)
-                struct.pack_into('>B', ctxr_header, 0x26, mipmap_count)
-                struct.pack_into('>I', ctxr_header, 0x80, len(pixel_data))
-                
-                # Write CTXR file
-                with open(ctxr_file_path, 'wb') as out_f:
-                    out_f.write(ctxr_header)
-                    out_f.write(pixel_data)
-                    # Add padding
-                    out_f.write(b'\x00' * 32)
-                
-                logging.info(f"Successfully converted uncompressed DDS to CTXR: {ctxr_file_path}")
-                return True
+            dds_data = f.read()
+        
+        # If we have the original CTXR file, its exact padding structure is reused
+        original_ctxr_data = None
+        if original_ctxr_path and os.path.exists(original_ctxr_path):
+            with open(original_ctxr_path, 'rb') as orig_f:
+                original_ctxr_data = orig_f.read()
+        
+        ctxr_data = dds_to_ctxr_bytes(dds_data, ctxr_header_template, original_ctxr_data)
         
+        from ctxr_utils import atomic_write
+        atomic_write(ctxr_file_path, ctxr_data)
+        
+        logging.info(f"Successfully converted DDS to CTXR: {ctxr_file_path}")
+        return True
+        
+    except DDSError:
+        raise
+    except Exception as e:
+        error_msg = f"Error converting DDS to CTXR: {str(e)}"
+        logging.error(error_msg)
+        raise DDSError(error_msg)
+
+
+DX10_HEADER_SIZE = 20
+
+# DX10 extended header DXGI formats that map onto CTXR data
+DXGI_FORMATS = {
+    28: "RGBA",   # R8G8B8A8_UNORM
+    29: "RGBA",   # R8G8B8A8_UNORM_SRGB
+    87: "BGRA",   # B8G8R8A8_UNORM
+    91: "BGRA",   # B8G8R8A8_UNORM_SRGB
+    71: "DXT1",   # BC1_UNORM
+    72: "DXT1",   # BC1_UNORM_SRGB
+    77: "DXT5",   # BC3_UNORM
+    78: "DXT5",   # BC3_UNORM_SRGB
+}
+
+
+def parse_dds_header(dds_data):
+    """
+    Parse a DDS file's header (legacy or DX10 extended); dds_data only needs the
+    first DDS_HEADER_SIZE + DX10_HEADER_SIZE bytes. Returns a dict with "width",
+    "height", "mipmap_count", "format" ("BGRA", "RGBA", "DXT1" or "DXT5") and
+    "data_offset".
+    """
+    if len(dds_data) < DDS_HEADER_SIZE or dds_data[:4] != b'DDS ':
+        raise DDSError("Invalid DDS file: missing magic number")
+    if struct.unpack_from('<I', dds_data, 4)[0] != 124:
+        raise DDSError("Invalid DDS header size")
+
+    height, width = struct.unpack_from('<II', dds_data, 12)
+    mipmap_count = max(1, struct.unpack_from('<I', dds_data, 28)[0])
+    pixel_format_flags = struct.unpack_from('<I', dds_data, 80)[0]
+    fourcc = bytes(dds_data[84:88])
+    rgb_bit_count, r_mask, g_mask, b_mask, a_mask = struct.unpack_from('<5I', dds_data, 88)
+    data_offset = DDS_HEADER_SIZE
+
+    if pixel_format_flags & 0x4 and fourcc == b'DX10':
+        if len(dds_data) < DDS_HEADER_SIZE + DX10_HEADER_SIZE:
+            raise DDSError("Invalid DDS file: truncated DX10 header")
+        dxgi_format = struct.unpack_from('<I', dds_data, DDS_HEADER_SIZE)[0]
+        if dxgi_format not in DXGI_FORMATS:
+            raise DDSError(f"Unsupported DX10 DXGI format {dxgi_format}")
+        fmt = DXGI_FORMATS[dxgi_format]
+        data_offset += DX10_HEADER_SIZE
+    elif pixel_format_flags & 0x4:
+        fmt = fourcc.decode('ascii', 'replace')
+        if fmt not in BLOCK_SIZES:
+            raise DDSError(f"Unsupported DDS compression {fourcc!r}")
+    elif rgb_bit_count == 32 and (r_mask, g_mask, b_mask) == (0x00FF0000, 0x0000FF00, 0x000000FF):
+        fmt = "BGRA"
+    elif rgb_bit_count == 32 and (r_mask, g_mask, b_mask) == (0x000000FF, 0x0000FF00, 0x00FF0000):
+        fmt = "RGBA"
+    else:
+        raise DDSError(f"Unsupported DDS pixel format: {rgb_bit_count} bit, masks "
+                       f"{r_mask:#x}/{g_mask:#x}/{b_mask:#x}/{a_mask:#x}")
+    return {"width": width, "height": height, "mipmap_count": mipmap_count, "format": fmt,
+            "data_offset": data_offset}
+
+
+def parse_dds(dds_data):
+    """
+    Parse a DDS file's header (legacy or DX10 extended) and slice out its mip chain.
+
+    Returns a dict with "width", "height", "mipmap_count", "format" ("BGRA", "RGBA",
+    "DXT1" or "DXT5") and "levels", a list of memoryview slices of dds_data, one per
+    mip level. Levels missing from a truncated file are dropped with a warning.
+    """
+    info = parse_dds_header(dds_data)
+    width, height, mipmap_count, fmt = info["width"], info["height"], info["mipmap_count"], info["format"]
+    data_offset = info["data_offset"]
+
+    view = memoryview(dds_data)
+    levels = []
+    for level in get_layout(fmt, width, height, mipmap_count).levels:
+        offset = level.dds_offset + data_offset - DDS_HEADER_SIZE
+        if offset + level.size > len(view):
+            logging.warning(f"DDS ends after {level.level} of {mipmap_count} mip levels")
+            break
+        levels.append(view[offset:offset + level.size])
+    if not levels:
+        raise DDSError("DDS file is too small for its main level")
+
+    return {"width": width, "height": height, "mipmap_count": len(levels), "format": fmt, "levels": levels}
+
+
+def _rgba_to_bgra(level):
+    # Swap R and B with strided slice copies (no per-pixel Python work)
+    out = bytearray(level)
+    out[0::4] = level[2::4]
+    out[2::4] = level[0::4]
+    return out
+
+
+def dds_levels_to_ctxr(dds, ctxr_header, mipmap_info=None, final_padding=None, max_levels=None):
+    """
+    Build CTXR bytes from a parsed DDS (see parse_dds), copying every mip level across.
+
+    mipmap_info/final_padding come from the original CTXR (read_ctxr or
+    parse_mipmap_info) and supply the padding written between levels; levels beyond
+    the original's are written without padding. max_levels caps the number of levels
+    written. BGRA and block compressed levels are copied as-is; RGBA levels get their
+    R and B channels swapped.
+    Returns (header, data) where header is the updated 132-byte header.
+    """
+    from ctxr_utils import build_ctxr
+
+    fmt = dds["format"]
+    levels = dds["levels"]
+    if max_levels is not None and len(levels) > max_levels:
+        logging.warning(f"DDS has {len(levels)} levels, only the first {max_levels} are used")
+        levels = levels[:max_levels]
+    if fmt == "RGBA":
+        levels = [_rgba_to_bgra(level) for level in levels]
+
+    mipmap_info = list(mipmap_info or [])
+    if len(levels) - 1 > len(mipmap_info):
+        mipmap_info += [{"padding": b""}] * (len(levels) - 1 - len(mipmap_info))
+    if final_padding is None:
+        final_padding = b'\x00' * 24
+
+    logging.info(f"Copying {len(levels)} {fmt} DDS levels into CTXR")
+    return build_ctxr(ctxr_header, dds["width"], dds["height"], len(levels), levels[0], levels[1:],
+                      mipmap_info, final_padding, size_fields=fmt not in BLOCK_SIZES)
+
+
+def dds_to_ctxr_bytes(dds_data, ctxr_header_template, original_ctxr_data=None):
+    """
+    In-memory core of dds_to_ctxr: returns the CTXR file bytes for a DDS file's bytes.
+
+    The DDS's own mip chain is copied across; if the original CTXR is given, its
+    padding between levels (and after the last one) is reused.
+    """
+    try:
+        dds = parse_dds(dds_data)
+        logging.info(f"Converting DDS: {dds['width']}x{dds['height']}, {dds['mipmap_count']} mipmaps, "
+                     f"format {dds['format']}")
+
+        mipmap_info = final_padding = None
+        if original_ctxr_data:
+            try:
+                from ctxr_utils import read_mip_chain, CTXR_HEADER_SIZE
+                with io.BytesIO(original_ctxr_data) as orig_f:
+                    orig_header = orig_f.read(CTXR_HEADER_SIZE)
+                    orig_mipmap_count = struct.unpack_from('>B', orig_header, 0x26)[0]
+                    orig_pixel_length = struct.unpack_from('>I', orig_header, 0x80)[0]
+                    orig_width = struct.unpack_from('>H', orig_header, 8)[0]
+                    orig_height = struct.unpack_from('>H', orig_header, 10)[0]
+                    orig_f.seek(orig_pixel_length, 1)
+
+                    if orig_mipmap_count > 1:
+                        is_compressed = dds["format"] in BLOCK_SIZES
+                        mipmap_info, final_padding = read_mip_chain(
+                            orig_f, orig_header, orig_mipmap_count, orig_width, orig_height,
+                            is_compressed=is_compressed,
+                            compression_format=dds["format"] if is_compressed else 'UNCOMPRESSED',
+                            skip_data=True
+                        )
+                    else:
+                        # Single level files keep whatever trails the main level
+                        mipmap_info, final_padding = [], orig_f.read()
+                logging.info("Using original CTXR padding structure")
+            except Exception as e:
+                logging.warning(f"Could not read original padding structure: {e}, using defaults")
+                mipmap_info = final_padding = None
+        elif dds["mipmap_count"] == 1:
+            # Without a reference, single level files get the usual 32 bytes of trailing padding
+            final_padding = b'\x00' * 32
+
+        _, ctxr_data = dds_levels_to_ctxr(dds, ctxr_header_template, mipmap_info, final_padding)
+        return ctxr_data
+
+    except DDSError:
+        raise
     except Exception as e:
         error_msg = f"Error converting DDS to CTXR: {str(e)}"
         logging.error(error_msg)
@@ -384,17 +421,19 @@ def batch_convert_ctxr_to_dds_enhanced(input_folder, output_folder):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
-    ctxr_files = [f for f in os.listdir(input_folder) if f.endswith('.ctxr')]
+    # The input tree is mirrored under output_folder
+    ctxr_files = list(walk_files(input_folder, ('.ctxr',)))
     total_files = len(ctxr_files)
     success_count = 0
     error_files = []
     
     logging.info(f"Starting batch conversion: {total_files} files")
     
-    for i, filename in enumerate(ctxr_files):
+    for i, item in enumerate(ctxr_files):
+        filename = item.relative
         try:
-            ctxr_path = os.path.join(input_folder, filename)
-            dds_path = os.path.join(output_folder, filename.replace('.ctxr', '.dds'))
+            ctxr_path = item.path
+            dds_path = mirror_path(item, output_folder, '.dds')
             
             # Read CTXR header
             with open(ctxr_path, 'rb') as f:
@@ -420,26 +459,32 @@ def batch_convert_ctxr_to_dds_enhanced(input_folder, output_folder):
     return success_count, error_files
 
 
-def batch_convert_dds_to_ctxr_enhanced(input_folder, output_folder, template_folder):
-    """Enhanced batch conversion from DDS to CTXR"""
+def batch_convert_dds_to_ctxr_enhanced(input_folder, output_folder, template_folder, journal=None):
+    """
+    Enhanced batch conversion from DDS to CTXR. With a BatchJournal, DDS files an
+    earlier run converted are skipped and every outcome is recorded.
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     
-    dds_files = [f for f in os.listdir(input_folder) if f.endswith('.dds')]
+    # Templates and outputs are looked up at the same relative paths as the DDS files
+    dds_files = walk_files(input_folder, ('.dds',))
+    if journal is not None:
+        dds_files = journal.pending(dds_files, key=lambda item: os.path.abspath(item.path))
+    dds_files = list(dds_files)
     total_files = len(dds_files)
     success_count = 0
     error_files = []
     
     logging.info(f"Starting batch conversion: {total_files} files")
     
-    for i, filename in enumerate(dds_files):
+    for i, item in enumerate(dds_files):
+        filename = item.relative
         try:
-            dds_path = os.path.join(input_folder, filename)
-            ctxr_path = os.path.join(output_folder, filename.replace('.dds', '.ctxr'))
+            dds_path = item.path
             
             # Find corresponding template CTXR file
-            template_name = filename.replace('.dds', '.ctxr')
-            template_path = os.path.join(template_folder, template_name)
+            template_path = mirror_path(item, template_folder, '.ctxr', create=False)
             
             if not os.path.exists(template_path):
                 logging.warning(f"No template found for {filename}, skipping")
@@ -448,10 +493,13 @@ def batch_convert_dds_to_ctxr_enhanced(input_folder, output_folder, template_fol
             # Read template header
             with open(template_path, 'rb') as f:
                 template_header = f.read(132)
+            ctxr_path = mirror_path(item, output_folder, '.ctxr')
             
             # Convert file, passing template path for padding preservation
             dds_to_ctxr(dds_path, ctxr_path, template_header, original_ctxr_path=template_path)
             success_count += 1
+            if journal is not None:
+                journal.record(os.path.abspath(dds_path))
             
             logging.info(f"Progress: {i+1}/{total_files} - {filename}")
             
@@ -459,6 +507,8 @@ def batch_convert_dds_to_ctxr_enhanced(input_folder, output_folder, template_fol
             error_msg = f"Failed to convert {filename}: {str(e)}"
             logging.error(error_msg)
             error_files.append((filename, str(e)))
+            if journal is not None:
+                journal.record(os.path.abspath(item.path), e)
     
     logging.info(f"Batch conversion complete: {success_count}/{total_files} successful")
     if error_files:
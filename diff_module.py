@@ -0,0 +1,235 @@
+# diff_module.py
+"""
+Texture-set diff between two game versions.
+
+Every CTXR of both trees is split into its pixel payload (one region per mip
+level) and everything else (header, padding, size fields, final padding), and
+each part is hashed separately. Comparing the trees by relative path then
+tells textures whose pixels changed apart from ones where only the header or
+padding did. The hashes are kept in a "hashes" table of the inventory index,
+so files whose mtime and size are unchanged are never read twice.
+"""
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ctxr_utils import parse_header_info, guess_format, read_mip_chain, CTXR_HEADER_SIZE, CTXRError
+from layout_module import PS3_HEADER_SIZE
+from inventory_module import open_index, DEFAULT_INDEX_PATH
+
+
+HASH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    payload_hash TEXT,
+    header_hash TEXT,
+    level_hashes TEXT,
+    error TEXT
+)
+"""
+
+HASH_COLUMNS = ("path", "mtime_ns", "file_size", "width", "height", "payload_hash", "header_hash",
+                "level_hashes", "error")
+HASH_CHUNK = 1024 ** 2
+DIFF_CATEGORIES = ("added", "removed", "modified", "header_only")
+
+
+def payload_regions(f, file_size, file_name=""):
+    """
+    (width, height, [(offset, length) per stored mip level]) of an open CTXR.
+    Files whose format can't be recognised count as one level running from the
+    end of the header to the end of the file.
+    """
+    header = f.read(max(CTXR_HEADER_SIZE, PS3_HEADER_SIZE))
+    info = parse_header_info(header)
+    width, height = info["width"], info["height"]
+    if info["platform"] == "ps3":
+        from ps3_ctxr_module import ps3_mip_levels
+        return width, height, [(offset, length) for _, _, offset, length in ps3_mip_levels(header, file_size)]
+
+    fmt = guess_format(info, file_name)
+    if info["platform"] != "pc" or fmt not in ("BGRA", "DXT5"):
+        start = min(len(header), file_size)
+        return width, height, [(start, file_size - start)]
+    levels = [(CTXR_HEADER_SIZE, info["pixel_data_length"])]
+    if info["mipmap_count"] > 1:
+        f.seek(CTXR_HEADER_SIZE + info["pixel_data_length"])
+        mip_info, _ = read_mip_chain(f, header[:CTXR_HEADER_SIZE], info["mipmap_count"], width, height,
+                                     is_compressed=(fmt == "DXT5"), compression_format=fmt, skip_data=True)
+        levels += [(mip["offset"], mip["size"]) for mip in mip_info]
+    return width, height, levels
+
+
+def _hash_range(f, digests, start, end):
+    """Feed bytes start..end of f to every digest"""
+    f.seek(start)
+    while start < end:
+        chunk = f.read(min(HASH_CHUNK, end - start))
+        if not chunk:
+            break
+        for digest in digests:
+            digest.update(chunk)
+        start += len(chunk)
+
+
+def hash_file(path):
+    """
+    Hash a CTXR's payload and non-payload bytes separately. Returns a row dict
+    for the hashes table: "payload_hash" over every level, "level_hashes" one
+    per level and "header_hash" over the bytes around them. Unreadable files get
+    a whole-file payload hash and their error recorded.
+    """
+    row = dict.fromkeys(HASH_COLUMNS)
+    row.update(path=os.path.abspath(path), mtime_ns=0, file_size=0)
+    try:
+        stat = os.stat(path)
+        row.update(mtime_ns=stat.st_mtime_ns, file_size=stat.st_size)
+        with open(path, 'rb') as f:
+            try:
+                width, height, levels = payload_regions(f, stat.st_size, os.path.basename(path))
+            except (CTXRError, ValueError) as e:
+                row["error"] = str(e)
+                width, height, levels = None, None, [(0, stat.st_size)]
+
+            payload = hashlib.blake2b(digest_size=16)
+            header = hashlib.blake2b(digest_size=16)
+            level_hashes = []
+            position = 0
+            for offset, length in levels:
+                offset, end = min(offset, stat.st_size), min(offset + length, stat.st_size)
+                _hash_range(f, [header], position, offset)
+                level = hashlib.blake2b(digest_size=16)
+                _hash_range(f, [payload, level], offset, end)
+                level_hashes.append(level.hexdigest())
+                position = max(position, end)
+            _hash_range(f, [header], position, stat.st_size)
+    except OSError as e:
+        row["error"] = str(e)
+        return row
+    row.update(width=width, height=height, payload_hash=payload.hexdigest(), header_hash=header.hexdigest(),
+               level_hashes=json.dumps(level_hashes))
+    return row
+
+
+def update_hashes(roots, index_path=DEFAULT_INDEX_PATH, workers=8, include=None, exclude=None):
+    """
+    Hash every CTXR under each of roots into the index on one thread pool,
+    rehashing only files whose mtime or size changed. Returns one {relative
+    path: row dict} per root.
+    """
+    from walker_module import walk_paths
+
+    conn = open_index(index_path)
+    conn.execute(HASH_SCHEMA)
+    try:
+        known = {row["path"]: dict(row) for row in conn.execute("SELECT * FROM hashes")}
+        trees, to_hash = [], []
+        for root in roots:
+            tree = {}
+            for item in walk_paths([root], ('.ctxr',), include, exclude):
+                path = os.path.abspath(item.path)
+                tree[item.relative] = path
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                row = known.get(path)
+                if row is None or (row["mtime_ns"], row["file_size"]) != (stat.st_mtime_ns, stat.st_size):
+                    to_hash.append(path)
+            trees.append(tree)
+
+        insert = (f"INSERT OR REPLACE INTO hashes ({', '.join(HASH_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' * len(HASH_COLUMNS))})")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch = []
+            for row in executor.map(hash_file, dict.fromkeys(to_hash)):
+                known[row["path"]] = row
+                batch.append(tuple(row[c] for c in HASH_COLUMNS))
+                if len(batch) >= 500:
+                    conn.executemany(insert, batch)
+                    conn.commit()
+                    batch = []
+            conn.executemany(insert, batch)
+        conn.commit()
+    finally:
+        conn.close()
+    logging.info(f"Hashed {len(to_hash)} of {sum(len(tree) for tree in trees)} files")
+    return [{relative: known[path] for relative, path in tree.items() if path in known} for tree in trees]
+
+
+def _diff_key(relative):
+    # Dumps of different versions don't always agree on case or separators
+    return relative.replace(os.sep, "/").lower()
+
+
+def level_changes(old, new):
+    """Describe how two hashed versions of a texture differ level by level"""
+    changes = []
+    if (old["width"], old["height"]) != (new["width"], new["height"]):
+        changes.append(f"size {old['width']}x{old['height']} -> {new['width']}x{new['height']}")
+    old_levels = json.loads(old["level_hashes"] or "[]")
+    new_levels = json.loads(new["level_hashes"] or "[]")
+    if len(old_levels) != len(new_levels):
+        changes.append(f"mip levels {len(old_levels)} -> {len(new_levels)}")
+    changed = [str(level) for level, (a, b) in enumerate(zip(old_levels, new_levels)) if a != b]
+    if changed:
+        changes.append(f"level{'s' if len(changed) > 1 else ''} {', '.join(changed)} changed")
+    return changes
+
+
+def diff_trees(old_root, new_root, index_path=DEFAULT_INDEX_PATH, workers=8, include=None, exclude=None):
+    """
+    Compare two texture trees by relative path. Both are hashed together on
+    workers threads (reusing the index). Returns a dict with "added", "removed", "modified" and
+    "header_only" lists of relative paths, "levels" ({relative path: level
+    changes} for modified files), "unchanged" and "errors" ({relative path: error}).
+    """
+    old_tree, new_tree = update_hashes([old_root, new_root], index_path, workers, include, exclude)
+    old = {_diff_key(relative): (relative, row) for relative, row in old_tree.items()}
+    new = {_diff_key(relative): (relative, row) for relative, row in new_tree.items()}
+
+    result = {category: [] for category in DIFF_CATEGORIES}
+    result.update(levels={}, unchanged=0, errors={})
+    for key in sorted(set(old) | set(new)):
+        if key not in new:
+            result["removed"].append(old[key][0])
+            continue
+        relative, new_row = new[key]
+        if key not in old:
+            result["added"].append(relative)
+            continue
+        old_row = old[key][1]
+        for row in (old_row, new_row):
+            if row["error"]:
+                result["errors"][relative] = row["error"]
+        if old_row["payload_hash"] != new_row["payload_hash"]:
+            result["modified"].append(relative)
+            result["levels"][relative] = level_changes(old_row, new_row)
+        elif old_row["header_hash"] != new_row["header_hash"]:
+            result["header_only"].append(relative)
+        else:
+            result["unchanged"] += 1
+    return result
+
+
+def format_diff(result, levels=False):
+    """Human-readable diff report; with levels, modified files list their changed mip levels"""
+    labels = {"added": "Added", "removed": "Removed", "modified": "Modified", "header_only": "Header only"}
+    lines = []
+    for category in DIFF_CATEGORIES:
+        if not result[category]:
+            continue
+        lines.append(f"{labels[category]} ({len(result[category])}):")
+        for relative in result[category]:
+            detail = result["levels"].get(relative) if levels else None
+            lines.append(f"  {relative}" + (f": {'; '.join(detail)}" if detail else ""))
+    for relative, error in sorted(result["errors"].items()):
+        lines.append(f"Could not parse {relative} ({error}); compared as whole files")
+    counts = ", ".join(f"{len(result[category])} {labels[category].lower()}" for category in DIFF_CATEGORIES)
+    lines.append(f"{counts}, {result['unchanged']} unchanged")
+    return "\n".join(lines)
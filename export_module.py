@@ -0,0 +1,174 @@
+# export_module.py
+"""
+Decode-once, multi-format export of CTXR textures.
+
+Each texture is read, parsed and channel-swapped once; the decoded image is
+then handed to every requested encoder (optionally on parallel threads).
+"""
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ctxr_utils import read_ctxr, atomic_write
+from convert_module import ctxr_to_image, ctxr_to_dds_bytes
+from tga_module import ctxr_to_tga_levels, tga_level_path
+from pipeline_module import run_pipeline, log_pipeline_stats
+from sidecar_module import sidecar_bytes, SIDECAR_EXTENSION
+from walker_module import walk_paths, mirror_path
+from schedule_module import schedule, measure_ctxr
+from cache_module import get_conversion_cache
+from streaming_module import should_stream, stream_export, STREAM_THRESHOLD_PIXELS
+
+
+def encode_png(ctxr, image_rgba, options):
+    output = io.BytesIO()
+    image_rgba.save(output, 'PNG', compress_level=0)
+    return output.getvalue()
+
+
+def encode_tga(ctxr, image_rgba, options):
+    # TGA is BGRA like the CTXR data, so it is written from the raw levels
+    levels = ctxr_to_tga_levels(ctxr, rle=options.get("tga_rle", False),
+                                mipmaps=options.get("tga_mipmaps", False))
+    return levels if len(levels) > 1 else levels[0]
+
+
+def encode_dds(ctxr, image_rgba, options):
+    return ctxr_to_dds_bytes(ctxr, image_rgba)
+
+
+# Output format -> encoder(ctxr, decoded RGBA image or None, options) returning file bytes,
+# or a list of file bytes (one per mip level)
+ENCODERS = {
+    "png": encode_png,
+    "tga": encode_tga,
+    "dds": encode_dds,
+}
+
+# Formats whose encoders need the decoded RGBA image
+DECODED_FORMATS = ("png", "dds")
+
+# Formats that can be written straight from DXT5 data without decoding
+DXT5_FORMATS = ("dds",)
+
+
+def export_ctxr_data(data, file_name, formats, parallel=False, tga_rle=False, tga_mipmaps=False, sidecar=False):
+    """
+    Decode CTXR bytes once and encode them to every format in formats.
+
+    Returns {format: bytes}, or {format: [bytes per mip level]} for TGA with
+    tga_mipmaps; with sidecar the layout sidecar is included under "ctxrmeta".
+    The image is only decoded if a format needs it. DXT5 files can only be exported to DDS; asking for
+    any other format raises ValueError. With parallel, the encoders run on
+    separate threads (PNG/DDS encoding releases the GIL for most of its work).
+    """
+    unknown = [fmt for fmt in formats if fmt not in ENCODERS]
+    if unknown:
+        raise ValueError(f"Unsupported export format(s): {', '.join(unknown)}")
+
+    ctxr = read_ctxr(io.BytesIO(data), file_name)
+    if ctxr["is_dxt5"]:
+        unsupported = [fmt for fmt in formats if fmt not in DXT5_FORMATS]
+        if unsupported:
+            raise ValueError(f"DXT5 files can only be exported to DDS, not {', '.join(unsupported)}")
+        image_rgba = None
+    elif any(fmt in DECODED_FORMATS for fmt in formats):
+        image_rgba = ctxr_to_image(ctxr)
+    else:
+        image_rgba = None
+
+    options = {"tga_rle": tga_rle, "tga_mipmaps": tga_mipmaps}
+    if parallel and len(formats) > 1:
+        with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+            futures = {fmt: executor.submit(ENCODERS[fmt], ctxr, image_rgba, options) for fmt in formats}
+            outputs = {fmt: future.result() for fmt, future in futures.items()}
+    else:
+        outputs = {fmt: ENCODERS[fmt](ctxr, image_rgba, options) for fmt in formats}
+    if sidecar:
+        outputs[SIDECAR_EXTENSION[1:]] = sidecar_bytes(ctxr, file_name)
+    return outputs
+
+
+def cached_export_ctxr_data(data, file_name, formats, parallel=False, tga_rle=False, tga_mipmaps=False,
+                            sidecar=False):
+    """export_ctxr_data through the conversion cache: the same bytes exported with the same options are decoded only once"""
+    options = {"formats": list(formats), "file_name": file_name, "tga_rle": tga_rle, "tga_mipmaps": tga_mipmaps,
+               "sidecar": sidecar}
+    return get_conversion_cache().convert(
+        data, "export", options,
+        lambda: export_ctxr_data(data, file_name, formats, parallel, tga_rle, tga_mipmaps, sidecar))
+
+
+def export_output_path(item, fmt, output_folder=None):
+    """
+    Output path for a walker WorkItem exported as fmt: next to the input, or under
+    output_folder in the same relative folders as under the source folder.
+    """
+    if output_folder:
+        return mirror_path(item, output_folder, f".{fmt}")
+    return os.path.splitext(item.path)[0] + f".{fmt}"
+
+
+def batch_export(paths, formats, output_folder=None, parallel_encoders=False, on_done=None,
+                 tga_rle=False, tga_mipmaps=False, journal=None, sidecar=True, include=None, exclude=None,
+                 order="size", on_progress=None, stream_above=STREAM_THRESHOLD_PIXELS, **pipeline_settings):
+    """
+    Export every CTXR under paths to all requested formats, decoding each file once.
+    Folders are walked lazily (filtered by the include/exclude globs) and their
+    tree is mirrored under output_folder. Runs through the read-ahead pipeline;
+    returns its result dict. on_done gets each input path. Outputs are written
+    atomically, each with a .ctxrmeta sidecar unless sidecar is False; with a
+    BatchJournal, files it has already completed are skipped and each outcome
+    is recorded. Outputs come from the conversion cache when the same file was
+    exported with the same options before. order "size" runs the largest files first, "walk" streams them
+    in walk order (see schedule_module); on_progress gets the ProgressTracker
+    after each file. Files with at least stream_above main level pixels are
+    converted band by band straight from disk instead (see streaming_module),
+    bypassing the cache; None turns streaming off.
+    """
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+
+    def read(item):
+        if stream_above is not None and should_stream(item.path, formats, stream_above):
+            return None  # convert streams it from disk
+        with open(item.path, 'rb') as f:
+            return f.read()
+
+    def convert(item, data):
+        if data is None:
+            outputs = {fmt: export_output_path(item, fmt, output_folder) for fmt in formats}
+            return stream_export(item.path, outputs, tga_rle, tga_mipmaps, sidecar)
+        return cached_export_ctxr_data(data, os.path.basename(item.path), formats, parallel_encoders,
+                                       tga_rle, tga_mipmaps, sidecar)
+
+    def write(item, outputs):
+        for fmt, output in outputs.items():
+            output_path = export_output_path(item, fmt, output_folder)
+            levels = output if isinstance(output, list) else [output]
+            for level, level_data in enumerate(levels):
+                atomic_write(tga_level_path(output_path, level), level_data)
+
+    items = walk_paths(paths, ('.ctxr',), include, exclude)
+    if journal is not None:
+        # Journal items are absolute paths, so a resume matches however the paths were typed
+        items = journal.pending(items, key=lambda item: os.path.abspath(item.path))
+    items, tracker = schedule(items, measure_ctxr, order, key=lambda item: item.path)
+
+    def item_done(item, error):
+        if journal is not None:
+            journal.record(os.path.abspath(item.path), error)
+        if on_done is not None:
+            on_done(item.path, error)
+        tracker.advance(item.path)
+        if on_progress is not None:
+            on_progress(tracker)
+
+    result = run_pipeline(items, read, convert, write, on_done=item_done, **pipeline_settings)
+    log_pipeline_stats(result)
+    logging.info(f"Exported {result['items'] - result['failed']} files to {', '.join(formats)}")
+    if journal is not None and journal.skipped:
+        logging.info(f"Skipped {journal.skipped} files completed by an earlier run")
+    if get_conversion_cache().enabled:
+        logging.info(get_conversion_cache().format_stats())
+    return result
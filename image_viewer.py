@@ -3,10 +3,17 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 import struct
 import os
+import io
+import mmap
 import logging
-from ctxr_utils import parse_mipmap_info, CTXRError
+from collections import OrderedDict
+from ctxr_utils import read_mip_chain, CTXRError, DXT5_FILES
+from layout_module import get_layout
 
 
+# Decoded levels kept per texture; the rest are decoded again when selected
+LEVEL_CACHE_SIZE = 3
+
 class ImageViewer:
     def __init__(self, parent=None):
         self.parent = parent
@@ -16,8 +23,12 @@ class ImageViewer:
         self.pan_x = 0
         self.pan_y = 0
         self.mipmap_level = 0
-        self.mipmaps = []
         self.ctxr_header = None
+        self.ctxr_map = None
+        self.levels = []              # (offset, size, width, height) of each level of the open CTXR
+        self.level_is_dxt5 = False
+        self.level_cache = OrderedDict()
+        self.all_images = []
         
         self.setup_ui()
         
@@ -102,162 +113,109 @@ class ImageViewer:
         if not file_path:
             return
         
-        # List of DXT5 compressed files
-        dxt5_files = [
-            "jngl_happa04_alp_ovl.bmp.ctxr",
-            "jngl_happa04_alp_ovl_mip16000.bmp.ctxr",
-            "jngl_happa04_alp_ovl_mip16000.bmp_c82c791b86086ed52d483520273e9b5b.ctxr",
-            "jngl_happa04_alp_ovl_mip8000.bmp.ctxr",
-            "jngl_happa05_alp_ovl_mip4000.bmp.ctxr",
-            "jngl_taki_eda_12_alp_ovl_mip8000.bmp.ctxr",
-            "jngl_taki_eda_17_alp_ovl_mip4000.bmp.ctxr",
-            "s001a_enkeil_rep.bmp.ctxr",
-            "s001a_happa05_alp_ovl_mip8000.bmp.ctxr",
-            "s001a_soil01_rep_mip8000.bmp.ctxr",
-            "v000a_kinokatamari_a01_alp_ovl_rep.bmp.ctxr",
-            "v000a_kinokatamari_a01_alp_ovl_rep.bmp_86187137555744c273e17dd4a431d1a2.ctxr",
-            "v000a_kinokatamari_a03_alp_ovl_rep.bmp.ctxr",
-            "v000a_kinokatamari_a03_alp_ovl_rep.bmp_d9ec09aa2448dfac3e0b72eca57e0034.ctxr",
-        ]
-            
         try:
             # Check if this is a DXT5 file
             filename = os.path.basename(file_path)
-            is_dxt5 = filename in dxt5_files
+            is_dxt5 = filename in DXT5_FILES
             
+            # Only the header and mip chain layout are read here; each level stays a
+            # (offset, size) handle into the memory-mapped file until it is shown
+            self.close_ctxr_file()
             with open(file_path, 'rb') as f:
-                self.ctxr_header = f.read(132)
-                mipmap_count = struct.unpack_from('>B', self.ctxr_header, 0x26)[0]
-                pixel_data_length = struct.unpack_from('>I', self.ctxr_header, 0x80)[0]
-                width = struct.unpack_from('>H', self.ctxr_header, 8)[0]
-                height = struct.unpack_from('>H', self.ctxr_header, 10)[0]
-                pixel_data = f.read(pixel_data_length)
-                
-                # Parse mipmaps if present
-                mipmap_info_list = []
-                if mipmap_count > 1:
-                    is_compressed = is_dxt5
-                    compression_format = 'DXT5' if is_compressed else 'UNCOMPRESSED'
-                    mipmap_info_list, _ = parse_mipmap_info(f, mipmap_count, width, height, 
-                                                       is_compressed=is_compressed,
-                                                       compression_format=compression_format)
-                
-                if is_dxt5:
-                    # DXT5 - decompress via temporary DDS file
-                    import tempfile
-                    
-                    with tempfile.NamedTemporaryFile(suffix='.dds', delete=False) as temp_dds:
-                        # Write DDS header
-                        dds_header_file = "DDS_header_DXT5.bin"
-                        try:
-                            with open(dds_header_file, "rb") as header_file:
-                                dds_header = bytearray(header_file.read())
-                        except FileNotFoundError:
-                            messagebox.showerror("Error", 
-                                               "DDS_header_DXT5.bin not found.\n"
-                                               "Please ensure it's in the same directory as the script.")
-                            return
-                        
-                        struct.pack_into("<I", dds_header, 12, height)
-                        struct.pack_into("<I", dds_header, 16, width)
-                        struct.pack_into("<I", dds_header, 28, mipmap_count)
-                        
-                        temp_dds.write(dds_header)
-                        temp_dds.write(pixel_data)
-                        
-                        # Write mipmaps
-                        for mip_info in mipmap_info_list:
-                            temp_dds.write(mip_info["data"])
-                        
-                        temp_dds_path = temp_dds.name
-                    
-                    # Try to open the DDS file with PIL
-                    try:
-                        dds_image = Image.open(temp_dds_path)
-                        main_image = dds_image.convert('RGBA')
-                        
-                        # Try to extract mipmaps from DDS
-                        self.mipmaps = []
-                        # PIL doesn't easily expose DDS mipmaps, so we'll just show the main level
-                        
-                    except Exception as e:
-                        logging.error(f"Failed to open DDS file: {e}")
-                        messagebox.showerror("Error", 
-                                           "Could not decompress DXT5 data.\n"
-                                           "You may need to install 'pillow-dds' plugin:\n"
-                                           "pip install pillow-dds\n\n"
-                                           "Or convert to DDS manually first.")
-                        return
-                    finally:
-                        # Clean up temp file
-                        try:
-                            os.unlink(temp_dds_path)
-                        except:
-                            pass
-                else:
-                    # Uncompressed - process normally
-                    self.mipmaps = []
-                    for idx, mip_info in enumerate(mipmap_info_list):
-                        mip_data = mip_info["data"]
-                        mip_level = idx + 1  # Level 1, 2, 3, etc.
-                        mip_w = max(1, width >> mip_level)
-                        mip_h = max(1, height >> mip_level)
-                        expected_bytes = mip_w * mip_h * 4
-                        
-                        logging.info(f"Processing mipmap level {mip_level}: {mip_w}x{mip_h}, expected {expected_bytes} bytes, got {len(mip_data)} bytes")
-                        
-                        if len(mip_data) != expected_bytes:
-                            logging.error(f"Mipmap {mip_level} data size mismatch! Expected {expected_bytes}, got {len(mip_data)}. Skipping this mipmap.")
-                            continue  # Skip this mipmap instead of trying to load it with wrong size
-                        
-                        try:
-                            # Load the raw data
-                            mip_image = Image.frombytes('RGBA', (mip_w, mip_h), mip_data)
-                            r, g, b, a = mip_image.split()
-                            
-                            # TEST ALL POSSIBLE ARRANGEMENTS
-                            # We'll try ARGB format (common in some texture formats)
-                            # If stored as ARGB but read as RGBA:
-                            # File bytes: A R G B A R G B ...
-                            # PIL reads as: R G B A R G B A ...
-                            # So PIL's R = file's A, G = file's R, B = file's G, A = file's B
-                            # To correct: R=G (file's R), G=B (file's G), B=A (file's B), A=R (file's A)
-                            
-                            mip_rgba = Image.merge("RGBA", (g, r, a, b))  # GRAB interpretation
-                            
-                            self.mipmaps.append(mip_rgba)
-                            
-                            logging.info(f"Loaded mipmap {mip_level} using ARGB byte order")
-                        except Exception as e:
-                            logging.error(f"Failed to create mipmap {mip_level}: {e}")
-                            continue
-                    
-                    # Convert main image
-                    image_bgra = Image.frombytes('RGBA', (width, height), pixel_data)
-                    r, g, b, a = image_bgra.split()
-                    main_image = Image.merge("RGBA", (b, g, r, a))
-                
-                # Store all mipmap levels
-                self.all_images = [main_image] + self.mipmaps
-                
-                # Update mipmap selector
-                mipmap_values = [str(i) for i in range(len(self.all_images))]
-                self.mipmap_combo['values'] = mipmap_values
-                self.mipmap_var.set("0")
-                
-                self.current_image_path = file_path
-                self.display_image(main_image)
-                
-                format_str = "DXT5 compressed" if is_dxt5 else "uncompressed"
-                self.status_var.set(f"Loaded: {os.path.basename(file_path)} ({width}x{height}, {format_str}, {len(self.all_images)} levels)")
+                self.ctxr_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self.ctxr_map
+            self.ctxr_header = data[:132]
+            mipmap_count = struct.unpack_from('>B', self.ctxr_header, 0x26)[0]
+            pixel_data_length = struct.unpack_from('>I', self.ctxr_header, 0x80)[0]
+            width = struct.unpack_from('>H', self.ctxr_header, 8)[0]
+            height = struct.unpack_from('>H', self.ctxr_header, 10)[0]
+            if 132 + pixel_data_length > len(data):
+                raise CTXRError("Main level data is truncated")
+            
+            # Parse mipmaps if present
+            mipmap_info_list = []
+            if mipmap_count > 1:
+                compression_format = 'DXT5' if is_dxt5 else 'UNCOMPRESSED'
+                data.seek(132 + pixel_data_length)
+                mipmap_info_list, _ = read_mip_chain(data, self.ctxr_header, mipmap_count, width, height,
+                                                     is_compressed=is_dxt5,
+                                                     compression_format=compression_format,
+                                                     skip_data=True)
+            
+            layout = get_layout("DXT5" if is_dxt5 else "BGRA", width, height, mipmap_count)
+            self.levels = [(132, pixel_data_length, width, height)]
+            # Levels are checked against their own layout row, even after one was skipped
+            for level_number, mip_info in enumerate(mipmap_info_list, start=1):
+                level = layout.levels[level_number]
+                if mip_info["size"] != level.size:
+                    logging.error(f"Mipmap {level.level} data size mismatch! Expected {level.size}, "
+                                  f"got {mip_info['size']}. Skipping this mipmap.")
+                    continue
+                self.levels.append((mip_info["offset"], level.size, level.width, level.height))
+            self.level_is_dxt5 = is_dxt5
+            self.level_cache = OrderedDict()
+            
+            main_image = self.get_level(0)
+            self.all_images = []
+            
+            # Update mipmap selector
+            mipmap_values = [str(i) for i in range(len(self.levels))]
+            self.mipmap_combo['values'] = mipmap_values
+            self.mipmap_var.set("0")
+            
+            self.current_image_path = file_path
+            self.display_image(main_image)
+            
+            format_str = "DXT5 compressed" if is_dxt5 else "uncompressed"
+            self.status_var.set(f"Loaded: {filename} ({width}x{height}, {format_str}, {len(self.levels)} levels)")
                 
         except Exception as e:
+            self.close_ctxr_file()
             error_msg = f"Error loading CTXR file: {str(e)}"
             logging.error(error_msg)
             import traceback
             logging.error(traceback.format_exc())
             messagebox.showerror("Error", error_msg)
     
+    def close_ctxr_file(self):
+        """Drop the level handles and cache of the open CTXR and unmap it"""
+        self.levels = []
+        self.level_cache = OrderedDict()
+        if self.ctxr_map is not None:
+            self.ctxr_map.close()
+            self.ctxr_map = None
+    
+    def get_level(self, level):
+        """Decode a level of the open CTXR, keeping the last few decoded levels cached"""
+        image = self.level_cache.get(level)
+        if image is not None:
+            self.level_cache.move_to_end(level)
+            return image
+        
+        offset, size, width, height = self.levels[level]
+        # Copied out of the map so decoded images never reference it after it is closed
+        level_data = self.ctxr_map[offset:offset + size]
+        if self.level_is_dxt5:
+            # Single level DDS in memory, decompressed by PIL
+            from convert_module import ctxr_to_dds_bytes
+            dds_data = ctxr_to_dds_bytes({"is_dxt5": True, "width": width, "height": height,
+                                          "mipmap_count": 1, "pixel_data": level_data, "mipmap_info": []})
+            image = Image.open(io.BytesIO(dds_data)).convert('RGBA')
+        elif level == 0:
+            # Main level is stored as BGRA
+            image = Image.frombuffer('RGBA', (width, height), level_data, 'raw', 'BGRA', 0, 1)
+        else:
+            # Mip levels are shown with the GRAB interpretation:
+            # PIL reads the bytes as R G B A, the display takes R=G, G=R, B=A, A=B
+            r, g, b, a = Image.frombytes('RGBA', (width, height), level_data).split()
+            image = Image.merge("RGBA", (g, r, a, b))
+        logging.info(f"Decoded level {level}: {width}x{height}")
+        
+        self.level_cache[level] = image
+        while len(self.level_cache) > LEVEL_CACHE_SIZE:
+            self.level_cache.popitem(last=False)
+        return image
+    
     def open_image_file(self):
         """Open and display a regular image file"""
         file_path = filedialog.askopenfilename(
@@ -279,9 +237,9 @@ class ImageViewer:
             if image.mode != 'RGBA':
                 image = image.convert('RGBA')
                 
+            self.close_ctxr_file()
             self.current_image_path = file_path
             self.all_images = [image]
-            self.mipmaps = []
             self.ctxr_header = None
             
             # Update mipmap selector
@@ -318,8 +276,10 @@ class ImageViewer:
         """Handle mipmap level change"""
         try:
             level = int(self.mipmap_var.get())
-            if 0 <= level < len(self.all_images):
-                self.display_image(self.all_images[level])
+            # CTXR levels are decoded on demand, other images are already loaded
+            level_count = len(self.levels) if self.levels else len(self.all_images)
+            if 0 <= level < level_count:
+                self.display_image(self.get_level(level) if self.levels else self.all_images[level])
                 self.status_var.set(f"Mipmap level {level}: {self.current_image.width}x{self.current_image.height}")
         except (ValueError, IndexError):
             pass
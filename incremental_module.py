@@ -0,0 +1,202 @@
+# incremental_module.py
+"""
+Incremental re-import of edited textures.
+
+Instead of rebuilding a whole CTXR from an edited image, the new image is
+compared with the pixels already in a CTXR in 4x4 blocks. Only the mip tiles
+that the changed blocks feed into are resampled, with the same Lanczos filter
+and sampling grid as a full import (so those pixels come out exactly as a full
+import would make them), and just the changed byte ranges are patched into the
+CTXR. Mip pixels the edit can't reach keep whatever the CTXR already had.
+
+Only uncompressed (BGRA) CTXRs can be patched; DXT5 files are always
+imported in full (and re-encoded whole).
+"""
+import io
+import os
+import math
+import logging
+from ctxr_utils import read_ctxr, atomic_write, CTXRError
+
+
+BLOCK_SIZE = 4
+TILE_SIZE = 64
+# PIL's Lanczos filter reaches 3 source pixels (scaled by the reduction) each side
+LANCZOS_SUPPORT = 3
+
+
+def changed_blocks(old_pixels, new_pixels):
+    """
+    Compare two (height, width, 4) uint8 arrays and return a boolean
+    (ceil(height / 4), ceil(width / 4)) array marking 4x4 blocks that differ.
+    """
+    import numpy as np
+
+    height, width = old_pixels.shape[:2]
+    changed = (old_pixels != new_pixels).any(axis=2)
+    blocks_h = -(-height // BLOCK_SIZE)
+    blocks_w = -(-width // BLOCK_SIZE)
+    padded = np.zeros((blocks_h * BLOCK_SIZE, blocks_w * BLOCK_SIZE), dtype=bool)
+    padded[:height, :width] = changed
+    return padded.reshape(blocks_h, BLOCK_SIZE, blocks_w, BLOCK_SIZE).any(axis=(1, 3))
+
+
+def tile_rects(mask, tile_size=TILE_SIZE):
+    """
+    Cover the True cells of a 2D boolean mask with rectangles, one per tile of
+    tile_size cells that has any, each shrunk to the bounding box of its cells.
+    Returns (x0, y0, x1, y1) cell rectangles.
+    """
+    import numpy as np
+
+    height, width = mask.shape
+    rects = []
+    tiles_h = -(-height // tile_size)
+    tiles_w = -(-width // tile_size)
+    padded = np.zeros((tiles_h * tile_size, tiles_w * tile_size), dtype=bool)
+    padded[:height, :width] = mask
+    tiles = padded.reshape(tiles_h, tile_size, tiles_w, tile_size)
+    for ty, tx in zip(*np.nonzero(tiles.any(axis=(1, 3)))):
+        tile = tiles[ty, :, tx, :]
+        rows = np.flatnonzero(tile.any(axis=1))
+        cols = np.flatnonzero(tile.any(axis=0))
+        x0, y0 = tx * tile_size, ty * tile_size
+        rects.append((x0 + cols[0], y0 + rows[0], x0 + cols[-1] + 1, y0 + rows[-1] + 1))
+    return rects
+
+
+def affected_rect(rect, width, height, mip_w, mip_h):
+    """Mip level pixels (x0, y0, x1, y1) whose Lanczos footprint touches a level 0 pixel rect"""
+    x0, y0, x1, y1 = rect
+    scale_x, scale_y = width / mip_w, height / mip_h
+    return (max(0, math.floor(x0 / scale_x) - LANCZOS_SUPPORT - 1),
+            max(0, math.floor(y0 / scale_y) - LANCZOS_SUPPORT - 1),
+            min(mip_w, math.ceil(x1 / scale_x) + LANCZOS_SUPPORT + 1),
+            min(mip_h, math.ceil(y1 / scale_y) + LANCZOS_SUPPORT + 1))
+
+
+def _rect_patches(level_offset, level_width, rect, bgra_rows):
+    """(offset, bytes) patches writing a rect of BGRA rows into a level stored at level_offset"""
+    x0, y0, x1, y1 = rect
+    row_bytes = (x1 - x0) * 4
+    return [(level_offset + ((y0 + row) * level_width + x0) * 4, bgra_rows[row * row_bytes:(row + 1) * row_bytes])
+            for row in range(y1 - y0)]
+
+
+def incremental_patches(ctxr, image, tile_size=TILE_SIZE):
+    """
+    Work out the byte patches that turn a CTXR (as returned by read_ctxr, with its
+    file offsets) into the CTXR a full import of image would produce.
+
+    Returns a dict with "patches" (a list of (file offset, bytes)), "changed_blocks",
+    "total_blocks" and "levels" (pixels recomputed per mip level). Raises CTXRError
+    if the CTXR can't be patched (DXT5 data, or a different size or mip layout).
+    """
+    import numpy as np
+    from PIL import Image
+    from layout_module import get_layout, CTXR_HEADER_SIZE
+
+    width, height = ctxr["width"], ctxr["height"]
+    if ctxr["is_dxt5"]:
+        raise CTXRError("DXT5 files can't be patched incrementally")
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    if image.size != (width, height):
+        raise CTXRError(f"Image is {image.size[0]}x{image.size[1]}, the CTXR is {width}x{height}")
+    layout = get_layout("BGRA", width, height, ctxr["mipmap_count"])
+    if len(ctxr["pixel_data"]) != layout.levels[0].size or any(
+            mip["data"] is None or len(mip["data"]) != level.size
+            for mip, level in zip(ctxr["mipmap_info"], layout.levels[1:])):
+        raise CTXRError("CTXR levels don't match the expected layout")
+
+    new_bgra = image.tobytes("raw", "BGRA")
+    old_pixels = np.frombuffer(ctxr["pixel_data"], dtype=np.uint8).reshape(height, width, 4)
+    new_pixels = np.frombuffer(new_bgra, dtype=np.uint8).reshape(height, width, 4)
+    blocks = changed_blocks(old_pixels, new_pixels)
+    result = {"patches": [], "changed_blocks": int(blocks.sum()), "total_blocks": int(blocks.size), "levels": []}
+    if not blocks.any():
+        return result
+
+    # Main level: copy the changed blocks' rows straight from the new image
+    block_rects = [(x0 * BLOCK_SIZE, y0 * BLOCK_SIZE, min(width, x1 * BLOCK_SIZE), min(height, y1 * BLOCK_SIZE))
+                   for x0, y0, x1, y1 in tile_rects(blocks, max(1, tile_size // BLOCK_SIZE))]
+    recomputed = 0
+    for rect in block_rects:
+        x0, y0, x1, y1 = rect
+        result["patches"] += _rect_patches(CTXR_HEADER_SIZE, width, rect,
+                                           new_pixels[y0:y1, x0:x1].tobytes())
+        recomputed += int((x1 - x0) * (y1 - y0))
+    result["levels"].append(recomputed)
+
+    # Mip levels: resample only the tiles the changed blocks reach
+    for level, mip in zip(layout.levels[1:], ctxr["mipmap_info"]):
+        dirty = np.zeros((level.height, level.width), dtype=bool)
+        for rect in block_rects:
+            x0, y0, x1, y1 = affected_rect(rect, width, height, level.width, level.height)
+            dirty[y0:y1, x0:x1] = True
+        scale_x, scale_y = width / level.width, height / level.height
+        recomputed = 0
+        for x0, y0, x1, y1 in tile_rects(dirty, tile_size):
+            tile = image.resize((x1 - x0, y1 - y0), Image.LANCZOS,
+                                box=(x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y))
+            result["patches"] += _rect_patches(mip["offset"], level.width, (x0, y0, x1, y1),
+                                               tile.tobytes("raw", "BGRA"))
+            recomputed += int((x1 - x0) * (y1 - y0))
+        result["levels"].append(recomputed)
+    return result
+
+
+def apply_patches(target, patches):
+    """Apply (offset, bytes) patches to a bytearray, or in place to the file at path target"""
+    if isinstance(target, (bytearray, memoryview)):
+        for offset, data in patches:
+            target[offset:offset + len(data)] = data
+        return target
+    with open(target, 'r+b') as f:
+        for offset, data in patches:
+            f.seek(offset)
+            f.write(data)
+    return target
+
+
+def incremental_import(image_path, ctxr_path, output_path, tile_size=TILE_SIZE, atomic=False):
+    """
+    Re-import an edited image by patching only what changed.
+
+    The base is the existing output CTXR if there is one with the same header
+    (so repeated edits keep patching it), otherwise the original ctxr_path, which
+    is patched into a new output_path written through a temporary file. Returns the
+    incremental_patches result dict plus "output_path". Raises CTXRError if the
+    texture can't be patched, in which case callers should fall back to a full
+    import. With atomic an existing output is also rewritten whole through a
+    temporary file instead of being patched in place.
+    """
+    from PIL import Image
+
+    file_name = os.path.basename(ctxr_path)
+    with open(ctxr_path, 'rb') as f:
+        original = f.read()
+
+    base_path, base = ctxr_path, original
+    if output_path != ctxr_path and os.path.exists(output_path):
+        with open(output_path, 'rb') as f:
+            existing = f.read()
+        if len(existing) == len(original) and existing[:0x80] == original[:0x80]:
+            base_path, base = output_path, existing
+
+    ctxr = read_ctxr(io.BytesIO(base), file_name)
+    if image_path.lower().endswith('.tga'):
+        from tga_module import tga_to_image
+        image = tga_to_image(image_path)
+    else:
+        image = Image.open(image_path)
+    result = incremental_patches(ctxr, image, tile_size)
+
+    if base_path == output_path and not atomic:
+        apply_patches(output_path, result["patches"])
+    else:
+        atomic_write(output_path, apply_patches(bytearray(base), result["patches"]))
+    logging.info(f"Incremental import of {image_path}: {result['changed_blocks']}/{result['total_blocks']} "
+                 f"blocks changed, {len(result['patches'])} ranges patched into {output_path}")
+    result["output_path"] = output_path
+    return result
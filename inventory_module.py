@@ -0,0 +1,185 @@
+# inventory_module.py
+"""
+Header-only inventory of CTXR texture trees, stored in a SQLite index.
+
+Only headers (and, for PC files, the few bytes of padding between mip levels)
+are read, so a full dump can be indexed quickly. Rescans are incremental:
+files whose mtime and size are unchanged are not reopened.
+"""
+import os
+import json
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from ctxr_utils import (parse_header_info, guess_format, read_mip_chain, iter_ctxr_files,
+                        CTXR_HEADER_SIZE, CTXRError)
+
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ctxr_converter", "inventory.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS textures (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    platform TEXT,
+    width INTEGER,
+    height INTEGER,
+    mipmap_count INTEGER,
+    payload_length INTEGER,
+    format TEXT,
+    npot INTEGER,
+    padding_layout TEXT,
+    error TEXT
+)
+"""
+
+COLUMNS = ("path", "name", "mtime_ns", "file_size", "platform", "width", "height", "mipmap_count",
+           "payload_length", "format", "npot", "padding_layout", "error")
+
+
+def open_index(index_path=DEFAULT_INDEX_PATH):
+    """Open (creating if needed) an inventory index and return the sqlite3 connection"""
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute(SCHEMA)
+    conn.execute("CREATE INDEX IF NOT EXISTS textures_format ON textures(format)")
+    return conn
+
+
+def _is_power_of_two(n):
+    return n > 0 and (n & (n - 1)) == 0
+
+
+def scan_file(file_path):
+    """
+    Read one texture's header and padding layout. Returns a row dict for the index;
+    unreadable files get their error recorded instead of raising.
+    """
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=os.path.abspath(file_path), name=os.path.basename(file_path), mtime_ns=0, file_size=0)
+    try:
+        stat = os.stat(file_path)
+        row.update(mtime_ns=stat.st_mtime_ns, file_size=stat.st_size)
+        with open(file_path, 'rb') as f:
+            header = f.read(CTXR_HEADER_SIZE)
+            info = parse_header_info(header)
+            fmt = guess_format(info, row["name"])
+            layout = None
+            if info["platform"] == "pc" and info["mipmap_count"] > 1 and fmt in ("BGRA", "DXT5"):
+                # Seek over the pixel data, reading only the padding between levels
+                f.seek(CTXR_HEADER_SIZE + info["pixel_data_length"])
+                mip_info, final_padding = read_mip_chain(
+                    f, header, info["mipmap_count"], info["width"], info["height"],
+                    is_compressed=(fmt == "DXT5"), compression_format=fmt, skip_data=True
+                )
+                layout = {"padding": [len(mip["padding"]) for mip in mip_info],
+                          "sizes": [mip["size"] for mip in mip_info],
+                          "final_padding": len(final_padding)}
+            elif info["platform"] == "ps3":
+                from ps3_ctxr_module import ps3_mip_levels
+                f.seek(0)
+                levels = ps3_mip_levels(f.read(128), stat.st_size)
+                layout = {"offsets": [level[2] for level in levels],
+                          "sizes": [level[3] for level in levels]}
+    except (OSError, CTXRError, ValueError) as e:
+        row["error"] = str(e)
+        return row
+
+    row.update(platform=info["platform"], width=info["width"], height=info["height"],
+               mipmap_count=info["mipmap_count"], payload_length=info["pixel_data_length"], format=fmt,
+               npot=int(not (_is_power_of_two(info["width"]) and _is_power_of_two(info["height"]))),
+               padding_layout=json.dumps(layout) if layout is not None else None)
+    return row
+
+
+def update_index(paths, index_path=DEFAULT_INDEX_PATH, workers=8, progress_callback=None):
+    """
+    Scan the given files/folders into the index, skipping files whose mtime and size
+    are unchanged and dropping index entries for files that disappeared from the
+    scanned folders. Returns a dict of "scanned", "unchanged" and "removed" counts.
+    """
+    conn = open_index(index_path)
+    known = {row["path"]: (row["mtime_ns"], row["file_size"])
+             for row in conn.execute("SELECT path, mtime_ns, file_size FROM textures")}
+
+    seen = set()
+    to_scan = []
+    for file_path in iter_ctxr_files(paths):
+        abs_path = os.path.abspath(file_path)
+        seen.add(abs_path)
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            continue
+        if known.get(abs_path) != (stat.st_mtime_ns, stat.st_size):
+            to_scan.append(abs_path)
+
+    insert = (f"INSERT OR REPLACE INTO textures ({', '.join(COLUMNS)}) "
+              f"VALUES ({', '.join('?' * len(COLUMNS))})")
+    scanned = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        for row in executor.map(scan_file, to_scan):
+            batch.append(tuple(row[c] for c in COLUMNS))
+            scanned += 1
+            if progress_callback:
+                progress_callback(scanned, len(to_scan))
+            if len(batch) >= 500:
+                conn.executemany(insert, batch)
+                conn.commit()
+                batch = []
+        conn.executemany(insert, batch)
+
+    # Forget files that were under a scanned folder but no longer exist
+    removed = 0
+    roots = [os.path.join(os.path.abspath(p), "") for p in paths if os.path.isdir(p)]
+    for path in known:
+        if path not in seen and any(path.startswith(root) for root in roots):
+            conn.execute("DELETE FROM textures WHERE path = ?", (path,))
+            removed += 1
+    conn.commit()
+    conn.close()
+
+    logging.info(f"Inventory: {scanned} scanned, {len(seen) - len(to_scan)} unchanged, {removed} removed")
+    return {"scanned": scanned, "unchanged": len(seen) - len(to_scan), "removed": removed}
+
+
+def query_index(index_path=DEFAULT_INDEX_PATH, where=None, params=()):
+    """
+    Return index rows (as dicts) matching an optional SQL WHERE clause, e.g.
+    query_index(db, "format = ? AND mipmap_count = ?", ("DXT5", 13)).
+    """
+    conn = open_index(index_path)
+    sql = "SELECT * FROM textures"
+    if where:
+        sql += f" WHERE {where}"
+    sql += " ORDER BY path"
+    try:
+        rows = [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+    for row in rows:
+        if row["padding_layout"]:
+            row["padding_layout"] = json.loads(row["padding_layout"])
+    return rows
+
+
+def query_paths(index_path=DEFAULT_INDEX_PATH, where=None, params=()):
+    """Return just the paths of indexed textures matching where"""
+    return [row["path"] for row in query_index(index_path, where, params)]
+
+
+def summarize_index(index_path=DEFAULT_INDEX_PATH):
+    """Return per-(platform, format) counts and totals for the index"""
+    conn = open_index(index_path)
+    try:
+        return [dict(row) for row in conn.execute(
+            "SELECT platform, format, COUNT(*) AS files, SUM(npot) AS npot, "
+            "SUM(payload_length) AS payload_bytes, SUM(error IS NOT NULL) AS errors "
+            "FROM textures GROUP BY platform, format ORDER BY files DESC"
+        )]
+    finally:
+        conn.close()
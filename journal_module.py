@@ -0,0 +1,129 @@
+# journal_module.py
+"""
+Checkpoint journal for resumable batch jobs.
+
+A batch appends one JSON line per finished item to a journal file: first the
+job spec, then {"event": "done"} or {"event": "failed"} records carrying the
+input's mtime and size. If the process dies, rerunning the same job with
+resume skips every input recorded as done that hasn't changed since. A torn
+last line (power loss mid-write) is simply ignored.
+"""
+import os
+import json
+import logging
+import threading
+
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ctxr_converter", "batch_journal.jsonl")
+# Records between fsyncs; the journal is flushed after every record regardless
+SYNC_EVERY = 32
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it can't be stat'ed"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def read_journal(path):
+    """Return (job spec, {item: record}) from a journal file; later records win"""
+    job, records = None, {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("event") == "job":
+                    job, records = record.get("job"), {}
+                elif "item" in record:
+                    records[record["item"]] = record
+    except OSError:
+        pass
+    return job, records
+
+
+class BatchJournal:
+    """
+    Append-only journal of one batch job.
+
+    With resume, an existing journal for the same job spec is continued and
+    pending() skips its completed items; otherwise (or if the spec differs) the
+    journal is started over. Items are input file paths, or anything locate(item)
+    maps to one.
+    """
+
+    def __init__(self, path, job, resume=False, locate=None):
+        self.path = path
+        self.job = job
+        self.locate = locate or (lambda item: item)
+        self.completed = {}
+        self.skipped = 0
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            previous_job, records = read_journal(path)
+            if previous_job == job:
+                self.completed = {item: record["signature"] for item, record in records.items()
+                                  if record.get("event") == "done"}
+                logging.info(f"Resuming from {path}: {len(self.completed)} items already done")
+            else:
+                logging.warning(f"Journal {path} belongs to a different job, starting over")
+                resume = False
+        elif resume:
+            logging.info(f"No journal at {path}, starting a new batch")
+            resume = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            self._append({"event": "job", "job": job})
+
+    def _append(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= SYNC_EVERY:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def is_done(self, item):
+        """True if item was completed by an earlier run and hasn't changed since"""
+        signature = self.completed.get(item)
+        return signature is not None and signature == file_signature(self.locate(item))
+
+    def pending(self, items, key=None):
+        """Yield the items that still need to be processed (key maps an item to its journal item)"""
+        for item in items:
+            if self.is_done(key(item) if key else item):
+                self.skipped += 1
+            else:
+                yield item
+
+    def record(self, item, error=None):
+        """Append the outcome of one item (error None for success)"""
+        record = {"event": "done" if error is None else "failed", "item": item,
+                  "signature": file_signature(self.locate(item))}
+        if error is not None:
+            record["error"] = str(error)
+        with self._lock:
+            self._append(record)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,177 @@
+# layout_module.py
+"""
+Mip chain layout of CTXR and DDS textures.
+
+get_layout returns an immutable, memoized table with every level's dimensions,
+byte size and its offsets in the DDS and CTXR files, so readers can seek
+straight to a level and writers can allocate the whole output in one go.
+Mip dimensions are floor-halved (max(1, size >> level)) and block compressed
+levels are rounded up to whole 4x4 blocks, everywhere.
+
+The padding between PC mip levels depends on the header template, so it is
+learned by scanning a file once and kept in a persistent LayoutCache keyed by
+the header's fingerprint.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+
+CTXR_HEADER_SIZE = 132
+PS3_HEADER_SIZE = 128
+DDS_HEADER_SIZE = 128
+CTXR_FINAL_PADDING = 24
+SIZE_FIELD_LENGTH = 4
+
+# Bytes per 4x4 block for block compressed formats
+BLOCK_SIZES = {"DXT1": 8, "DXT5": 16}
+
+LevelLayout = namedtuple("LevelLayout", "level width height size dds_offset ctxr_offset")
+TextureLayout = namedtuple("TextureLayout", "format width height mipmap_count platform levels dds_size ctxr_size")
+
+
+def mip_dimensions(width, height, level):
+    """Dimensions of mip level N of a width x height texture"""
+    return max(1, width >> level), max(1, height >> level)
+
+
+def level_size(width, height, fmt):
+    """Byte size of one width x height level in fmt (BGRA/RGBA are 4 bytes per pixel)"""
+    if fmt in BLOCK_SIZES:
+        return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * BLOCK_SIZES[fmt]
+    return width * height * 4
+
+
+def is_block_format(fmt):
+    return fmt in BLOCK_SIZES
+
+
+@lru_cache(maxsize=1024)
+def get_layout(fmt, width, height, mipmap_count, platform="pc", padding=None,
+               final_padding=CTXR_FINAL_PADDING, data_offset=None):
+    """
+    Return the TextureLayout of a texture.
+
+    levels holds one LevelLayout per mip level. DDS offsets assume the standard
+    128-byte header with levels back to back. CTXR offsets follow the platform:
+    PC files have padding[i - 1] zero bytes (0 if not given) and, for
+    uncompressed data, a 4-byte size field before mip level i, then final_padding
+    bytes at the end; PS3 files store every level back to back from data_offset.
+    padding must be a tuple (layouts are cached).
+    """
+    mipmap_count = max(1, mipmap_count)
+    if data_offset is None:
+        data_offset = PS3_HEADER_SIZE if platform == "ps3" else CTXR_HEADER_SIZE
+    size_field = 0 if platform == "ps3" or fmt in BLOCK_SIZES else SIZE_FIELD_LENGTH
+
+    levels = []
+    dds_offset = DDS_HEADER_SIZE
+    ctxr_offset = data_offset
+    for level in range(mipmap_count):
+        mip_w, mip_h = mip_dimensions(width, height, level)
+        size = level_size(mip_w, mip_h, fmt)
+        if level > 0 and platform != "ps3":
+            ctxr_offset += (padding[level - 1] if padding and level - 1 < len(padding) else 0) + size_field
+        levels.append(LevelLayout(level, mip_w, mip_h, size, dds_offset, ctxr_offset))
+        dds_offset += size
+        ctxr_offset += size
+
+    if platform != "ps3":
+        ctxr_offset += final_padding
+    return TextureLayout(fmt, width, height, mipmap_count, platform, tuple(levels), dds_offset, ctxr_offset)
+
+
+# Only used when a caller opts in to a persistent cache (see get_layout_cache)
+DEFAULT_LAYOUT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ctxr_converter", "layout_cache.json")
+
+
+def layout_fingerprint(header, fmt):
+    """
+    Key for textures sharing a padding layout: the CTXR header (which holds the
+    dimensions and mip count) with its main level size field masked out, plus the format.
+    """
+    masked = bytearray(header[:CTXR_HEADER_SIZE])
+    masked[0x80:0x84] = b'\x00' * 4
+    return hashlib.blake2b(bytes(masked) + fmt.encode('ascii'), digest_size=16).hexdigest()
+
+
+class LayoutCache:
+    """
+    Persistent map of layout fingerprint -> resolved mip chain layout.
+
+    An entry holds, per mip level, the padding length, the size field value,
+    whether a size field is present, and the padding start and data offsets, plus
+    the final padding length and the total file size. Entries are written through
+    to a JSON file (merged with whatever other processes saved meanwhile).
+    """
+
+    def __init__(self, path=DEFAULT_LAYOUT_CACHE_PATH):
+        self.path = path
+        self.entries = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable layout cache {self.path}: {e}")
+            return {}
+
+    def get(self, fingerprint):
+        with self._lock:
+            if self.entries is None:
+                self.entries = self._load()
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, fingerprint, entry):
+        with self._lock:
+            if self.entries is None:
+                self.entries = self._load()
+            self.entries[fingerprint] = entry
+            if not self.path:
+                return
+            merged = self._load()
+            merged.update(self.entries)
+            self.entries = merged
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp_path, 'w') as f:
+                    json.dump(merged, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Could not save layout cache {self.path}: {e}")
+
+
+_layout_cache = None
+
+
+def get_layout_cache():
+    """
+    The process-wide layout cache. It is in-memory unless the application set a
+    persistent one, e.g. set_layout_cache(LayoutCache(DEFAULT_LAYOUT_CACHE_PATH)).
+    """
+    global _layout_cache
+    if _layout_cache is None:
+        _layout_cache = LayoutCache(None)
+    return _layout_cache
+
+
+def set_layout_cache(cache):
+    """Replace the process-wide layout cache, e.g. LayoutCache(None) for an in-memory one"""
+    global _layout_cache
+    _layout_cache = cache
@@ -0,0 +1,200 @@
+# metrics_module.py
+"""
+Image quality metrics for checking re-encoded textures against their originals.
+
+Every mip level of both CTXRs is decoded to an RGBA NumPy array and compared
+with whole-array operations: PSNR, per-channel mean absolute error, the change
+in alpha coverage (fraction of texels at or above the alpha test threshold)
+and a block SSIM on luminance over non-overlapping 8x8 blocks. Files are
+compared across a process pool and judged against a set of thresholds.
+"""
+import io
+import os
+import math
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from ctxr_utils import read_ctxr, CTXRError
+from layout_module import get_layout
+
+
+SSIM_BLOCK = 8
+# 8-bit SSIM constants (K1 = 0.01, K2 = 0.03, L = 255)
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+ALPHA_TEST_THRESHOLD = 128
+
+# Limits a level must stay within; None disables a check
+DEFAULT_THRESHOLDS = {
+    "min_psnr": 40.0,
+    "min_ssim": 0.98,
+    "max_mae": 2.0,
+    "max_alpha_drift": 0.01,
+}
+
+
+def decode_levels(ctxr):
+    """Decode every level of a CTXR read with read_ctxr to (height, width, 4) RGBA uint8 arrays"""
+    import numpy as np
+
+    width, height = ctxr["width"], ctxr["height"]
+    fmt = "DXT5" if ctxr["is_dxt5"] else "BGRA"
+    layout = get_layout(fmt, width, height, ctxr["mipmap_count"])
+    datas = [ctxr["pixel_data"]] + [mip["data"] for mip in ctxr["mipmap_info"]]
+    levels = []
+    for level, data in zip(layout.levels, datas):
+        if data is None or len(data) < level.size:
+            raise CTXRError(f"Mip level {level.level} is truncated")
+        if ctxr["is_dxt5"]:
+            # Each level is wrapped in a single level DDS and decompressed by PIL
+            from PIL import Image
+            from convert_module import ctxr_to_dds_bytes
+            dds = ctxr_to_dds_bytes({"is_dxt5": True, "width": level.width, "height": level.height,
+                                     "mipmap_count": 1, "pixel_data": data, "mipmap_info": []})
+            levels.append(np.asarray(Image.open(io.BytesIO(dds)).convert("RGBA")))
+        else:
+            bgra = np.frombuffer(data, dtype=np.uint8, count=level.size).reshape(level.height, level.width, 4)
+            levels.append(bgra[..., [2, 1, 0, 3]])
+    return levels
+
+
+def psnr(original, result):
+    """Peak signal-to-noise ratio in dB over all channels (inf for identical arrays)"""
+    import numpy as np
+
+    mse = np.mean((original.astype(np.float32) - result.astype(np.float32)) ** 2)
+    return math.inf if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def channel_mae(original, result):
+    """Mean absolute error of each channel, as a list [R, G, B, A]"""
+    import numpy as np
+
+    diff = np.abs(original.astype(np.int16) - result.astype(np.int16))
+    return [float(value) for value in diff.reshape(-1, diff.shape[-1]).mean(axis=0)]
+
+
+def alpha_coverage(pixels, threshold=ALPHA_TEST_THRESHOLD):
+    """Fraction of texels whose alpha passes an alpha test at threshold"""
+    return float((pixels[..., 3] >= threshold).mean())
+
+
+def block_ssim(original, result, block=SSIM_BLOCK):
+    """Mean SSIM of luminance over non-overlapping block x block tiles"""
+    import numpy as np
+
+    def luminance(pixels):
+        rgb = pixels[..., :3].astype(np.float32)
+        return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    height, width = original.shape[:2]
+    # Textures smaller than a block are compared as one block
+    block_h, block_w = min(block, height), min(block, width)
+    rows, cols = height // block_h, width // block_w
+    x = luminance(original)[:rows * block_h, :cols * block_w].reshape(rows, block_h, cols, block_w)
+    y = luminance(result)[:rows * block_h, :cols * block_w].reshape(rows, block_h, cols, block_w)
+
+    mean_x = x.mean(axis=(1, 3))
+    mean_y = y.mean(axis=(1, 3))
+    var_x = x.var(axis=(1, 3))
+    var_y = y.var(axis=(1, 3))
+    cov = (x * y).mean(axis=(1, 3)) - mean_x * mean_y
+    ssim = ((2 * mean_x * mean_y + SSIM_C1) * (2 * cov + SSIM_C2)) / \
+           ((mean_x ** 2 + mean_y ** 2 + SSIM_C1) * (var_x + var_y + SSIM_C2))
+    return float(ssim.mean())
+
+
+def compare_levels(original_levels, result_levels):
+    """Metrics dict per mip level for two decoded mip chains"""
+    if len(original_levels) != len(result_levels):
+        raise CTXRError(f"Mip count differs: {len(original_levels)} vs {len(result_levels)}")
+    metrics = []
+    for level, (original, result) in enumerate(zip(original_levels, result_levels)):
+        if original.shape != result.shape:
+            raise CTXRError(f"Mip level {level} is {result.shape[1]}x{result.shape[0]}, "
+                            f"expected {original.shape[1]}x{original.shape[0]}")
+        coverage = alpha_coverage(original)
+        metrics.append({
+            "level": level,
+            "psnr": psnr(original, result),
+            "mae": channel_mae(original, result),
+            "ssim": block_ssim(original, result),
+            "alpha_coverage": coverage,
+            "alpha_drift": alpha_coverage(result) - coverage,
+        })
+    return metrics
+
+
+def compare_ctxr_data(original_data, result_data, file_name=""):
+    """Decode two CTXR files' bytes and return compare_levels metrics"""
+    original = read_ctxr(io.BytesIO(original_data), file_name)
+    result = read_ctxr(io.BytesIO(result_data), file_name)
+    return compare_levels(decode_levels(original), decode_levels(result))
+
+
+def threshold_failures(metrics, thresholds=DEFAULT_THRESHOLDS):
+    """Return descriptions of every level metric outside thresholds (empty if all pass)"""
+    failures = []
+    for entry in metrics:
+        level = "main" if entry["level"] == 0 else f"mip {entry['level']}"
+        if thresholds.get("min_psnr") is not None and entry["psnr"] < thresholds["min_psnr"]:
+            failures.append(f"{level}: PSNR {entry['psnr']:.1f} dB")
+        if thresholds.get("min_ssim") is not None and entry["ssim"] < thresholds["min_ssim"]:
+            failures.append(f"{level}: SSIM {entry['ssim']:.4f}")
+        if thresholds.get("max_mae") is not None and max(entry["mae"]) > thresholds["max_mae"]:
+            failures.append(f"{level}: MAE {'/'.join(f'{value:.2f}' for value in entry['mae'])}")
+        if thresholds.get("max_alpha_drift") is not None and abs(entry["alpha_drift"]) > thresholds["max_alpha_drift"]:
+            failures.append(f"{level}: alpha coverage {entry['alpha_drift']:+.2%}")
+    return failures
+
+
+def summarize_metrics(metrics):
+    """Worst values over all levels: min PSNR and SSIM, max channel MAE and |alpha drift|"""
+    return {
+        "psnr": min(entry["psnr"] for entry in metrics),
+        "ssim": min(entry["ssim"] for entry in metrics),
+        "mae": max(max(entry["mae"]) for entry in metrics),
+        "alpha_drift": max(abs(entry["alpha_drift"]) for entry in metrics),
+    }
+
+
+def compare_file(original_path, result_path, thresholds=DEFAULT_THRESHOLDS):
+    """
+    Compare a re-encoded CTXR with its original. Returns a dict with "path",
+    "result_path", "metrics", "failures" and "ok" (or "error").
+    """
+    result = {"path": original_path, "result_path": result_path}
+    try:
+        with open(original_path, 'rb') as f:
+            original_data = f.read()
+        with open(result_path, 'rb') as f:
+            result_data = f.read()
+        result["metrics"] = compare_ctxr_data(original_data, result_data, os.path.basename(original_path))
+    except Exception as e:
+        result["error"] = str(e)
+        result["ok"] = False
+        return result
+    result["failures"] = threshold_failures(result["metrics"], thresholds)
+    result["ok"] = not result["failures"]
+    return result
+
+
+def compare_files(pairs, thresholds=DEFAULT_THRESHOLDS, workers=None):
+    """Compare (original, re-encoded) path pairs across a process pool, yielding results in order"""
+    pairs = list(pairs)
+    logging.info(f"Comparing {len(pairs)} re-encoded CTXR files with their originals")
+    originals = [original for original, _ in pairs]
+    results = [result for _, result in pairs]
+    if workers == 1:
+        for original, result in pairs:
+            yield compare_file(original, result, thresholds)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(pairs) // ((workers or os.cpu_count() or 1) * 8))
+        yield from executor.map(compare_file, originals, results, [thresholds] * len(pairs), chunksize=chunksize)
+
+
+def format_metrics(metrics):
+    """One line with the worst values of a metrics list"""
+    worst = summarize_metrics(metrics)
+    return (f"PSNR {worst['psnr']:.1f} dB, SSIM {worst['ssim']:.4f}, MAE {worst['mae']:.2f}, "
+            f"alpha drift {worst['alpha_drift']:.2%}")
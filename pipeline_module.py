@@ -0,0 +1,206 @@
+# pipeline_module.py
+"""
+Three-stage read -> convert -> write pipeline for batch conversions.
+
+Reader threads prefetch upcoming files into a bounded queue while converter
+threads work and writer threads flush finished outputs, so disk and CPU stay
+busy at the same time. Bounded queues provide backpressure: at most
+read_ahead inputs and write_behind outputs are held in memory at once.
+
+Rough tuning: on spinning disks use a single reader and writer (seeks between
+files hurt more than they help) with a deeper read_ahead; on SSDs more readers
+and writers keep the converters fed.
+"""
+import os
+import queue
+import threading
+import time
+import logging
+
+
+DEFAULT_READ_WORKERS = 2
+DEFAULT_CONVERT_WORKERS = max(1, os.cpu_count() or 1)
+DEFAULT_WRITE_WORKERS = 2
+DEFAULT_READ_AHEAD = 8
+DEFAULT_WRITE_BEHIND = 8
+
+_DONE = object()
+
+
+class StageStats:
+    """Timing counters for one pipeline stage"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0      # seconds spent doing the stage's work
+        self.starved = 0.0   # seconds waiting for input from the previous stage
+        self.blocked = 0.0   # seconds waiting for room in the next stage's queue
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, starved=0.0, blocked=0.0, items=0):
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self.items += items
+
+    def utilization(self, wall_time):
+        """Fraction of the stage's total worker time spent working"""
+        capacity = wall_time * self.workers
+        return self.busy / capacity if capacity > 0 else 0.0
+
+
+def run_pipeline(items, read, convert, write, on_done=None,
+                 read_workers=DEFAULT_READ_WORKERS, convert_workers=DEFAULT_CONVERT_WORKERS,
+                 write_workers=DEFAULT_WRITE_WORKERS, read_ahead=DEFAULT_READ_AHEAD,
+                 write_behind=DEFAULT_WRITE_BEHIND):
+    """
+    Run read(item) -> convert(item, data) -> write(item, output) for every item.
+
+    items may be any iterable (it is consumed lazily). on_done(item, error) is
+    called on the calling thread once per item, with error None on success or
+    the exception raised by whichever stage failed. A failing item never stops
+    the batch, but an exception raised by the items iterator itself does: the
+    readers stop, the items already in flight are finished, and the exception
+    is re-raised here. Returns a dict with "wall_time", "items", "failed" and
+    "stages" (a list of StageStats).
+    """
+    items = iter(items)
+    items_lock = threading.Lock()
+    items_error = []
+    read_queue = queue.Queue(maxsize=max(1, read_ahead))
+    write_queue = queue.Queue(maxsize=max(1, write_behind))
+    done_queue = queue.Queue()
+    stages = [StageStats("read", read_workers), StageStats("convert", convert_workers),
+              StageStats("write", write_workers)]
+    read_stats, convert_stats, write_stats = stages
+
+    def timed_put(target, value, stats):
+        start = time.perf_counter()
+        target.put(value)
+        stats.add(blocked=time.perf_counter() - start)
+
+    def timed_get(source, stats):
+        start = time.perf_counter()
+        value = source.get()
+        stats.add(starved=time.perf_counter() - start)
+        return value
+
+    def reader():
+        while True:
+            start = time.perf_counter()
+            with items_lock:
+                try:
+                    item = _DONE if items_error else next(items, _DONE)
+                except Exception as e:
+                    # The iterator can't go on, so no reader should ask it for more
+                    items_error.append(e)
+                    item = _DONE
+            read_stats.add(starved=time.perf_counter() - start)
+            if item is _DONE:
+                return
+            start = time.perf_counter()
+            try:
+                data = read(item)
+            except Exception as e:
+                read_stats.add(busy=time.perf_counter() - start, items=1)
+                done_queue.put((item, e))
+                continue
+            read_stats.add(busy=time.perf_counter() - start, items=1)
+            timed_put(read_queue, (item, data), read_stats)
+
+    def converter():
+        while True:
+            job = timed_get(read_queue, convert_stats)
+            if job is _DONE:
+                return
+            item, data = job
+            start = time.perf_counter()
+            try:
+                output = convert(item, data)
+            except Exception as e:
+                convert_stats.add(busy=time.perf_counter() - start, items=1)
+                done_queue.put((item, e))
+                continue
+            del data
+            convert_stats.add(busy=time.perf_counter() - start, items=1)
+            timed_put(write_queue, (item, output), convert_stats)
+
+    def writer():
+        while True:
+            job = timed_get(write_queue, write_stats)
+            if job is _DONE:
+                return
+            item, output = job
+            start = time.perf_counter()
+            try:
+                write(item, output)
+                error = None
+            except Exception as e:
+                error = e
+            write_stats.add(busy=time.perf_counter() - start, items=1)
+            done_queue.put((item, error))
+
+    def start_workers(target, count):
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(max(1, count))]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def close_after(threads, target, count):
+        # Once every worker of a stage has finished, tell the next stage to stop
+        def closer():
+            for thread in threads:
+                thread.join()
+            for _ in range(max(1, count)):
+                target.put(_DONE)
+        threading.Thread(target=closer, daemon=True).start()
+
+    wall_start = time.perf_counter()
+    readers = start_workers(reader, read_workers)
+    converters = start_workers(converter, convert_workers)
+    writers = start_workers(writer, write_workers)
+    close_after(readers, read_queue, convert_workers)
+    close_after(converters, write_queue, write_workers)
+    close_after(writers, done_queue, 1)
+
+    completed = failed = 0
+    while True:
+        event = done_queue.get()
+        if event is _DONE:
+            break
+        item, error = event
+        completed += 1
+        if error is not None:
+            failed += 1
+        if on_done is not None:
+            on_done(item, error)
+
+    if items_error:
+        raise items_error[0]
+    return {
+        "wall_time": time.perf_counter() - wall_start,
+        "items": completed,
+        "failed": failed,
+        "stages": stages,
+    }
+
+
+def format_pipeline_stats(result):
+    """Return a short multi-line utilization report for a run_pipeline result"""
+    wall_time = result["wall_time"]
+    lines = [f"{result['items']} items ({result['failed']} failed) in {wall_time:.2f}s"]
+    for stage in result["stages"]:
+        capacity = wall_time * stage.workers or 1.0
+        lines.append(
+            f"  {stage.name:<8} {stage.workers} worker(s): {stage.utilization(wall_time):.0%} busy, "
+            f"{stage.starved / capacity:.0%} waiting for input, {stage.blocked / capacity:.0%} blocked by next stage"
+        )
+    return "\n".join(lines)
+
+
+def log_pipeline_stats(result):
+    for line in format_pipeline_stats(result).splitlines():
+        logging.info(line)
@@ -0,0 +1,261 @@
+# plan_module.py
+"""
+Dry-run planning of batch jobs.
+
+A plan reads only headers (132 bytes per CTXR, the image header of each
+PNG/TGA/DDS to import) and reports what a batch would do without converting
+anything: the files going to each format, the bytes it would write, an
+estimate of the CPU time, and the files it would skip or that would fail.
+
+CPU time is each file's main level megapixels times a seconds-per-megapixel
+rate for its conversion. `python benchmark.py rates` measures the rates on the
+current machine and saves them to DEFAULT_RATES_PATH; DEFAULT_RATES are used for
+anything not measured.
+"""
+import os
+import json
+import struct
+import logging
+from ctxr_utils import parse_header_info, guess_format, atomic_write, DXT5_FILES, CTXRError
+from layout_module import get_layout, CTXR_HEADER_SIZE, PS3_HEADER_SIZE, CTXR_FINAL_PADDING
+
+
+DEFAULT_RATES_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ctxr_converter", "rates.json")
+# Seconds per megapixel of the main level (all mip levels included) on one thread, from benchmark.py rates
+DEFAULT_RATES = {
+    "decode": 0.003,      # read and channel swap an uncompressed CTXR, needed by PNG and DDS
+    "png": 0.062,
+    "tga": 0.001,
+    "tga_rle": 0.046,
+    "dds": 0.064,         # uncompressed: mipmaps regenerated
+    "dds_dxt5": 0.0005,   # DXT5: levels copied across
+    "import_png": 0.071,
+    "import_tga": 0.066,
+    "import_dds": 0.0015,
+    "import_dxt5": 0.49,  # PNG/TGA over a DXT5 original: decoded and block compressed
+}
+# Rough size of a .ctxrmeta sidecar
+SIDECAR_BYTES = 300
+PLAN_JOBS = ("export", "import")
+
+
+def load_rates(path=DEFAULT_RATES_PATH):
+    """DEFAULT_RATES updated with the rates saved by the benchmark at path, if any"""
+    rates = dict(DEFAULT_RATES)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except OSError:
+        return rates
+    except ValueError as e:
+        logging.warning(f"Ignoring invalid rates file {path}: {e}")
+        return rates
+    rates.update({key: float(value) for key, value in saved.get("rates", {}).items() if key in DEFAULT_RATES})
+    return rates
+
+
+def save_rates(rates, path=DEFAULT_RATES_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, json.dumps({"rates": rates}, indent=1, sort_keys=True).encode('utf-8'))
+
+
+def png_size(width, height):
+    """Size of a PNG written with compress_level=0 (stored deflate blocks)"""
+    raw = height * (1 + width * 4)
+    return 8 + 25 + 12 + raw + 5 * (raw // 65535 + 1) + 6 + 12
+
+
+def tga_size(width, height, rle=False):
+    """Size of a 32-bit TGA; for RLE, which depends on the data, the worst case (all raw packets)"""
+    packets = height * -(-width // 128) if rle else 0
+    return 18 + width * height * 4 + packets
+
+
+def new_plan(job):
+    return {"job": job, "files": 0, "input_bytes": 0, "megapixels": 0.0, "formats": {},
+            "output_bytes": 0, "cpu_seconds": 0.0, "skipped": [], "failures": []}
+
+
+def _add_output(plan, fmt, size):
+    entry = plan["formats"].setdefault(fmt, {"files": 0, "bytes": 0})
+    entry["files"] += 1
+    entry["bytes"] += size
+    plan["output_bytes"] += size
+
+
+def plan_export_file(plan, path, formats, rates, tga_rle=False, tga_mipmaps=False, sidecar=True):
+    """Add one CTXR of an export_module.batch_export run to plan"""
+    name = os.path.basename(path)
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(max(CTXR_HEADER_SIZE, PS3_HEADER_SIZE))
+        info = parse_header_info(header)
+    except (OSError, CTXRError) as e:
+        plan["failures"].append((path, f"unreadable header: {e}"))
+        return
+    if info["platform"] != "pc":
+        plan["failures"].append((path, f"{info['platform'].upper()} CTXR: transcode it to PC first"))
+        return
+    fmt = guess_format(info, name)
+    is_dxt5 = name in DXT5_FILES
+    if not is_dxt5 and fmt != "BGRA":
+        plan["failures"].append((path, f"main level is {info['pixel_data_length']} bytes, "
+                                       f"not {info['width']}x{info['height']} BGRA ({fmt})"))
+        return
+    if is_dxt5 and any(out != "dds" for out in formats):
+        plan["failures"].append((path, "DXT5 files can only be exported to DDS, not "
+                                       f"{', '.join(out for out in formats if out != 'dds')}"))
+        return
+
+    layout = get_layout(fmt, info["width"], info["height"], info["mipmap_count"])
+    megapixels = info["width"] * info["height"] / 1e6
+    plan["files"] += 1
+    plan["input_bytes"] += os.path.getsize(path)
+    plan["megapixels"] += megapixels
+    seconds = rates["decode"] if not is_dxt5 and any(out in ("png", "dds") for out in formats) else 0.0
+    for out in formats:
+        if out == "png":
+            _add_output(plan, out, png_size(info["width"], info["height"]))
+        elif out == "tga":
+            levels = layout.levels if tga_mipmaps else layout.levels[:1]
+            _add_output(plan, out, sum(tga_size(level.width, level.height, tga_rle) for level in levels))
+        else:
+            _add_output(plan, out, layout.dds_size)
+        seconds += rates["dds_dxt5" if is_dxt5 else "tga_rle" if out == "tga" and tga_rle else out]
+    if sidecar:
+        _add_output(plan, "ctxrmeta", SIDECAR_BYTES)
+    plan["cpu_seconds"] += seconds * megapixels
+
+
+def plan_export(paths, formats, tga_rle=False, tga_mipmaps=False, sidecar=True, include=None, exclude=None,
+                rates=None):
+    """Plan an export_module.batch_export run from the CTXR headers alone"""
+    from walker_module import walk_paths
+
+    rates = rates or load_rates()
+    plan = new_plan("export")
+    for item in walk_paths(paths, ('.ctxr',), include, exclude):
+        plan_export_file(plan, item.path, formats, rates, tga_rle, tga_mipmaps, sidecar)
+    return plan
+
+
+def _image_info(path):
+    """(width, height, DDS format or None, DDS mip count or 1) of an image from its header"""
+    if path.lower().endswith(".dds"):
+        from dds_module import parse_dds_header, DDS_HEADER_SIZE, DX10_HEADER_SIZE
+        with open(path, 'rb') as f:
+            dds = parse_dds_header(f.read(DDS_HEADER_SIZE + DX10_HEADER_SIZE))
+        return dds["width"], dds["height"], dds["format"], dds["mipmap_count"]
+    if path.lower().endswith(".tga"):
+        from tga_module import read_tga_header, TGA_HEADER_SIZE
+        with open(path, 'rb') as f:
+            tga = read_tga_header(f.read(TGA_HEADER_SIZE))
+        return tga["width"], tga["height"], None, 1
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.width, image.height, None, 1
+
+
+def _template_info(path):
+    """(header, mip paddings, final padding length, format) of a sidecar or original CTXR template"""
+    from sidecar_module import read_sidecar, SIDECAR_EXTENSION
+
+    if path.lower().endswith(SIDECAR_EXTENSION):
+        template = read_sidecar(path)
+        return (template["header"], [len(mip["padding"]) for mip in template["mipmap_info"]],
+                len(template["final_padding"]), template["format"])
+    with open(path, 'rb') as f:
+        header = f.read(CTXR_HEADER_SIZE)
+    info = parse_header_info(header)
+    if info["platform"] != "pc":
+        raise CTXRError(f"template is a {info['platform'].upper()} CTXR")
+    return header, None, None, guess_format(info, os.path.basename(path))
+
+
+def plan_import_file(plan, path, template, rates):
+    """Add one image imported on template (a .ctxrmeta sidecar or original CTXR path) to plan"""
+    try:
+        width, height, dds_format, dds_mipmaps = _image_info(path)
+        header, paddings, final_padding, fmt = _template_info(template)
+    except Exception as e:
+        plan["failures"].append((path, f"unreadable: {e}"))
+        return
+    if fmt == "DXT5" and dds_format not in (None, "DXT5"):
+        plan["failures"].append((path, f"the original is DXT5 but this {dds_format} DDS would be copied "
+                                       "across uncompressed (import a DXT5 DDS, PNG or TGA)"))
+        return
+    if fmt != "DXT5" and dds_format in ("DXT1", "DXT5"):
+        plan["failures"].append((path, f"{dds_format} DDS imported over an uncompressed original"))
+        return
+
+    # Mip levels: the template's count (a DDS brings at most its own)
+    mipmap_count = struct.unpack_from('>B', header, 0x26)[0]
+    if dds_format is not None:
+        mipmap_count = min(max(1, mipmap_count), dds_mipmaps)
+    elif mipmap_count <= 1 or paddings == []:
+        mipmap_count = 1
+    layout = get_layout("DXT5" if fmt == "DXT5" else "BGRA", width, height, mipmap_count,
+                        padding=tuple(paddings or ()),
+                        final_padding=CTXR_FINAL_PADDING if final_padding is None else final_padding)
+
+    megapixels = width * height / 1e6
+    kind = os.path.splitext(path)[1].lower().lstrip('.')
+    plan["files"] += 1
+    plan["input_bytes"] += os.path.getsize(path)
+    plan["megapixels"] += megapixels
+    _add_output(plan, "ctxr", layout.ctxr_size)
+    rate = rates["import_dxt5"] if fmt == "DXT5" and dds_format is None else rates.get(f"import_{kind}",
+                                                                                       rates["import_png"])
+    plan["cpu_seconds"] += rate * megapixels
+
+
+def plan_import(paths, templates=None, include=None, exclude=None, rates=None, output_folder=None, in_place=False):
+    """
+    Plan importing the PNG/TGA/DDS images under paths: on their sidecars, as
+    sidecar_module.batch_import does with output_folder and in_place (so an
+    existing CTXR it wouldn't replace is a predicted failure), or (templates set)
+    on the original CTXR at the same relative path under templates when there is
+    no sidecar, like the GUI's PNG folder import.
+    """
+    from walker_module import walk_paths, mirror_path
+    from sidecar_module import iter_sidecar_images, sidecar_path, import_conflict, IMPORT_EXTENSIONS
+
+    rates = rates or load_rates()
+    plan = new_plan("import")
+    chosen = {item.path for item in iter_sidecar_images(paths, include, exclude)}
+    for item in walk_paths(paths, IMPORT_EXTENSIONS, include, exclude):
+        if item.path in chosen:
+            conflict = import_conflict(item, output_folder, in_place)
+            if conflict:
+                plan["failures"].append((item.path, conflict))
+            else:
+                plan_import_file(plan, item.path, sidecar_path(item.path), rates)
+        elif os.path.exists(sidecar_path(item.path)):
+            plan["skipped"].append((item.path, "a newer export of the same texture is imported instead"))
+        elif templates and os.path.exists(mirror_path(item, templates, '.ctxr', create=False)):
+            plan_import_file(plan, item.path, mirror_path(item, templates, '.ctxr', create=False), rates)
+        else:
+            plan["skipped"].append((item.path, "no sidecar or original CTXR"))
+    return plan
+
+
+def format_plan(plan, workers=None):
+    """Human-readable report of a plan; wall time assumes workers converter threads"""
+    from schedule_module import format_duration
+    from pipeline_module import DEFAULT_CONVERT_WORKERS
+
+    workers = workers or DEFAULT_CONVERT_WORKERS
+    lines = [f"{plan['job'].capitalize()} plan: {plan['files']} files, {plan['input_bytes'] / 1e6:.1f} MB in, "
+             f"{plan['megapixels']:.1f} Mpix"]
+    for fmt, entry in sorted(plan["formats"].items()):
+        lines.append(f"  {fmt:<9}{entry['files']:>8} files {entry['bytes'] / 1e6:>12.1f} MB")
+    lines.append(f"Estimated output: {plan['output_bytes'] / 1e6:.1f} MB")
+    lines.append(f"Estimated CPU time: {format_duration(plan['cpu_seconds'])} "
+                 f"(about {format_duration(plan['cpu_seconds'] / workers)} on {workers} converter threads)")
+    if plan["skipped"]:
+        lines.append(f"Skipped ({len(plan['skipped'])}):")
+        lines += [f"  {path}: {reason}" for path, reason in plan["skipped"]]
+    if plan["failures"]:
+        lines.append(f"Predicted failures ({len(plan['failures'])}):")
+        lines += [f"  {path}: {reason}" for path, reason in plan["failures"]]
+    return "\n".join(lines)
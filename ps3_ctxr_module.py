@@ -1,8 +1,11 @@
 import struct
-import numpy as np
 import os
-from tkinter import filedialog, messagebox
+import logging
 from datetime import datetime
+from functools import lru_cache
+from layout_module import get_layout
+from ctxr_utils import atomic_open
+from walker_module import walk_files
 
 
 
@@ -12,18 +15,190 @@ log_file_path = os.path.join(module_dir, 'no_swizzle.log')
 
 
 
-# Load the no-swizzle set from the log file
-no_swizzle_set = set()
-with open('no_swizzle.log', 'r') as log_file:
-    for line in log_file:
-        file_name = line.strip()
-        if file_name.endswith('.ctxr'):
-            no_swizzle_set.add(file_name)
+@lru_cache(maxsize=None)
+def get_no_swizzle_set():
+    """Load the no-swizzle set from the log file next to this module on first use"""
+    no_swizzle_set = set()
+    try:
+        with open(log_file_path, 'r') as log_file:
+            for line in log_file:
+                file_name = line.strip()
+                if file_name.endswith('.ctxr'):
+                    no_swizzle_set.add(file_name)
+    except FileNotFoundError:
+        logging.warning(f"{log_file_path} not found; assuming all PS3 files are swizzled")
+    logging.info(f"Loaded {len(no_swizzle_set)} no-swizzle entries")
+    return frozenset(no_swizzle_set)
+
+
+# Below this confidence the classifier defers to no_swizzle.log
+SWIZZLE_CONFIDENCE_THRESHOLD = 0.15
+# Rows sampled (as adjacent pairs) by the swizzle classifier
+SWIZZLE_SAMPLE_ROWS = 64
+
+# Byte order of a PS3 pixel rearranged to BGRA, for swizzled and linear data
+# (both are their own inverse, so they also map BGRA back to PS3)
+PS3_SWIZZLED_TO_BGRA = (3, 2, 1, 0)
+PS3_LINEAR_TO_BGRA = (3, 1, 2, 0)
+
+
+@lru_cache(maxsize=64)
+def morton_axis_codes(width, height):
+    """
+    Return (code_x, code_y): the Morton (Z-order) bits contributed by every x and
+    every y. Bits of x and y are interleaved x first, and once one axis runs out
+    of bits the other one continues alone; a pixel's index is code_y[y] | code_x[x].
+    """
+    import numpy as np
+
+    bits_x = int(np.ceil(np.log2(width))) if width > 1 else 0
+    bits_y = int(np.ceil(np.log2(height))) if height > 1 else 0
+    x = np.arange(width, dtype=np.int64)
+    y = np.arange(height, dtype=np.int64)
+    code_x = np.zeros(width, dtype=np.int64)
+    code_y = np.zeros(height, dtype=np.int64)
+    shift = 0
+    for bit in range(max(bits_x, bits_y)):
+        if bit < bits_x:
+            code_x |= ((x >> bit) & 1) << shift
+            shift += 1
+        if bit < bits_y:
+            code_y |= ((y >> bit) & 1) << shift
+            shift += 1
+    code_x.flags.writeable = False
+    code_y.flags.writeable = False
+    return code_x, code_y
+
+
+def morton_index(x, y, width, height):
+    """Morton swizzled buffer index of the pixels at x, y (integer arrays, broadcast together)"""
+    code_x, code_y = morton_axis_codes(width, height)
+    return code_y[y] | code_x[x]
+
+
+# Each table holds 8 bytes per pixel (128 MB at 4096x4096), so keep only a couple
+@lru_cache(maxsize=2)
+def morton_order_table(width, height):
+    """
+    Return, for every pixel in row-major order, the index of that pixel in the
+    Morton swizzled buffer (see morton_axis_codes).
+    """
+    import numpy as np
+
+    table = morton_index(np.arange(width), np.arange(height)[:, None], width, height).ravel()
+    table.flags.writeable = False
+    return table
+
+
+def unswizzle(pixels, width, height):
+    """Reorder an (N, 4) array of Morton-ordered pixels into row-major order"""
+    table = morton_order_table(width, height)
+    if len(table) and table.max() >= len(pixels):
+        raise ValueError(f"Pixel data too short to unswizzle {width}x{height}")
+    return pixels[table]
+
+
+def _roughness(rows):
+    """Mean absolute difference between horizontally and vertically adjacent pixels"""
+    import numpy as np
+
+    rows = rows.astype(np.int16)
+    dx = np.abs(np.diff(rows, axis=2)).mean() if rows.shape[2] > 1 else 0.0
+    dy = np.abs(rows[:, 1] - rows[:, 0]).mean()
+    return float(dx + dy)
+
+
+def detect_swizzle(pixel_data, width, height):
+    """
+    Guess whether PS3 pixel data is Morton swizzled by comparing how coherent
+    neighbouring pixels are in the raw buffer versus the unswizzled one.
+
+    Only a sample of adjacent row pairs is examined, which is cheaper than hashing
+    the data to cache the verdict. Returns (is_swizzled, confidence) with
+    confidence between 0 (no evidence) and 1.
+    """
+    import numpy as np
+
+    pixels = np.frombuffer(pixel_data, dtype=np.uint8).reshape((-1, 4))
+    if width < 2 or height < 2 or len(pixels) < width * height:
+        verdict = (True, 0.0)
+    else:
+        # Pairs of adjacent rows spread evenly over the image
+        starts = np.unique(np.linspace(0, height - 2, min(SWIZZLE_SAMPLE_ROWS, height - 1)).astype(np.int64))
+        rows = np.stack([starts, starts + 1], axis=1)
+        raw_index = rows[..., None] * width + np.arange(width)
+        raw = pixels[raw_index]
+        sampled_index = morton_index(np.arange(width), rows[..., None], width, height)
+        if sampled_index.max() >= len(pixels):
+            verdict = (False, 1.0)
+        else:
+            raw_score = _roughness(raw)
+            morton_score = _roughness(pixels[sampled_index])
+            highest = max(raw_score, morton_score)
+            confidence = abs(raw_score - morton_score) / highest if highest else 0.0
+            verdict = (morton_score < raw_score, confidence)
+    return verdict
+
+
+def should_unswizzle(file_name, pixel_data, width, height):
+    """Decide whether to unswizzle, using no_swizzle.log only when detection is unsure"""
+    is_swizzled, confidence = detect_swizzle(pixel_data, width, height)
+    if confidence < SWIZZLE_CONFIDENCE_THRESHOLD:
+        logging.info(f"{file_name}: swizzle detection unsure ({confidence:.2f}), using no_swizzle.log")
+        return file_name not in get_no_swizzle_set()
+    logging.info(f"{file_name}: detected {'swizzled' if is_swizzled else 'linear'} data ({confidence:.2f})")
+    return is_swizzled
+
+
+def ps3_mip_levels(header, file_size=None):
+    """
+    Return the stored levels of a PS3 CTXR as a list of (width, height, offset, length).
+
+    Levels are stored back-to-back from the pixel data offset (field 16). The main
+    level length comes from field 20, the smaller levels are 4 bytes per pixel, and
+    the chain is cut short where it would run past the pixel data + padding length
+    (field 4) or the end of the file.
+    """
+    total_data_length = struct.unpack_from('>I', header, 4)[0]  # Pixel data + padding
+    pixel_data_offset = struct.unpack_from('>I', header, 16)[0]
+    pixel_data_length = struct.unpack_from('>I', header, 20)[0]  # Main level pixel data length
+    mipmap_count = struct.unpack_from('>B', header, 37)[0]
+    width = struct.unpack_from('>H', header, 44)[0]
+    height = struct.unpack_from('>H', header, 46)[0]
+
+    end = pixel_data_offset + max(total_data_length, pixel_data_length)
+    if file_size is not None:
+        end = min(end, file_size)
+
+    levels = [(width, height, pixel_data_offset, pixel_data_length)]
+    offset = pixel_data_offset + pixel_data_length
+    for level in get_layout("RGBA", width, height, mipmap_count, platform="ps3").levels[1:]:
+        if offset + level.size > end:
+            logging.warning(f"Only {level.level} of {mipmap_count} mip levels are stored in the file")
+            break
+        levels.append((level.width, level.height, offset, level.size))
+        offset += level.size
+    return levels
+
+
+def ps3_level_to_bgra(pixel_data, width, height, swizzled):
+    """Unswizzle (if needed) and reorder one level of PS3 RGBA data for DDS output"""
+    import numpy as np
+
+    pixel_data_array = np.frombuffer(pixel_data, dtype=np.uint8).reshape((-1, 4))
+    if swizzled:
+        # Swizzled images require the Morton order rearrangement
+        unswizzled_array = unswizzle(pixel_data_array, width, height)
+        return unswizzled_array[:, list(PS3_SWIZZLED_TO_BGRA)].tobytes()  # Convert RGBA to BGRA
+    # Non-swizzled images: swap R and B channels (RGBA to BGRA)
+    return pixel_data_array[:, list(PS3_LINEAR_TO_BGRA)].tobytes()
 
-print("No-Swizzle Set:", no_swizzle_set)
 
 def convert_ps3_ctxr_to_dds(file_path=None):
+    from dds_module import load_dds_header_template
+
     if file_path is None:
+        from tkinter import filedialog
         file_path = filedialog.askopenfilename(
             title="Select PS3 CTXR File",
             filetypes=[("CTXR Files", "*.ctxr")]
@@ -32,10 +207,8 @@ def convert_ps3_ctxr_to_dds(file_path=None):
             return  # User cancelled the file selection
             
     output_file_path = file_path.replace('.ctxr', '.dds')
-    dds_header_file = "DDS_header.bin"
     
     file_name = os.path.basename(file_path)
-    should_swizzle = file_name not in no_swizzle_set  # Check if the file needs swizzling
 
     with open(file_path, 'rb') as f:
         header = f.read(128)
@@ -44,94 +217,49 @@ def convert_ps3_ctxr_to_dds(file_path=None):
             print(f"Invalid PS3 CTXR file: {file_path}")
             return
 
-        total_data_length = struct.unpack('>I', header[4:8])[0]  # Pixel data + padding
-        pixel_data_offset = struct.unpack('>I', header[16:20])[0]
-        pixel_data_length = struct.unpack('>I', header[20:24])[0]  # Actual pixel data length
         width = struct.unpack('>H', header[44:46])[0]
         height = struct.unpack('>H', header[46:48])[0]
-        mipmap_count = struct.unpack('>B', header[37:38])[0]
+        levels = ps3_mip_levels(header, os.fstat(f.fileno()).st_size)
 
-        f.seek(pixel_data_offset)
-        pixel_data = f.read(pixel_data_length)  # Read only the actual pixel data
+        # The swizzle verdict for the main level applies to the whole chain
+        f.seek(levels[0][2])
+        pixel_data = f.read(levels[0][3])
+        should_swizzle = should_unswizzle(file_name, pixel_data, width, height)
 
-    if should_swizzle:
-        # Swizzled images require the Morton order rearrangement
-        pixel_data_array = np.frombuffer(pixel_data, dtype=np.uint8)
-
-        def calculate_z_index(x, y, log2_width, log2_height):
-            offset = 0
-            shift_count = 0
-            while x or y:
-                if log2_width > 0:
-                    offset |= (x & 1) << shift_count
-                    x >>= 1
-                    shift_count += 1
-                    log2_width -= 1
-                if log2_height > 0:
-                    offset |= (y & 1) << shift_count
-                    y >>= 1
-                    shift_count += 1
-                    log2_height -= 1
-            return offset
-
-        def image_from_morton_order_rectangular(data, width, height):
-            bits_x = int(np.ceil(np.log2(width)))
-            bits_y = int(np.ceil(np.log2(height)))
-            unswizzled = np.zeros(width * height * 4, dtype=np.uint8)
-
-            for y in range(height):
-                for x in range(width):
-                    z_index = calculate_z_index(x, y, bits_x, bits_y)
-                    src_idx = z_index * 4
-                    dst_idx = (y * width + x) * 4
-                    unswizzled[dst_idx:dst_idx + 4] = data[src_idx:src_idx + 4]
-
-            return unswizzled
-
-        # Apply Morton order rearrangement
-        unswizzled_data = image_from_morton_order_rectangular(pixel_data_array, width, height)
-
-        # Reshape and swap color channels for DDS format
-        unswizzled_array = unswizzled_data.reshape((height, width, 4))
-        unswizzled_array = unswizzled_array[..., [3, 2, 1, 0]]  # Convert RGBA to BGRA
-        swapped_pixel_data = unswizzled_array.tobytes()
-    else:
-        # Non-swizzled images: swap RGBA to BGRA
-        pixel_data_array = np.frombuffer(pixel_data, dtype=np.uint8)
-        pixel_data_array = pixel_data_array.reshape((-1, 4))
-        # Swap R and B channels (RGBA to BGRA)
-        swapped_pixel_data = pixel_data_array[:, [3, 1, 2, 0]].flatten().tobytes()
-
-    with open(dds_header_file, 'rb') as f:
-        dds_header = bytearray(f.read())
+        dds_header = load_dds_header_template()
+        struct.pack_into("<I", dds_header, 12, height)
+        struct.pack_into("<I", dds_header, 16, width)
+        struct.pack_into("<I", dds_header, 28, len(levels))
 
-    struct.pack_into("<I", dds_header, 12, height)
-    struct.pack_into("<I", dds_header, 16, width)
-    struct.pack_into("<I", dds_header, 28, mipmap_count)
-
-    with open(output_file_path, 'wb') as f:
-        f.write(dds_header)
-        f.write(swapped_pixel_data)
+        # Stream every level straight from the CTXR into the DDS
+        with atomic_open(output_file_path) as out_f:
+            out_f.write(dds_header)
+            for level, (mip_w, mip_h, offset, length) in enumerate(levels):
+                if level:
+                    f.seek(offset)
+                    pixel_data = f.read(length)
+                out_f.write(ps3_level_to_bgra(pixel_data, mip_w, mip_h, should_swizzle))
 
     print(f"File saved as {output_file_path}")
 
 
 def batch_convert_ps3_ctxr_to_dds():
+    from tkinter import filedialog, messagebox
+
     directory_path = filedialog.askdirectory(title="Select Folder with PS3 CTXR Files")
     if not directory_path:
         return
 
     error_files = []  # List to collect files that encounter errors
 
-    for file_name in os.listdir(directory_path):
-        if file_name.endswith('.ctxr'):
-            file_path = os.path.join(directory_path, file_name)
-            print(f"Converting: {file_path}")
-            try:
-                convert_ps3_ctxr_to_dds(file_path)
-            except Exception as e:
-                print(f"Error converting {file_path}: {e}")
-                error_files.append(f"{file_name}: {e}")  # Collect the file name and error for logging
+    for item in walk_files(directory_path, ('.ctxr',)):
+        file_name, file_path = item.relative, item.path
+        print(f"Converting: {file_path}")
+        try:
+            convert_ps3_ctxr_to_dds(file_path)
+        except Exception as e:
+            print(f"Error converting {file_path}: {e}")
+            error_files.append(f"{file_name}: {e}")  # Collect the file name and error for logging
 
     # If there were errors, save them to a log file and show a message box
     if error_files:
@@ -0,0 +1,173 @@
+# schedule_module.py
+"""
+Size-aware batch scheduling and byte-based progress.
+
+Batches are ordered largest-first, using payload sizes worked out from each
+CTXR's header (a 132-byte read, no pixel data), so the few huge textures start
+early instead of leaving one worker busy at the end while the rest sit idle.
+ProgressTracker then counts bytes and pixels rather than files and reports
+throughput and an ETA smoothed over recent progress.
+"""
+import os
+import time
+import logging
+import threading
+from ctxr_utils import parse_header_info, guess_format, CTXRError
+from layout_module import get_layout, CTXR_HEADER_SIZE, PS3_HEADER_SIZE
+
+
+SCHEDULE_ORDERS = ("size", "walk")
+
+
+# Weight of the latest throughput sample in the smoothed rate
+ETA_SMOOTHING = 0.2
+# Seconds between smoothed rate samples
+RATE_SAMPLE_INTERVAL = 0.5
+
+
+def measure_ctxr(path):
+    """
+    (payload bytes, pixels) of a CTXR from its header: all mip levels of a
+    recognised format, or the file size and main level pixels otherwise.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(max(CTXR_HEADER_SIZE, PS3_HEADER_SIZE))
+    info = parse_header_info(header)
+    width, height = info["width"], info["height"]
+    fmt = guess_format(info, os.path.basename(path))
+    if fmt == "unknown":
+        return os.path.getsize(path), width * height
+    layout = get_layout(fmt, width, height, info["mipmap_count"],
+                        platform=info["platform"])
+    return layout.dds_size, sum(level.width * level.height for level in layout.levels)
+
+
+def measure_image(path):
+    """(file bytes, pixels) of a PNG/TGA/DDS; only the image header is read"""
+    from PIL import Image
+
+    size = os.path.getsize(path)
+    try:
+        with Image.open(path) as image:
+            return size, image.width * image.height
+    except Exception:
+        return size, 0
+
+
+def _measure(measure, path):
+    try:
+        return measure(path)
+    except (OSError, CTXRError) as e:
+        logging.info(f"Cannot size {path}: {e}")
+        return 0, 0
+
+
+def largest_first(items, measure, key=None):
+    """
+    Measure every item and order them largest payload first.
+
+    measure(path) returns (bytes, pixels); key(item) gives an item's path (the
+    item itself by default). Items that can't be measured count as zero and go
+    last. Returns (ordered items, {path: (bytes, pixels)}).
+    """
+    key = key or (lambda item: item)
+    items = list(items)
+    sizes = {key(item): _measure(measure, key(item)) for item in items}
+    items.sort(key=lambda item: sizes[key(item)][0], reverse=True)
+    return items, sizes
+
+
+def schedule(items, measure, order="size", key=None):
+    """
+    Return (items, ProgressTracker) for a batch. "size" lists and measures
+    everything up front and orders it largest-first; "walk" keeps the items
+    lazy and in walk order, measuring each one only as it finishes (so the
+    totals and ETA are unknown).
+    """
+    if order not in SCHEDULE_ORDERS:
+        raise ValueError(f"Unknown batch order {order!r}")
+    if order == "walk":
+        return items, ProgressTracker(measure=measure)
+    items, sizes = largest_first(items, measure, key)
+    return items, ProgressTracker(sum(size[0] for size in sizes.values()),
+                                  sum(size[1] for size in sizes.values()),
+                                  len(items), sizes, measure)
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ProgressTracker:
+    """
+    Bytes/pixels progress of a batch with throughput and a smoothed ETA.
+
+    sizes maps paths to (bytes, pixels); paths missing from it are measured with
+    measure when they finish. Totals are None when not known in advance.
+    """
+
+    def __init__(self, total_bytes=None, total_pixels=None, total_items=None, sizes=None, measure=None):
+        self.total_bytes = total_bytes
+        self.total_pixels = total_pixels
+        self.total_items = total_items
+        self.sizes = sizes or {}
+        self.measure = measure
+        self.done_bytes = 0
+        self.done_pixels = 0
+        self.done_items = 0
+        self.start = time.perf_counter()
+        self.rate = None             # smoothed bytes per second
+        self._sample_time = self.start
+        self._sample_bytes = 0
+        self._lock = threading.Lock()
+
+    def advance(self, path):
+        """Count one finished item"""
+        size = self.sizes.get(path)
+        if size is None:
+            size = _measure(self.measure, path) if self.measure else (0, 0)
+        with self._lock:
+            self.done_bytes += size[0]
+            self.done_pixels += size[1]
+            self.done_items += 1
+            now = time.perf_counter()
+            if now - self._sample_time >= RATE_SAMPLE_INTERVAL:
+                sample = (self.done_bytes - self._sample_bytes) / (now - self._sample_time)
+                self.rate = sample if self.rate is None else ETA_SMOOTHING * sample + (1 - ETA_SMOOTHING) * self.rate
+                self._sample_time, self._sample_bytes = now, self.done_bytes
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def fraction(self):
+        """Fraction of the bytes done (0 if the total is unknown)"""
+        if not self.total_bytes:
+            return 0.0
+        return min(1.0, self.done_bytes / self.total_bytes)
+
+    def eta(self):
+        """Seconds left, or None without a total or enough progress to estimate"""
+        if self.total_bytes is None:
+            return None
+        rate = self.rate
+        if rate is None:
+            elapsed = self.elapsed()
+            rate = self.done_bytes / elapsed if elapsed > 0 else None
+        if not rate:
+            return None
+        return max(0.0, (self.total_bytes - self.done_bytes) / rate)
+
+    def format(self):
+        """e.g. '12/40 files, 120.5/400.0 MB, 35.2 MB/s, 12.1 Mpix/s, ETA 0:08'"""
+        elapsed = self.elapsed() or 1e-9
+        eta = self.eta()
+        files = f"{self.done_items}/{self.total_items}" if self.total_items is not None else f"{self.done_items}"
+        megabytes = f"{self.done_bytes / 1e6:.1f}"
+        if self.total_bytes is not None:
+            megabytes += f"/{self.total_bytes / 1e6:.1f}"
+        return (f"{files} files, {megabytes} MB, "
+                f"{self.done_bytes / 1e6 / elapsed:.1f} MB/s, {self.done_pixels / 1e6 / elapsed:.1f} Mpix/s, "
+                f"ETA {format_duration(eta) if eta is not None else '?'}")
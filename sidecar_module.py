@@ -0,0 +1,218 @@
+# sidecar_module.py
+"""
+Layout sidecars for stateless re-import.
+
+Exporting a CTXR also writes name.ctxrmeta next to the image: a small JSON file
+holding everything an import takes from the original CTXR (the header, the
+padding before each mip level, the final padding and the format). Importing an
+edited image then needs only the image and its sidecar, so every import is an
+independent task that never opens the original file.
+
+Padding that is all zero bytes (nearly always) is stored as its length,
+anything else as base64.
+"""
+import os
+import io
+import json
+import base64
+import logging
+from itertools import groupby
+from ctxr_utils import atomic_write, CTXRError
+from layout_module import CTXR_HEADER_SIZE
+from walker_module import walk_paths, mirror_path
+
+
+SIDECAR_EXTENSION = ".ctxrmeta"
+SIDECAR_VERSION = 1
+IMPORT_EXTENSIONS = ('.png', '.tga', '.dds')
+
+
+def sidecar_path(image_path):
+    """name.ctxrmeta for name.png / name.tga / name.dds (or name.ctxr)"""
+    return os.path.splitext(image_path)[0] + SIDECAR_EXTENSION
+
+
+def _encode_bytes(data):
+    data = bytes(data)
+    if not data.strip(b'\x00'):
+        return len(data)
+    return base64.b64encode(data).decode('ascii')
+
+
+def _decode_bytes(value):
+    if isinstance(value, int):
+        return b'\x00' * value
+    return base64.b64decode(value)
+
+
+def make_sidecar(ctxr, file_name=""):
+    """Sidecar dict for a CTXR read with read_ctxr"""
+    return {
+        "version": SIDECAR_VERSION,
+        "file_name": file_name,
+        "format": "DXT5" if ctxr["is_dxt5"] else "BGRA",
+        "header": base64.b64encode(bytes(ctxr["header"])).decode('ascii'),
+        "padding": [_encode_bytes(mip["padding"]) for mip in ctxr["mipmap_info"]],
+        "final_padding": _encode_bytes(ctxr["final_padding"]),
+    }
+
+
+def sidecar_bytes(ctxr, file_name=""):
+    return json.dumps(make_sidecar(ctxr, file_name), separators=(',', ':')).encode('utf-8')
+
+
+def write_sidecar(path, ctxr, file_name=""):
+    atomic_write(path, sidecar_bytes(ctxr, file_name))
+
+
+def read_sidecar(path):
+    """
+    Load a sidecar as the template pieces image_to_ctxr takes: a dict with
+    "header", "mipmap_info" (one {"padding": bytes} per mip level), "final_padding",
+    "format" and "file_name". Raises CTXRError if it is missing or invalid.
+    """
+    try:
+        with open(path, 'rb') as f:
+            sidecar = json.loads(f.read())
+    except OSError as e:
+        raise CTXRError(f"Cannot read sidecar {path}: {e}")
+    except ValueError as e:
+        raise CTXRError(f"Invalid sidecar {path}: {e}")
+    if sidecar.get("version") != SIDECAR_VERSION:
+        raise CTXRError(f"Unsupported sidecar version {sidecar.get('version')} in {path}")
+    try:
+        header = base64.b64decode(sidecar["header"])
+        mipmap_info = [{"padding": _decode_bytes(padding)} for padding in sidecar["padding"]]
+        final_padding = _decode_bytes(sidecar["final_padding"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise CTXRError(f"Invalid sidecar {path}: {e}")
+    if len(header) != CTXR_HEADER_SIZE:
+        raise CTXRError(f"Invalid sidecar {path}: header is {len(header)} bytes")
+    return {"header": header, "mipmap_info": mipmap_info, "final_padding": final_padding,
+            "format": sidecar.get("format", "BGRA"), "file_name": sidecar.get("file_name", "")}
+
+
+def template_is_dxt5(template):
+    """Whether a read_sidecar or read_ctxr template is of a DXT5 texture"""
+    return template.get("format") == "DXT5" or bool(template.get("is_dxt5"))
+
+
+def import_image_data(image_data, image_name, template):
+    """
+    CTXR bytes for an image file's contents built on template (a read_sidecar or
+    read_ctxr dict), through the conversion cache. image_name picks the reader.
+    """
+    from convert_module import image_to_ctxr
+    from cache_module import get_conversion_cache
+
+    def convert():
+        source = io.BytesIO(image_data)
+        source.name = image_name  # image_to_ctxr picks the TGA reader by name
+        _, ctxr_data = image_to_ctxr(source, template["header"], template["mipmap_info"],
+                                     template["final_padding"], dxt5=template_is_dxt5(template))
+        return ctxr_data
+
+    parts = [image_data, template["header"], template["final_padding"]]
+    parts += [mip["padding"] for mip in template["mipmap_info"]]
+    options = {"extension": os.path.splitext(image_name)[1].lower(), "dxt5": template_is_dxt5(template)}
+    return get_conversion_cache().convert(parts, "import", options, convert)
+
+
+def import_with_sidecar(image_path, path=None):
+    """Convert an edited image to CTXR bytes using its sidecar (next to it unless path is given)"""
+    template = read_sidecar(path or sidecar_path(image_path))
+    with open(image_path, 'rb') as f:
+        return import_image_data(f.read(), image_path, template)
+
+
+def iter_sidecar_images(paths, include=None, exclude=None):
+    """
+    Yield a walker WorkItem for every PNG/TGA/DDS under paths (files or folders,
+    recursively) that has a sidecar. If a texture was exported to several formats,
+    only the most recently modified one (the edited one) is yielded.
+    """
+    # The walker yields each folder's files together, so duplicates are resolved per folder
+    items = walk_paths(paths, IMPORT_EXTENSIONS, include, exclude)
+    for _, folder_items in groupby(items, key=lambda item: os.path.dirname(item.path)):
+        newest = {}
+        for item in folder_items:
+            key = sidecar_path(item.path)
+            if not os.path.exists(key):
+                continue
+            mtime = os.path.getmtime(item.path)
+            if key not in newest or mtime > newest[key][0]:
+                newest[key] = (mtime, item)
+        for _, item in sorted(newest.values(), key=lambda entry: entry[1].path):
+            yield item
+
+
+def import_output_path(item, output_folder=None, create=True):
+    """CTXR that batch_import writes for an image WorkItem: next to it, or mirrored under output_folder"""
+    if output_folder:
+        return mirror_path(item, output_folder, '.ctxr', create)
+    return os.path.splitext(item.path)[0] + '.ctxr'
+
+
+def import_conflict(item, output_folder=None, in_place=False):
+    """Why batch_import would refuse to write an image's CTXR, or None if it can"""
+    output_path = import_output_path(item, output_folder, create=False)
+    if not output_folder and not in_place and os.path.exists(output_path):
+        return (f"{output_path} already exists (usually the original CTXR); "
+                "import to an output folder or in place")
+    return None
+
+
+def batch_import(paths, output_folder=None, on_done=None, include=None, exclude=None, order="size",
+                 on_progress=None, in_place=False, journal=None, **pipeline_settings):
+    """
+    Import every image with a sidecar under paths through the read-ahead pipeline.
+    Outputs go next to the images (or into the same relative folders under
+    output_folder) as name.ctxr, written atomically; next to the images, an
+    existing CTXR (normally the original) is only replaced with in_place. on_done gets each image
+    path and on_progress the ProgressTracker after each one; order and journal
+    are as for export_module.batch_export. Returns the run_pipeline result dict.
+    """
+    from pipeline_module import run_pipeline, log_pipeline_stats
+    from schedule_module import schedule, measure_image
+
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+
+    def read(item):
+        conflict = import_conflict(item, output_folder, in_place)
+        if conflict:
+            raise CTXRError(conflict)
+        with open(item.path, 'rb') as f:
+            return f.read(), read_sidecar(sidecar_path(item.path))
+
+    def convert(item, data):
+        image_data, template = data
+        return import_image_data(image_data, item.path, template)
+
+    def write(item, ctxr_data):
+        atomic_write(import_output_path(item, output_folder), ctxr_data)
+
+    items = iter_sidecar_images(paths, include, exclude)
+    if journal is not None:
+        items = journal.pending(items, key=lambda item: os.path.abspath(item.path))
+    items, tracker = schedule(items, measure_image, order, key=lambda item: item.path)
+
+    def item_done(item, error):
+        if journal is not None:
+            journal.record(os.path.abspath(item.path), error)
+        if on_done is not None:
+            on_done(item.path, error)
+        tracker.advance(item.path)
+        if on_progress is not None:
+            on_progress(tracker)
+
+    result = run_pipeline(items, read, convert, write, on_done=item_done, **pipeline_settings)
+    log_pipeline_stats(result)
+    logging.info(f"Imported {result['items'] - result['failed']} images using their sidecars")
+    if journal is not None and journal.skipped:
+        logging.info(f"Skipped {journal.skipped} images imported by an earlier run")
+    from cache_module import get_conversion_cache
+    if get_conversion_cache().enabled:
+        logging.info(get_conversion_cache().format_stats())
+    return result
+
@@ -0,0 +1,366 @@
+# streaming_module.py
+"""
+Band-streamed conversion for very large textures.
+
+Upscaled packs have textures of 8192x8192 and more, where decoding the whole
+payload, splitting and merging channels and resizing every mip level holds
+several full copies of the image at once. The functions here go through the
+input in horizontal bands of a fixed byte size (whole 4-row block rows for DXT
+data), so the memory a conversion needs does not grow with the texture:
+
+- CTXR -> PNG: each band is channel swapped into a filter-less PNG scanline
+  buffer and fed to a streaming zlib compressor, written out as IDAT chunks.
+- CTXR -> TGA: bands are copied (or RLE encoded) straight from the BGRA data.
+- DXT5 CTXR -> DDS: levels are copied in bands of block rows.
+- TGA/PNG -> CTXR: bands are written into their place in the output file and
+  fed through a chain of 2x2 box filters that write every mip level as its
+  rows complete. TGAs are decoded band by band; PNGs are decoded by PIL, which
+  only decodes whole images, so they still need one decoded copy in memory.
+
+Streamed imports build mip levels with a box filter rather than the Lanczos
+resize of convert_module.image_to_ctxr.
+"""
+import os
+import mmap
+import zlib
+import struct
+import logging
+from contextlib import contextmanager
+from ctxr_utils import read_mip_chain, atomic_open, patch_ctxr_header, DXT5_FILES, CTXRError
+from layout_module import get_layout, level_size, CTXR_HEADER_SIZE, SIZE_FIELD_LENGTH
+from tga_module import RLE_BAND_ROWS, tga_header, encode_tga_rows, tga_level_path, read_tga_header, iter_tga_bands
+
+
+# Pixel data handled per band
+DEFAULT_BAND_BYTES = 16 * 1024 ** 2
+# Batch exports stream textures with at least this many main level pixels
+STREAM_THRESHOLD_PIXELS = 4096 * 4096
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Compressed PNG data is collected into IDAT chunks of about this size
+PNG_IDAT_SIZE = 1024 ** 2
+DXT_BLOCK_ROWS = 4
+
+
+def band_rows(width, bytes_per_pixel=4, band_bytes=DEFAULT_BAND_BYTES):
+    """Rows per band so a band holds about band_bytes of pixel data (at least one row)"""
+    return max(1, band_bytes // max(1, width * bytes_per_pixel))
+
+
+@contextmanager
+def open_ctxr(path):
+    """
+    Open a PC CTXR and parse its header and mip chain layout without reading
+    any pixel data. Yields a dict with "file", "header", "width", "height",
+    "mipmap_count", "is_dxt5", "mipmap_info", "final_padding" and "levels",
+    one (offset, width, height) per stored level.
+    """
+    with open(path, 'rb') as data:
+        header = data.read(CTXR_HEADER_SIZE)
+        if len(header) != CTXR_HEADER_SIZE:
+            raise CTXRError("File is too small to contain a CTXR header")
+        width = struct.unpack_from('>H', header, 8)[0]
+        height = struct.unpack_from('>H', header, 10)[0]
+        mipmap_count = struct.unpack_from('>B', header, 0x26)[0]
+        pixel_data_length = struct.unpack_from('>I', header, 0x80)[0]
+        is_dxt5 = os.path.basename(path) in DXT5_FILES
+
+        mipmap_info, final_padding = [], b""
+        if mipmap_count > 1:
+            data.seek(CTXR_HEADER_SIZE + pixel_data_length)
+            mipmap_info, final_padding = read_mip_chain(
+                data, header, mipmap_count, width, height, is_compressed=is_dxt5,
+                compression_format='DXT5' if is_dxt5 else 'UNCOMPRESSED', skip_data=True)
+        layout = get_layout("DXT5" if is_dxt5 else "BGRA", width, height, mipmap_count)
+        levels = [(CTXR_HEADER_SIZE, width, height)]
+        levels += [(mip["offset"], level.width, level.height) for mip, level in zip(mipmap_info, layout.levels[1:])]
+        yield {"file": data, "header": header, "width": width, "height": height, "mipmap_count": mipmap_count,
+               "is_dxt5": is_dxt5, "mipmap_info": mipmap_info, "final_padding": final_padding, "levels": levels}
+
+
+def _level_bytes(ctxr, offset, start, length):
+    """length bytes of a level from start, zero padded where the file ends early"""
+    ctxr["file"].seek(offset + start)
+    data = ctxr["file"].read(length)
+    return data + b'\x00' * (length - len(data))
+
+
+def _bgra_bands(ctxr, level, band_bytes):
+    """Yield (top row, (rows, width, 4) BGRA array) bands of an uncompressed level"""
+    import numpy as np
+
+    offset, width, height = ctxr["levels"][level]
+    rows = band_rows(width, band_bytes=band_bytes)
+    for top in range(0, height, rows):
+        count = min(rows, height - top)
+        data = _level_bytes(ctxr, offset, top * width * 4, count * width * 4)
+        yield top, np.frombuffer(data, dtype=np.uint8).reshape(count, width, 4)
+
+
+class PNGStreamWriter:
+    """Writes an 8-bit RGBA PNG to a file object band by band (filter type None on every row)"""
+
+    def __init__(self, file_obj, width, height, compress_level=0):
+        self.file = file_obj
+        self.width = width
+        self.compressor = zlib.compressobj(compress_level)
+        self.pending = []
+        self.pending_size = 0
+        file_obj.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def _queue(self, data, flush=False):
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+        if self.pending and (flush or self.pending_size >= PNG_IDAT_SIZE):
+            self._chunk(b'IDAT', b''.join(self.pending))
+            self.pending, self.pending_size = [], 0
+
+    def write_rows(self, pixels, order="RGBA"):
+        """Append (rows, width, 4) pixels in RGBA or BGRA order"""
+        import numpy as np
+
+        rows = pixels.shape[0]
+        scanlines = np.zeros((rows, 1 + self.width * 4), dtype=np.uint8)  # first byte: filter type 0
+        out = scanlines[:, 1:].reshape(rows, self.width, 4)
+        if order == "BGRA":
+            # Channels are copied one at a time so no swapped copy of the band is made
+            for target, source in enumerate((2, 1, 0, 3)):
+                out[..., target] = pixels[..., source]
+        else:
+            out[...] = pixels
+        self._queue(self.compressor.compress(scanlines))
+
+    def close(self):
+        self._queue(self.compressor.flush(), flush=True)
+        self._chunk(b'IEND', b'')
+
+
+def stream_ctxr_to_png(path, output_path, band_bytes=DEFAULT_BAND_BYTES, compress_level=0):
+    """Write the main level of an uncompressed CTXR as a PNG, one band at a time"""
+    with open_ctxr(path) as ctxr:
+        if ctxr["is_dxt5"]:
+            raise CTXRError("DXT5 files can only be exported to DDS")
+        with atomic_open(output_path) as f:
+            writer = PNGStreamWriter(f, ctxr["width"], ctxr["height"], compress_level)
+            for _, band in _bgra_bands(ctxr, 0, band_bytes):
+                writer.write_rows(band, order="BGRA")
+            writer.close()
+
+
+def stream_ctxr_to_tga(path, output_path, rle=False, mipmaps=False, band_bytes=DEFAULT_BAND_BYTES):
+    """Write an uncompressed CTXR as TGA (with mipmaps, one file per level), one band at a time"""
+    with open_ctxr(path) as ctxr:
+        if ctxr["is_dxt5"]:
+            raise CTXRError("DXT5 files can only be exported to DDS")
+        for level in range(len(ctxr["levels"]) if mipmaps else 1):
+            _, width, height = ctxr["levels"][level]
+            # The RLE encoder's index arrays are several times the band, so its bands stay smaller
+            rle_band_bytes = min(band_bytes, RLE_BAND_ROWS * width * 4) if rle else band_bytes
+            with atomic_open(tga_level_path(output_path, level)) as f:
+                f.write(tga_header(width, height, rle))
+                for _, band in _bgra_bands(ctxr, level, rle_band_bytes):
+                    f.write(encode_tga_rows(band, width, rle))
+
+
+def stream_ctxr_to_dds(path, output_path, band_bytes=DEFAULT_BAND_BYTES):
+    """Copy a DXT5 CTXR's levels into a DDS in bands of whole block rows"""
+    from convert_module import dxt5_dds_header
+
+    with open_ctxr(path) as ctxr:
+        if not ctxr["is_dxt5"]:
+            raise CTXRError("Only DXT5 files are streamed to DDS (uncompressed files get regenerated mipmaps)")
+        layout = get_layout("DXT5", ctxr["width"], ctxr["height"], ctxr["mipmap_count"])
+        with atomic_open(output_path) as f:
+            f.write(dxt5_dds_header(ctxr["width"], ctxr["height"], ctxr["mipmap_count"], layout.levels[0].size))
+            for level in layout.levels:
+                # Levels missing from the file are written as zeros, like ctxr_to_dds_bytes does
+                offset = ctxr["levels"][level.level][0] if level.level < len(ctxr["levels"]) else ctxr["file"].seek(0, os.SEEK_END)
+                row_bytes = level_size(level.width, DXT_BLOCK_ROWS, "DXT5")
+                step = max(1, band_bytes // row_bytes) * row_bytes
+                for start in range(0, level.size, step):
+                    f.write(_level_bytes(ctxr, offset, start, min(step, level.size - start)))
+
+
+def can_stream(fmt, is_dxt5):
+    """True if export format fmt can be streamed for a DXT5 or uncompressed CTXR"""
+    return fmt == "dds" if is_dxt5 else fmt in ("png", "tga")
+
+
+def should_stream(path, formats, threshold=STREAM_THRESHOLD_PIXELS):
+    """True if a CTXR's main level has at least threshold pixels and every format can be streamed"""
+    with open(path, 'rb') as f:
+        header = f.read(CTXR_HEADER_SIZE)
+    if len(header) != CTXR_HEADER_SIZE:
+        return False
+    width, height = struct.unpack_from('>HH', header, 8)
+    is_dxt5 = os.path.basename(path) in DXT5_FILES
+    return width * height >= threshold and all(can_stream(fmt, is_dxt5) for fmt in formats)
+
+
+def stream_export(path, outputs, tga_rle=False, tga_mipmaps=False, sidecar=False, band_bytes=DEFAULT_BAND_BYTES):
+    """
+    Stream a CTXR to every {format: output path} in outputs (see can_stream).
+    Returns {"ctxrmeta": sidecar bytes} with sidecar, else {}, to be written like
+    export_module.export_ctxr_data's outputs.
+    """
+    from sidecar_module import sidecar_bytes, SIDECAR_EXTENSION
+
+    for fmt, output_path in outputs.items():
+        if fmt == "png":
+            stream_ctxr_to_png(path, output_path, band_bytes)
+        elif fmt == "tga":
+            stream_ctxr_to_tga(path, output_path, tga_rle, tga_mipmaps, band_bytes)
+        elif fmt == "dds":
+            stream_ctxr_to_dds(path, output_path, band_bytes)
+        else:
+            raise ValueError(f"Format {fmt} cannot be streamed")
+    if not sidecar:
+        return {}
+    with open_ctxr(path) as ctxr:
+        return {SIDECAR_EXTENSION[1:]: sidecar_bytes(ctxr, os.path.basename(path))}
+
+
+class _BoxMipChain:
+    """
+    Streaming 2x2 box filter from one mip level to the next. Bands may come in
+    any order (bottom-left TGAs arrive bottom band first): a band's unpaired edge
+    row waits in pending until its partner row arrives.
+    """
+
+    def __init__(self, width, height, emit):
+        self.width = width
+        self.height = height
+        self.emit = emit  # emit(top row, (rows, width, 4) pixels) of the next level
+        self.pending = {}
+
+    def _filter(self, groups):
+        """(n, 1 or 2, width, 4) row groups -> (n, next width, 4)"""
+        import numpy as np
+
+        total = groups.astype(np.uint16).sum(axis=1)
+        divisor = groups.shape[1]
+        if self.width > 1:
+            half = self.width // 2
+            total = total[:, 0:2 * half:2] + total[:, 1:2 * half:2]
+            divisor *= 2
+        return ((total + divisor // 2) // divisor).astype(np.uint8)
+
+    def _single(self, row, pixels):
+        import numpy as np
+
+        partner_row = row ^ 1
+        if partner_row >= self.height:
+            return  # the last row of an odd height level is dropped, like the odd column
+        partner = self.pending.pop(partner_row, None)
+        if partner is None:
+            self.pending[row] = pixels.copy()
+            return
+        pair = (partner, pixels) if partner_row < row else (pixels, partner)
+        self.emit(row // 2, self._filter(np.stack(pair)[None]))
+
+    def feed(self, top, rows):
+        """Take rows top .. top + len(rows) - 1 of this level"""
+        if self.height == 1:
+            self.emit(0, self._filter(rows[:, None]))
+            return
+        start, end = 0, len(rows)
+        if top % 2:
+            self._single(top, rows[0])
+            start = 1
+        if (end - start) % 2:
+            self._single(top + end - 1, rows[end - 1])
+            end -= 1
+        if end > start:
+            pairs = rows[start:end].reshape((end - start) // 2, 2, self.width, 4)
+            self.emit((top + start) // 2, self._filter(pairs))
+
+
+@contextmanager
+def _image_bands(image_path, band_bytes):
+    """Yield (width, height, band iterator) of an image's (top row, BGRA rows) bands"""
+    import numpy as np
+
+    if image_path.lower().endswith(".dds"):
+        raise CTXRError("DDS files bring their own mip chain and are not streamed")
+    if image_path.lower().endswith(".tga"):
+        with open(image_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        def bands():
+            for band in iter_tga_bands(data, band_rows(tga["width"], band_bytes=band_bytes)):
+                yield band
+                if hasattr(mmap, "MADV_DONTNEED"):
+                    # Decoded bands are copies, so the mapped pages read so far can be dropped
+                    data.madvise(mmap.MADV_DONTNEED)
+
+        try:
+            tga = read_tga_header(data)
+            yield tga["width"], tga["height"], bands()
+        finally:
+            data.close()
+        return
+
+    from PIL import Image
+    with Image.open(image_path) as image:
+        width, height = image.size
+
+        def bands():
+            # PIL decodes the whole image on the first crop; only the RGBA/BGRA copies are per band
+            rows = band_rows(width, band_bytes=band_bytes)
+            for top in range(0, height, rows):
+                band = image.crop((0, top, width, min(height, top + rows))).convert("RGBA")
+                yield top, np.asarray(band)[..., (2, 1, 0, 3)]
+
+        yield width, height, bands()
+
+
+def stream_image_to_ctxr(image_path, template, output_path, band_bytes=DEFAULT_BAND_BYTES):
+    """
+    Import a PNG/TGA as a BGRA CTXR on template (a read_sidecar or read_ctxr
+    dict), writing each band straight into its place in the output file. Mip
+    levels are 2x2 box filtered as the bands pass through. Returns the layout.
+    """
+    import numpy as np
+
+    if template.get("format", "BGRA") != "BGRA" or template.get("is_dxt5"):
+        raise CTXRError("Only uncompressed CTXRs can be imported by streaming")
+    mipmap_count = struct.unpack_from('>B', template["header"], 0x26)[0]
+    mipmap_info = template["mipmap_info"]
+    if mipmap_count <= 1 or not mipmap_info:
+        mipmap_count = 1
+    paddings = [mipmap_info[i]["padding"] if i < len(mipmap_info) else b"" for i in range(mipmap_count - 1)]
+
+    with _image_bands(image_path, band_bytes) as (width, height, bands):
+        layout = get_layout("BGRA", width, height, mipmap_count, padding=tuple(len(p) for p in paddings),
+                            final_padding=len(template["final_padding"]))
+        with atomic_open(output_path) as f:
+            f.write(patch_ctxr_header(template["header"], width, height, mipmap_count, layout.levels[0].size))
+            for level, padding in zip(layout.levels[1:], paddings):
+                f.seek(level.ctxr_offset - SIZE_FIELD_LENGTH - len(padding))
+                f.write(padding + struct.pack('>I', level.size))
+            last = layout.levels[-1]
+            f.seek(last.ctxr_offset + last.size)
+            f.write(template["final_padding"])
+
+            def writer(index):
+                level = layout.levels[index]
+
+                def emit(top, rows):
+                    f.seek(level.ctxr_offset + top * level.width * 4)
+                    f.write(np.ascontiguousarray(rows).data)
+                    if index + 1 < len(layout.levels):
+                        chains[index].feed(top, rows)
+                return emit
+
+            chains = [_BoxMipChain(level.width, level.height, writer(level.level + 1))
+                      for level in layout.levels[:-1]]
+            emit_main = writer(0)
+            for top, rows in bands:
+                emit_main(top, rows)
+    logging.debug(f"Streamed {image_path} to {output_path} ({width}x{height}, {mipmap_count} levels)")
+    return layout
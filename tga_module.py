@@ -0,0 +1,292 @@
+# tga_module.py
+"""
+32-bit TGA reading and writing straight from BGRA buffers.
+
+TGA stores truecolor pixels as BGRA, the same order as PC CTXR data, so CTXR
+levels are written without any channel reshuffle. Writing can optionally use
+RLE (image type 10), which shrinks flat UI and alpha-heavy textures a lot; the
+run detection and packet assembly are done with NumPy array operations.
+"""
+import os
+import struct
+from ctxr_utils import CTXRError
+from layout_module import get_layout
+
+
+TGA_HEADER_SIZE = 18
+TGA_TYPE_TRUECOLOR = 2
+TGA_TYPE_RLE_TRUECOLOR = 10
+TGA_DESCRIPTOR_TOP_LEFT = 0x20
+TGA_DESCRIPTOR_RIGHT_TO_LEFT = 0x10
+TGA_MAX_PACKET = 128
+
+# Rows encoded per RLE band; keeps the index arrays bounded for large textures
+RLE_BAND_ROWS = 256
+
+
+def tga_header(width, height, rle=False):
+    """18-byte header for a top-left origin 32-bit TGA with 8 alpha bits"""
+    return struct.pack('<BBBHHBHHHHBB', 0, 0, TGA_TYPE_RLE_TRUECOLOR if rle else TGA_TYPE_TRUECOLOR,
+                       0, 0, 0, 0, 0, width, height, 32, TGA_DESCRIPTOR_TOP_LEFT | 8)
+
+
+def _rle_encode_rows(pixels):
+    """RLE encode a (rows, width) uint32 array; packets never cross a scanline"""
+    import numpy as np
+
+    rows, width = pixels.shape
+    flat = pixels.reshape(-1)
+    count = flat.size
+
+    # Runs of identical pixels, split at row starts and at the 128 pixel packet limit
+    is_start = np.ones(count, dtype=bool)
+    is_start[1:] = flat[1:] != flat[:-1]
+    is_start[::width] = True
+    run_starts = np.flatnonzero(is_start)
+    run_lengths = np.diff(np.append(run_starts, count))
+    run_starts, run_lengths = _split_runs(run_starts, run_lengths)
+
+    # Runs of one pixel are gathered into raw packets, everything else is a repeat packet
+    single = run_lengths == 1
+    raw_start = single.copy()
+    raw_start[1:] &= ~single[:-1] | (run_starts[1:] % width == 0)
+    group_ids = np.cumsum(raw_start)[single] - 1
+    raw_starts = run_starts[raw_start]
+    raw_counts = np.bincount(group_ids, minlength=raw_starts.size)
+    raw_starts, raw_counts = _split_runs(raw_starts, raw_counts)
+    rep_starts = run_starts[~single]
+    rep_counts = run_lengths[~single]
+
+    # Merge both packet kinds back into pixel order
+    starts = np.concatenate([rep_starts, raw_starts])
+    counts = np.concatenate([rep_counts, raw_counts])
+    is_raw = np.concatenate([np.zeros(rep_starts.size, dtype=bool), np.ones(raw_starts.size, dtype=bool)])
+    order = np.argsort(starts, kind='stable')
+    starts, counts, is_raw = starts[order], counts[order], is_raw[order]
+
+    payload = np.where(is_raw, counts * 4, 4)
+    offsets = np.cumsum(1 + payload) - (1 + payload)
+    out = np.empty(int((1 + payload).sum()), dtype=np.uint8)
+    out[offsets] = np.where(is_raw, counts - 1, 0x80 | (counts - 1)).astype(np.uint8)
+
+    src = flat.view(np.uint8)
+    # Repeat packets: one pixel after the packet byte
+    rep = ~is_raw
+    out[offsets[rep, None] + 1 + np.arange(4)] = src[starts[rep, None] * 4 + np.arange(4)]
+    # Raw packets: count pixels copied verbatim
+    raw_bytes = payload[is_raw]
+    within = np.arange(int(raw_bytes.sum())) - np.repeat(np.cumsum(raw_bytes) - raw_bytes, raw_bytes)
+    out[np.repeat(offsets[is_raw] + 1, raw_bytes) + within] = src[np.repeat(starts[is_raw] * 4, raw_bytes) + within]
+    return out
+
+
+def _split_runs(starts, lengths):
+    """Split (start, length) runs longer than one TGA packet into 128 pixel pieces"""
+    import numpy as np
+
+    pieces = (lengths + TGA_MAX_PACKET - 1) // TGA_MAX_PACKET
+    if not (pieces > 1).any():
+        return starts, lengths
+    index = np.arange(int(pieces.sum())) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    new_starts = np.repeat(starts, pieces) + index * TGA_MAX_PACKET
+    new_lengths = np.minimum(TGA_MAX_PACKET, np.repeat(starts + lengths, pieces) - new_starts)
+    return new_starts, new_lengths
+
+
+def encode_tga(bgra, width, height, rle=False):
+    """
+    Encode a top-down BGRA buffer (bytes, memoryview or NumPy array) as TGA file bytes.
+    The pixel data is written as-is; with rle the scanlines are run-length encoded.
+    """
+    expected = width * height * 4
+    data = memoryview(bgra).cast('B')
+    if len(data) < expected:
+        raise CTXRError(f"TGA pixel data too short: {len(data)} < {expected} bytes")
+    data = data[:expected]
+    if not rle:
+        return tga_header(width, height) + data.tobytes()
+
+    out = bytearray(tga_header(width, height, rle=True))
+    row_bytes = width * 4
+    for row in range(0, height, RLE_BAND_ROWS):
+        out += encode_tga_rows(data[row * row_bytes:(row + RLE_BAND_ROWS) * row_bytes], width, rle=True)
+    return bytes(out)
+
+
+def encode_tga_rows(bgra, width, rle=False):
+    """
+    Pixel data for whole top-down BGRA scanlines of a TGA written with tga_header,
+    so a large image can be encoded band by band.
+    """
+    data = memoryview(bgra).cast('B')
+    if not rle:
+        return data.tobytes()
+
+    import numpy as np
+    pixels = np.frombuffer(data, dtype=np.uint32).reshape(-1, width)
+    return _rle_encode_rows(pixels).tobytes()
+
+
+def image_to_tga(image, rle=False):
+    """Encode a PIL image as TGA file bytes"""
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    return encode_tga(image.tobytes('raw', 'BGRA'), image.width, image.height, rle)
+
+
+def ctxr_to_tga_levels(ctxr, rle=False, mipmaps=False):
+    """
+    TGA file bytes for an uncompressed CTXR read with read_ctxr: the main level, then
+    (with mipmaps) one file per mip level. Mip data shorter than its level is zero padded.
+    """
+    if ctxr["is_dxt5"]:
+        raise CTXRError("DXT5 files can only be exported to DDS")
+    width, height = ctxr["width"], ctxr["height"]
+    levels = [encode_tga(ctxr["pixel_data"], width, height, rle)]
+    if mipmaps:
+        layout = get_layout("BGRA", width, height, ctxr["mipmap_count"])
+        for level, mip_info in zip(layout.levels[1:], ctxr["mipmap_info"]):
+            mip_data = mip_info["data"][:level.size]
+            mip_data += b'\x00' * (level.size - len(mip_data))
+            levels.append(encode_tga(mip_data, level.width, level.height, rle))
+    return levels
+
+
+def tga_level_path(file_path, level):
+    """Path for mip level N of a TGA export: name.tga, name_mip1.tga, name_mip2.tga, ..."""
+    if level == 0:
+        return file_path
+    root, ext = os.path.splitext(file_path)
+    return f"{root}_mip{level}{ext}"
+
+
+def _rle_decode(data, offset, pixel_count, bytes_per_pixel):
+    return _rle_decode_band(data, offset, pixel_count, bytes_per_pixel)[0]
+
+
+def _rle_decode_band(data, offset, pixel_count, bytes_per_pixel, carry=b""):
+    """
+    Decode pixel_count pixels starting at offset, after the carry left by the
+    previous band. Returns (pixels, next offset, carry): a packet running past
+    the band leaves its extra pixels as the next band's carry.
+    """
+    end = pixel_count * bytes_per_pixel
+    out = bytearray(carry[:end])
+    carry = carry[end:]
+    pos = len(out)
+    out.extend(bytes(end - pos))
+    while pos < end:
+        if offset >= len(data):
+            raise CTXRError("TGA RLE data ends early")
+        packet = data[offset]
+        count = (packet & 0x7F) + 1
+        length = count * bytes_per_pixel
+        if packet & 0x80:
+            out[pos:pos + length] = data[offset + 1:offset + 1 + bytes_per_pixel] * count
+            offset += 1 + bytes_per_pixel
+        else:
+            out[pos:pos + length] = data[offset + 1:offset + 1 + length]
+            offset += 1 + length
+        pos += length
+    return out[:end], offset, carry + bytes(out[end:])
+
+
+def read_tga_header(data):
+    """
+    Parse a truecolor TGA header. Returns a dict with "width", "height",
+    "bytes_per_pixel", "rle", "top_down", "right_to_left" and "data_offset".
+    """
+    if len(data) < TGA_HEADER_SIZE:
+        raise CTXRError("File too small to be a TGA")
+    (id_length, colormap_type, image_type, _, colormap_length, colormap_depth,
+     _, _, width, height, bits, descriptor) = struct.unpack_from('<BBBHHBHHHHBB', data)
+    if colormap_type != 0 or image_type not in (TGA_TYPE_TRUECOLOR, TGA_TYPE_RLE_TRUECOLOR):
+        raise CTXRError(f"Unsupported TGA type {image_type} (only truecolor TGAs are supported)")
+    if bits not in (24, 32):
+        raise CTXRError(f"Unsupported TGA bit depth {bits}")
+    return {"width": width, "height": height, "bytes_per_pixel": bits // 8,
+            "rle": image_type == TGA_TYPE_RLE_TRUECOLOR, "top_down": bool(descriptor & TGA_DESCRIPTOR_TOP_LEFT),
+            "right_to_left": bool(descriptor & TGA_DESCRIPTOR_RIGHT_TO_LEFT),
+            "data_offset": TGA_HEADER_SIZE + id_length}
+
+
+def iter_tga_bands(data, band_rows):
+    """
+    Decode a TGA (bytes or a memory map) band_rows scanlines at a time, in file
+    order. Yields (top row, pixels): pixels is a (rows, width, 4) BGRA NumPy array
+    already in top-down orientation, covering rows top row .. top row + rows - 1.
+    """
+    import numpy as np
+
+    tga = read_tga_header(data)
+    width, height, bytes_per_pixel = tga["width"], tga["height"], tga["bytes_per_pixel"]
+    row_bytes = width * bytes_per_pixel
+    offset, carry = tga["data_offset"], b""
+    for start in range(0, height, band_rows):
+        rows = min(band_rows, height - start)
+        if tga["rle"]:
+            raw, offset, carry = _rle_decode_band(data, offset, rows * width, bytes_per_pixel, carry)
+        else:
+            raw = data[offset:offset + rows * row_bytes]
+            offset += rows * row_bytes
+            if len(raw) < rows * row_bytes:
+                raise CTXRError("TGA pixel data ends early")
+        pixels = np.frombuffer(raw, dtype=np.uint8).reshape(rows, width, bytes_per_pixel)
+        if bytes_per_pixel == 3:
+            opaque = np.full((rows, width, 4), 255, dtype=np.uint8)
+            opaque[..., :3] = pixels
+            pixels = opaque
+        if tga["right_to_left"]:
+            pixels = pixels[:, ::-1]
+        if tga["top_down"]:
+            yield start, pixels
+        else:
+            yield height - start - rows, pixels[::-1]
+
+
+def read_tga(source):
+    """
+    Read an uncompressed or RLE truecolor TGA (24 or 32 bit) from a path, bytes or file object.
+
+    Returns a dict with "width", "height" and "pixels", a (height, width, 4) BGRA NumPy
+    array in top-down order. The descriptor's origin bits are honoured with flipped
+    views of the decoded rows, so bottom-left TGAs are not copied just to reorient them.
+    """
+    import numpy as np
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            data = f.read()
+    elif hasattr(source, 'read'):
+        data = source.read()
+    else:
+        data = bytes(source)
+    tga = read_tga_header(data)
+    width, height, bytes_per_pixel = tga["width"], tga["height"], tga["bytes_per_pixel"]
+    offset = tga["data_offset"]
+    if tga["rle"]:
+        raw = _rle_decode(data, offset, width * height, bytes_per_pixel)
+    else:
+        raw = memoryview(data)[offset:offset + width * height * bytes_per_pixel]
+        if len(raw) < width * height * bytes_per_pixel:
+            raise CTXRError("TGA pixel data ends early")
+
+    pixels = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, bytes_per_pixel)
+    if bytes_per_pixel == 3:
+        opaque = np.full((height, width, 4), 255, dtype=np.uint8)
+        opaque[..., :3] = pixels
+        pixels = opaque
+    if not tga["top_down"]:
+        pixels = pixels[::-1]
+    if tga["right_to_left"]:
+        pixels = pixels[:, ::-1]
+    return {"width": width, "height": height, "pixels": pixels}
+
+
+def tga_to_image(source):
+    """Read a TGA (see read_tga) as a PIL RGBA image in the right orientation"""
+    from PIL import Image
+
+    tga = read_tga(source)
+    pixels = tga["pixels"]
+    return Image.frombuffer('RGBA', (tga["width"], tga["height"]), pixels.tobytes(), 'raw', 'BGRA', 0, 1)
@@ -0,0 +1,169 @@
+# verify_module.py
+import os
+import io
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from ctxr_utils import read_ctxr, iter_ctxr_files, parse_header_info, CTXR_HEADER_SIZE, PS3_HEADER_SIZE
+from convert_module import ctxr_to_dds_bytes, image_to_ctxr
+from dds_module import dds_to_ctxr_bytes
+
+
+# Round-trip paths that can be verified:
+#   "gui":   open_file (CTXR -> DDS) followed by save_as_ctxr (DDS -> CTXR)
+#   "batch": batch_convert_ctxr_to_dds followed by dds_module.dds_to_ctxr
+VERIFY_MODES = ("gui", "batch")
+
+
+def ctxr_regions(ctxr, file_size):
+    """
+    Return the regions of a parsed CTXR as a list of (name, start, end) tuples.
+    Region names are "header", "main", "mip N padding", "mip N" and "final padding".
+    """
+    regions = [("header", 0, CTXR_HEADER_SIZE)]
+    pos = CTXR_HEADER_SIZE + len(ctxr["pixel_data"])
+    regions.append(("main", CTXR_HEADER_SIZE, pos))
+    for level, mip in enumerate(ctxr["mipmap_info"], start=1):
+        # Padding and (for uncompressed files) the size field precede the data
+        if mip["offset"] > mip["start"]:
+            regions.append((f"mip {level} padding", mip["start"], mip["offset"]))
+        pos = mip["offset"] + len(mip["data"])
+        regions.append((f"mip {level}", mip["offset"], pos))
+    end = pos + len(ctxr["final_padding"])
+    regions.append(("final padding", pos, end))
+    if file_size > end:
+        regions.append(("trailing data", end, file_size))
+    return regions
+
+
+def locate_region(regions, offset):
+    """Return the name of the region containing offset"""
+    for name, start, end in regions:
+        if start <= offset < end:
+            return name
+    return "past end of original"
+
+
+def first_difference(a, b, chunk_size=65536):
+    """Return the first offset at which a and b differ, or None if they are equal"""
+    a, b = memoryview(a), memoryview(b)
+    common = min(len(a), len(b))
+    for pos in range(0, common, chunk_size):
+        end = min(pos + chunk_size, common)
+        if a[pos:end] != b[pos:end]:
+            for i in range(pos, end):
+                if a[i] != b[i]:
+                    return i
+    if len(a) != len(b):
+        return common
+    return None
+
+
+def roundtrip(data, file_name, mode):
+    """Round-trip CTXR bytes through DDS in memory and return the resulting CTXR bytes"""
+    with io.BytesIO(data) as f:
+        ctxr = read_ctxr(f, file_name)
+    dds_data = ctxr_to_dds_bytes(ctxr)
+    if mode == "gui":
+        with io.BytesIO(dds_data) as f:
+            _, ctxr_data = image_to_ctxr(f, ctxr["header"], ctxr["mipmap_info"], ctxr["final_padding"])
+        return ctxr_data
+    if mode == "batch":
+        return dds_to_ctxr_bytes(dds_data, ctxr["header"], original_ctxr_data=data)
+    raise ValueError(f"Unknown verify mode: {mode}")
+
+
+def verify_file(file_path, modes=VERIFY_MODES, thresholds=None):
+    """
+    Verify that a CTXR file survives the CTXR -> DDS -> CTXR round trip unchanged.
+
+    Nothing is written to disk. Returns a dict with "path", "hash" and a "modes"
+    dict holding, per mode, "ok", "hash", "offset" and "region" (or "error").
+    Non-PC files get an "error" with "unsupported" set instead of any modes.
+    With thresholds (see metrics_module), round trips that aren't byte-identical
+    also get "metrics", "failures" and "quality_ok".
+    """
+    result = {"path": file_path, "hash": None, "modes": {}}
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        platform = parse_header_info(data[:max(CTXR_HEADER_SIZE, PS3_HEADER_SIZE)])["platform"]
+        if platform != "pc":
+            # The DDS round trip only exists for PC files; don't report it as a DDS problem
+            result["error"] = f"{platform.upper()} CTXR: not supported, transcode it to PC first"
+            result["unsupported"] = True
+            return result
+        with io.BytesIO(data) as f:
+            regions = ctxr_regions(read_ctxr(f, os.path.basename(file_path)), len(data))
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["hash"] = hashlib.sha1(data).hexdigest()
+
+    for mode in modes:
+        try:
+            output = roundtrip(data, os.path.basename(file_path), mode)
+        except Exception as e:
+            result["modes"][mode] = {"ok": False, "error": str(e)}
+            continue
+        output_hash = hashlib.sha1(output).hexdigest()
+        entry = {"ok": output_hash == result["hash"], "hash": output_hash}
+        if not entry["ok"]:
+            offset = first_difference(data, output)
+            entry["offset"] = offset
+            entry["region"] = locate_region(regions, offset)
+            if thresholds is not None:
+                _add_quality(entry, data, output, os.path.basename(file_path), thresholds)
+        result["modes"][mode] = entry
+    return result
+
+
+def _add_quality(entry, original, output, file_name, thresholds):
+    from metrics_module import compare_ctxr_data, threshold_failures
+    try:
+        entry["metrics"] = compare_ctxr_data(original, output, file_name)
+    except Exception as e:
+        entry["quality_ok"] = False
+        entry["failures"] = [f"metrics failed ({e})"]
+        return
+    entry["failures"] = threshold_failures(entry["metrics"], thresholds)
+    entry["quality_ok"] = not entry["failures"]
+
+
+def verify_files(paths, modes=VERIFY_MODES, workers=None, thresholds=None, include=None, exclude=None):
+    """Verify files across a process pool, yielding verify_file results in input order"""
+    files = list(iter_ctxr_files(paths, include, exclude))
+    logging.info(f"Verifying {len(files)} CTXR files ({', '.join(modes)})")
+    if workers == 1:
+        for file_path in files:
+            yield verify_file(file_path, modes, thresholds)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(files) // ((workers or os.cpu_count() or 1) * 8))
+        yield from executor.map(verify_file, files, [modes] * len(files), [thresholds] * len(files),
+                                chunksize=chunksize)
+
+
+def format_verify_result(result):
+    """Return a one-line description of a failed verify_file result"""
+    if result.get("unsupported"):
+        return f"{result['path']}: {result['error']}"
+    if "error" in result:
+        return f"{result['path']}: unreadable ({result['error']})"
+    problems = []
+    for mode, entry in result["modes"].items():
+        if entry["ok"]:
+            continue
+        if "error" in entry:
+            problems.append(f"{mode}: error ({entry['error']})")
+        else:
+            problem = f"{mode}: differs at {hex(entry['offset'])} in {entry['region']}"
+            if "metrics" in entry:
+                from metrics_module import format_metrics
+                problem += f" ({format_metrics(entry['metrics'])})"
+            if entry.get("failures"):
+                failures = entry["failures"]
+                more = f" (+{len(failures) - 3} more)" if len(failures) > 3 else ""
+                problem += f" below thresholds: {', '.join(failures[:3])}{more}"
+            problems.append(problem)
+    return f"{result['path']}: " + "; ".join(problems)
@@ -0,0 +1,98 @@
+# walker_module.py
+"""
+Streaming source tree walker shared by the batch tools.
+
+walk_files enumerates a folder tree with os.scandir, one directory at a time,
+and yields matching files as soon as they are found, so a batch over a dump
+with hundreds of thousands of entries starts converting immediately instead of
+listing everything first. Each file comes with its path relative to the root,
+which mirror_path uses to recreate the source tree under an output folder.
+
+Extensions and include/exclude globs are matched case-insensitively. Globs are
+matched against both the relative path (with / separators) and the file name;
+an exclude glob that matches a directory prunes the whole subtree.
+"""
+import os
+import fnmatch
+from collections import namedtuple
+
+
+WorkItem = namedtuple("WorkItem", "path relative")
+
+
+def _normalize_extensions(extensions):
+    return tuple(ext.lower() if ext.startswith('.') else '.' + ext.lower() for ext in extensions)
+
+
+def _matches(patterns, relative, name):
+    relative, name = relative.lower(), name.lower()
+    return any(fnmatch.fnmatchcase(relative, pattern) or fnmatch.fnmatchcase(name, pattern)
+               for pattern in patterns)
+
+
+def walk_files(root, extensions, include=None, exclude=None, recursive=True):
+    """
+    Lazily yield a WorkItem for every file under root whose extension is in
+    extensions (e.g. (".ctxr",)), that matches an include glob (if any are given)
+    and no exclude glob. Directories are visited depth first in name order.
+    """
+    extensions = _normalize_extensions(extensions)
+    include = [pattern.lower() for pattern in include or ()]
+    exclude = [pattern.lower() for pattern in exclude or ()]
+    stack = [(root, "")]
+    while stack:
+        folder, prefix = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subfolders = []
+        for entry in entries:
+            relative = prefix + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if recursive and not _matches(exclude, relative, entry.name):
+                    subfolders.append((entry.path, relative + "/"))
+                continue
+            if not entry.name.lower().endswith(extensions):
+                continue
+            if include and not _matches(include, relative, entry.name):
+                continue
+            if exclude and _matches(exclude, relative, entry.name):
+                continue
+            yield WorkItem(entry.path, relative)
+        # Reversed so the stack pops them in name order
+        stack.extend(reversed(subfolders))
+
+
+def walk_paths(paths, extensions, include=None, exclude=None, recursive=True):
+    """
+    walk_files over several paths. Folders are walked; files given directly are
+    yielded as they are, relative to their own folder, and WorkItems are passed through.
+    """
+    for path in paths:
+        if isinstance(path, WorkItem):
+            yield path
+        elif os.path.isdir(path):
+            yield from walk_files(path, extensions, include, exclude, recursive)
+        else:
+            yield WorkItem(path, os.path.basename(path))
+
+
+def mirror_path(item, output_root, extension=None, create=True):
+    """
+    Output path for a WorkItem (or a relative path) under output_root, keeping its
+    relative folders. extension (e.g. ".png") replaces the file's own; with create
+    the output folder is made if needed.
+    """
+    relative = item.relative if isinstance(item, WorkItem) else item
+    if extension is not None:
+        relative = os.path.splitext(relative)[0] + extension
+    output_path = os.path.join(output_root, *relative.split("/"))
+    if create:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    return output_path
@@ -0,0 +1,138 @@
+# watch_module.py
+"""
+Watch an export folder and re-import edited images as soon as they are saved.
+
+The folder is polled (stdlib only, works the same on every platform and on
+network shares). A file is picked up once its size and mtime have stopped
+changing for the debounce time, so half-written saves are never imported.
+Ready files are converted together through the read-ahead pipeline; each one is
+imported against the CTXR of the same name in the template folder
+(incrementally when possible) and written atomically into the target folder.
+"""
+import os
+import io
+import time
+import logging
+from ctxr_utils import read_ctxr, atomic_write, CTXRError
+from pipeline_module import run_pipeline
+
+
+WATCH_EXTENSIONS = ('.png', '.tga', '.dds')
+DEFAULT_POLL_INTERVAL = 0.25
+DEFAULT_DEBOUNCE = 0.5
+
+
+class FolderWatcher:
+    """Polls a folder and reports files whose size/mtime changed and then settled"""
+
+    def __init__(self, folder, extensions=WATCH_EXTENSIONS, debounce=DEFAULT_DEBOUNCE, initial=False):
+        self.folder = folder
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.debounce = debounce
+        self.pending = {}   # path -> (signature, time the signature was first seen)
+        # Unless initial is set, files already in the folder count as converted
+        self.seen = {} if initial else self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError as e:
+            logging.warning(f"Cannot scan {self.folder}: {e}")
+            return snapshot
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(self.extensions):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self, now=None):
+        """Return the files that changed and have been stable for the debounce time"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path, signature in self._snapshot().items():
+            if self.seen.get(path) == signature:
+                self.pending.pop(path, None)
+                continue
+            pending = self.pending.get(path)
+            if pending is None or pending[0] != signature:
+                self.pending[path] = (signature, now)
+            elif now - pending[1] >= self.debounce:
+                ready.append(path)
+                self.seen[path] = signature
+                del self.pending[path]
+        return sorted(ready)
+
+
+def template_path_for(image_path, template_folder):
+    """The original CTXR an exported image belongs to: same base name in template_folder"""
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(template_folder, name + '.ctxr')
+
+
+def reimport_image(image_path, template_path, output_path, incremental=True):
+    """
+    Import one image against its template CTXR and write output_path atomically.
+    Returns "incremental" or "full" depending on how it was imported.
+    """
+    if incremental and not image_path.lower().endswith('.dds'):
+        from incremental_module import incremental_import
+        try:
+            incremental_import(image_path, template_path, output_path, atomic=True)
+            return "incremental"
+        except CTXRError as e:
+            logging.info(f"{os.path.basename(image_path)}: incremental import not possible ({e})")
+
+    from convert_module import image_to_ctxr
+    with open(template_path, 'rb') as f:
+        ctxr = read_ctxr(io.BytesIO(f.read()), os.path.basename(template_path))
+    _, ctxr_data = image_to_ctxr(image_path, ctxr["header"], ctxr["mipmap_info"], ctxr["final_padding"],
+                                 dxt5=ctxr["is_dxt5"])
+    atomic_write(output_path, ctxr_data)
+    return "full"
+
+
+def reimport_batch(image_paths, template_folder, target_folder, incremental=True, on_done=None,
+                   **pipeline_settings):
+    """
+    Re-import several images in parallel through the pipeline. on_done(image_path, error)
+    is called for each (images without a template fail with CTXRError).
+    Returns the run_pipeline result dict.
+    """
+    def read(image_path):
+        template = template_path_for(image_path, template_folder)
+        if not os.path.exists(template):
+            raise CTXRError(f"No template {os.path.basename(template)} in {template_folder}")
+        return template
+
+    def convert(image_path, template):
+        output_path = os.path.join(target_folder, os.path.basename(template))
+        mode = reimport_image(image_path, template, output_path, incremental)
+        logging.info(f"Re-imported {image_path} -> {output_path} ({mode})")
+        return output_path
+
+    return run_pipeline(image_paths, read, convert, lambda image_path, output_path: None,
+                        on_done=on_done, **pipeline_settings)
+
+
+def watch_folder(source_folder, template_folder, target_folder, incremental=True,
+                 interval=DEFAULT_POLL_INTERVAL, debounce=DEFAULT_DEBOUNCE, on_done=None, stop_event=None,
+                 **pipeline_settings):
+    """
+    Re-import images saved into source_folder until stop_event is set (or forever).
+    on_done(image_path, error) is called after each re-import.
+    """
+    os.makedirs(target_folder, exist_ok=True)
+    watcher = FolderWatcher(source_folder, debounce=debounce)
+    logging.info(f"Watching {source_folder} (templates: {template_folder}, output: {target_folder})")
+    while stop_event is None or not stop_event.is_set():
+        ready = watcher.poll()
+        if ready:
+            reimport_batch(ready, template_folder, target_folder, incremental, on_done, **pipeline_settings)
+        if stop_event is not None:
+            stop_event.wait(interval)
+        else:
+            time.sleep(interval)